@@ -0,0 +1,77 @@
+"""add_books_isbn_normalized
+
+Revision ID: b0c1d2e3f4a5
+Revises: a9b0c1d2e3f4
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def normalize_isbn(value):
+    # frozen copy of services.book_index.normalize_isbn as of this revision
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = re.sub(r"\.0+$", "", str(value or "").strip())
+    digits = re.sub(r"[\s-]", "", text).upper()
+    if re.fullmatch(r"\d{13}", digits):
+        return digits
+    if re.fullmatch(r"\d{9}[\dX]", digits):
+        body = "978" + digits[:9]
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body)) % 10) % 10
+        return body + str(check)
+    return None
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b0c1d2e3f4a5'
+down_revision: Union[str, Sequence[str], None] = 'a9b0c1d2e3f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('books', sa.Column('isbn_normalized', sa.String(), nullable=True))
+
+    # normalized ISBNs of the existing listings; when a seller already lists an ISBN
+    # more than once only the oldest listing gets it, the others are left unkeyed
+    bind = op.get_bind()
+    books = sa.table('books', sa.column('id', sa.Integer), sa.column('owner_id', sa.Integer),
+                     sa.column('isbn', sa.String), sa.column('isbn_normalized', sa.String))
+    seen = set()
+    updates = []
+    for book_id, owner_id, isbn in bind.execute(
+        sa.select(books.c.id, books.c.owner_id, books.c.isbn).where(books.c.isbn.isnot(None)).order_by(books.c.id)
+    ):
+        key = (owner_id, normalize_isbn(isbn))
+        if key[1] is not None and key not in seen:
+            seen.add(key)
+            updates.append({'book_id': book_id, 'isbn_normalized': key[1]})
+    if updates:
+        bind.execute(
+            books.update().where(books.c.id == sa.bindparam('book_id')).values(isbn_normalized=sa.bindparam('isbn_normalized')),
+            updates
+        )
+
+    op.create_index(
+        'uq_books_owner_id_isbn_normalized', 'books', ['owner_id', 'isbn_normalized'], unique=True,
+        sqlite_where=sa.text('isbn_normalized IS NOT NULL'), postgresql_where=sa.text('isbn_normalized IS NOT NULL')
+    )
+
+    op.add_column('import_jobs', sa.Column('on_conflict', sa.String(), nullable=True))
+    op.add_column('import_jobs', sa.Column('updated', sa.Integer(), nullable=True))
+    op.add_column('import_jobs', sa.Column('skipped', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('import_jobs', 'skipped')
+    op.drop_column('import_jobs', 'updated')
+    op.drop_column('import_jobs', 'on_conflict')
+    op.drop_index('uq_books_owner_id_isbn_normalized', table_name='books')
+    op.drop_column('books', 'isbn_normalized')
@@ -0,0 +1,77 @@
+"""add_book_full_text_search
+
+Revision ID: b3f1c2d4e5a6
+Revises: a218df3e5484
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# frozen copies of the DDL as of this revision, later changes to services/book_search.py
+# must not change what this migration builds
+FTS_TABLE = "books_fts"
+SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_text, content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+]
+SQLITE_FTS_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+POSTGRES_FTS_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_books_search_tsv ON books USING gin "
+    "(to_tsvector('simple', coalesce(books.search_text, '')))",
+]
+POSTGRES_FTS_DROP = [
+    "DROP INDEX IF EXISTS ix_books_search_tsv",
+]
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f1c2d4e5a6'
+down_revision: Union[str, Sequence[str], None] = 'a218df3e5484'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # FTS5 table over books.search_text, kept in sync by triggers
+        for ddl in SQLITE_FTS_DDL:
+            op.execute(ddl)
+        # index the existing rows
+        op.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        # GIN index over to_tsvector(search_text)
+        for ddl in POSTGRES_FTS_DDL:
+            op.execute(ddl)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for ddl in SQLITE_FTS_DROP:
+            op.execute(ddl)
+    elif dialect == 'postgresql':
+        for ddl in POSTGRES_FTS_DROP:
+            op.execute(ddl)
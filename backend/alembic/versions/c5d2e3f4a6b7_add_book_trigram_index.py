@@ -0,0 +1,86 @@
+"""add_book_trigram_index
+
+Revision ID: c5d2e3f4a6b7
+Revises: b3f1c2d4e5a6
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# frozen copies as of this revision, later changes to services/book_index.py and
+# services/book_search.py must not change what this migration builds
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_author_trgm ON books USING gin (author gin_trgm_ops)",
+]
+POSTGRES_TRGM_DROP = [
+    "DROP INDEX IF EXISTS ix_books_author_trgm",
+    "DROP INDEX IF EXISTS ix_books_title_trgm",
+]
+TRIGRAM_FIELDS = ('title', 'author')
+BACKFILL_BATCH = 1000
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def _trigrams(value):
+    # as pg_trgm: lower-cased words padded with two spaces in front and one behind
+    result = set()
+    for word in _WORD_RE.findall((value or '').lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def _backfill_trigrams(bind):
+    # trigrams of the existing titles and authors, read batch by batch
+    books = sa.table('books', sa.column('id'), sa.column('title'), sa.column('author'))
+    book_trigrams = sa.table('book_trigrams', sa.column('trigram'), sa.column('book_id'), sa.column('field'))
+    result = bind.execute(sa.select(books.c.id, books.c.title, books.c.author))
+    while rows := result.fetchmany(BACKFILL_BATCH):
+        values = [
+            {'trigram': gram, 'book_id': row.id, 'field': field}
+            for row in rows for field in TRIGRAM_FIELDS for gram in _trigrams(getattr(row, field))
+        ]
+        if values:
+            bind.execute(sa.insert(book_trigrams), values)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d2e3f4a6b7'
+down_revision: Union[str, Sequence[str], None] = 'b3f1c2d4e5a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_trigrams',
+        sa.Column('trigram', sa.String(), nullable=False),
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('trigram', 'book_id', 'field'),
+    )
+    op.create_index(op.f('ix_book_trigrams_book_id'), 'book_trigrams', ['book_id'], unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        _backfill_trigrams(bind)
+    elif bind.dialect.name == 'postgresql':
+        for ddl in POSTGRES_TRGM_DDL:
+            op.execute(ddl)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        for ddl in POSTGRES_TRGM_DROP:
+            op.execute(ddl)
+    op.drop_index(op.f('ix_book_trigrams_book_id'), table_name='book_trigrams')
+    op.drop_table('book_trigrams')
@@ -0,0 +1,65 @@
+"""add_book_tags_table
+
+Revision ID: d6e7f8a9b0c1
+Revises: c5d2e3f4a6b7
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# frozen copy of the tag rules as of this revision, later changes to
+# services/book_index.py must not change what this migration builds
+BACKFILL_BATCH = 1000
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _parse_tags(value):
+    # trimmed, lower-cased, de-duplicated, inner whitespace collapsed
+    tags = []
+    for raw in str(value or '').split(','):
+        tag = _SPACE_RE.sub(' ', raw).strip().lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _backfill_tags(bind):
+    # split the existing comma-separated Book.tags strings into rows, batch by batch
+    books = sa.table('books', sa.column('id'), sa.column('tags'))
+    book_tags = sa.table('book_tags', sa.column('book_id'), sa.column('tag'))
+    result = bind.execute(sa.select(books.c.id, books.c.tags).where(books.c.tags.isnot(None)))
+    while rows := result.fetchmany(BACKFILL_BATCH):
+        values = [{'book_id': row.id, 'tag': tag} for row in rows for tag in _parse_tags(row.tags)]
+        if values:
+            bind.execute(sa.insert(book_tags), values)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd6e7f8a9b0c1'
+down_revision: Union[str, Sequence[str], None] = 'c5d2e3f4a6b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'book_tags',
+        sa.Column('book_id', sa.Integer(), nullable=False),
+        sa.Column('tag', sa.String(), nullable=False),
+        sa.ForeignKeyConstraint(['book_id'], ['books.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('book_id', 'tag'),
+    )
+    op.create_index('ix_book_tags_tag_book_id', 'book_tags', ['tag', 'book_id'], unique=False)
+
+    _backfill_tags(op.get_bind())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_book_tags_tag_book_id', table_name='book_tags')
+    op.drop_table('book_tags')
@@ -0,0 +1,73 @@
+"""add_user_geohash
+
+Revision ID: e7f8a9b0c1d2
+Revises: d6e7f8a9b0c1
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(latitude, longitude, precision=8):
+    # frozen copy of services.geo.encode_geohash as of this revision
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # longitude bits first
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7f8a9b0c1d2'
+down_revision: Union[str, Sequence[str], None] = 'd6e7f8a9b0c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('geohash', sa.String(), nullable=True))
+    op.create_index(op.f('ix_users_geohash'), 'users', ['geohash'], unique=False)
+    # nearby search joins sellers to their listings
+    op.create_index(op.f('ix_books_owner_id'), 'books', ['owner_id'], unique=False)
+
+    # geohash for users who already set their coordinates
+    bind = op.get_bind()
+    users = sa.table('users', sa.column('id'), sa.column('latitude'), sa.column('longitude'), sa.column('geohash'))
+    located = bind.execute(
+        sa.select(users.c.id, users.c.latitude, users.c.longitude)
+        .where(users.c.latitude.isnot(None), users.c.longitude.isnot(None))
+    ).all()
+    for user_id, latitude, longitude in located:
+        bind.execute(
+            users.update().where(users.c.id == user_id).values(geohash=encode_geohash(latitude, longitude))
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_books_owner_id'), table_name='books')
+    op.drop_index(op.f('ix_users_geohash'), table_name='users')
+    op.drop_column('users', 'geohash')
@@ -0,0 +1,97 @@
+"""
+Benchmark for POST /api/books/import-excel
+
+Builds a spreadsheet of synthetic listings, imports it into a throwaway SQLite
+database through the endpoint function and reports rows per second, when the
+deferred trigram fill caught up, the longest event loop stall during the import and
+the peak memory of the process.
+
+    python benchmark_import_excel.py [rows] [existing listings]
+"""
+import asyncio
+import os
+import resource
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+import openpyxl
+from fastapi import UploadFile
+
+from database import AsyncSessionLocal, Base, engine
+from models import Book, User
+from routers.books import import_books_from_excel
+from services.book_index import trigram_filler
+from services.book_search import build_search_text, ensure_search_index
+
+HEADER = ["title", "author", "price", "stock", "is_for_sale", "is_for_rent", "weekly_fee", "condition", "tags", "isbn"]
+WORDS = ["river", "night", "garden", "letters", "empire", "silent", "glass", "monsoon", "city", "songs",
+         "winter", "tiger", "paper", "house", "secret", "ocean", "golden", "broken", "island", "train"]
+
+
+def build_workbook(rows):
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(HEADER)
+    for i in range(rows):
+        title = f"{WORDS[i % 20].title()} {WORDS[(i * 7) % 20]} {WORDS[(i * 13) % 20]} vol {i}"
+        ws.append([title, f"Author {i % 500}", 150 + i % 700, 1 + i % 4, True, i % 3 == 0,
+                   40 if i % 3 == 0 else None, "good", "fiction, classic", f"978{i:010d}"])
+    content = BytesIO()
+    wb.save(content)
+    return content.getvalue()
+
+
+async def watch_loop(stalls):
+    # how late a 10ms sleep wakes up is how long the event loop was blocked
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        stalls.append(time.perf_counter() - started - 0.01)
+
+
+async def main(rows, existing):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_search_index)
+
+    async with AsyncSessionLocal() as db:
+        user = User(email="bench@example.com", username="bench", hashed_password="x",
+                    first_name="Bench", last_name="Mark", city="Delhi")
+        db.add(user)
+        await db.flush()
+        # listings to match spreadsheet titles against, none of them similar enough to match
+        for i in range(existing):
+            title = f"Catalogue entry {i}"
+            db.add(Book(title=title, author="Someone", price=100, owner_id=user.id,
+                        search_text=build_search_text(title, "Someone")))
+        await db.commit()
+
+        content = build_workbook(rows)
+        upload = UploadFile(file=BytesIO(content), filename="inventory.xlsx")
+        stalls = []
+        watcher = asyncio.create_task(watch_loop(stalls))
+        started = time.perf_counter()
+        result = await import_books_from_excel(file=upload, current_user=user, db=db)
+        elapsed = time.perf_counter() - started
+        await trigram_filler.wait()
+        indexed = time.perf_counter() - started
+        watcher.cancel()
+
+    print(f"rows: {rows}, existing listings: {existing}")
+    print(f"created: {result['created']}, matches: {len(result['matches'])}, errors: {len(result['errors'])}")
+    print(f"elapsed: {elapsed:.2f}s, {rows / elapsed:,.0f} rows/sec")
+    print(f"trigrams written after: {indexed:.2f}s")
+    print(f"longest event loop stall: {max(stalls, default=0) * 1000:.0f}ms")
+    print(f"peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    existing = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    asyncio.run(main(rows, existing))
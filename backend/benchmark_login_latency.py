@@ -0,0 +1,102 @@
+"""
+Benchmark for password hashing under a login burst
+
+Serves the auth and books routers in process against a throwaway SQLite database and
+measures the latency of an unrelated request (a catalog search) on its own, then while
+clients keep logging in concurrently. It reports p50/p99/max of the searches, the logins
+completed and turned away, and the state of the password hashing pool.
+
+    python benchmark_login_latency.py [concurrent logins] [seconds]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+db_path = os.path.join(tempfile.mkdtemp(), "benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+
+import httpx
+from fastapi import FastAPI
+
+from database import AsyncSessionLocal, Base, engine
+from models import Book
+from routers.auth import router as auth_router
+from routers.books import router as books_router
+from services.book_search import build_search_text, ensure_search_index
+
+PROBE_INTERVAL = 0.05  # seconds between searches
+USER = {"email": "bench@example.com", "username": "bench", "password": "correct horse battery staple",
+        "first_name": "Bench", "last_name": "Mark", "city": "Delhi"}
+
+app = FastAPI()
+app.include_router(auth_router, prefix="/api/auth")
+app.include_router(books_router, prefix="/api/books")
+
+
+async def probe(client, until):
+    # searches on a fixed schedule, each timed from when it was due, so time spent waiting
+    # for a blocked event loop counts too
+    latencies = []
+    due = time.perf_counter()
+    while due < until:
+        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+        response = await client.get("/api/books/", params={"q": "river"})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - due)
+        due += PROBE_INTERVAL
+    return latencies
+
+
+async def login_loop(client, until, counts):
+    form = {"username": USER["email"], "password": USER["password"]}
+    while time.perf_counter() < until:
+        response = await client.post("/api/auth/token", data=form)
+        counts[response.status_code] = counts.get(response.status_code, 0) + 1
+        if response.status_code == 503:
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name}: {len(latencies)} searches, p50 {statistics.median(latencies) * 1000:.0f}ms, "
+          f"p99 {p99 * 1000:.0f}ms, max {latencies[-1] * 1000:.0f}ms")
+
+
+async def main(logins, seconds):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_search_index)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        (await client.post("/api/auth/register", json=USER)).raise_for_status()
+        async with AsyncSessionLocal() as db:
+            for i in range(200):
+                title = f"River book {i}" if i % 4 == 0 else f"Other book {i}"
+                db.add(Book(title=title, author="Someone", price=100, owner_id=1,
+                            search_text=build_search_text(title, "Someone")))
+            await db.commit()
+
+        report("idle", await probe(client, time.perf_counter() + seconds))
+
+        counts = {}
+        until = time.perf_counter() + seconds
+        results = await asyncio.gather(
+            probe(client, until), *(login_loop(client, until, counts) for _ in range(logins))
+        )
+        report(f"{logins} concurrent logins", results[0])
+        print(f"login responses by status: {dict(sorted(counts.items()))}")
+        stats = await client.get("/api/auth/password-hashing/stats")
+        if stats.status_code == 200:
+            print(f"password hashing pool: {stats.json()}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    asyncio.run(main(logins, seconds))
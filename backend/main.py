@@ -9,6 +9,12 @@ from routers.charity import router as charity_router
 from routers.books import router as books_router
 from routers.payments import router as payments_router
 from database import engine, Base
+from services.book_search import ensure_search_index
+from services.book_index import trigram_filler
+from services.import_jobs import import_job_runner
+from services import xlsx_reader
+from services.password_hashing import password_hasher
+from services.phonepe_service import phonepe_gateway
 
 load_dotenv()
 
@@ -69,12 +75,35 @@ async def create_db_tables_if_missing():
     try:
         async with engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(ensure_search_index)
         print("Database tables created/verified successfully")
     except Exception as e:
         # Log error but don't crash startup so that the app can still surface errors
         print(f"Warning: failed to auto-create tables on startup: {e}")
 
 
+# background import jobs, also resumes the ones an earlier process left unfinished
+@app.on_event("startup")
+async def start_import_jobs():
+    import_job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_import_jobs():
+    await import_job_runner.stop()
+    xlsx_reader.shutdown()
+
+@app.on_event("shutdown")
+async def finish_trigram_fill():
+    await trigram_filler.wait()
+
+@app.on_event("shutdown")
+async def stop_password_hashing():
+    password_hasher.shutdown()
+
+@app.on_event("shutdown")
+async def stop_phonepe_gateway():
+    phonepe_gateway.shutdown()
+
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
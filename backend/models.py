@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, Boolean, ForeignKey, Enum, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -48,6 +48,7 @@ class User(Base):
     zip_code = Column(String)
     latitude = Column(Float)
     longitude = Column(Float)
+    geohash = Column(String, index=True)  # derived from latitude/longitude, for nearby search
     is_active = Column(Boolean, default=True)
     is_verified = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -65,6 +66,7 @@ class Book(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     isbn = Column(String, index=True)
+    isbn_normalized = Column(String)  # ISBN-13 form of isbn, see services.book_index.normalize_isbn
     title = Column(String, nullable=False, index=True)
     author = Column(String, index=True)  # author field
     # combine search text including title, author, genre for easier searching
@@ -75,7 +77,7 @@ class Book(Base):
     stock = Column(Integer, default=1)
     status = Column(Enum(BookStatus), default=BookStatus.IN_STOCK)
     expected_date = Column(DateTime(timezone=True))
-    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     is_for_sale = Column(Boolean, default=True)
     is_for_rent = Column(Boolean, default=False)
     weekly_fee = Column(Float)
@@ -87,6 +89,33 @@ class Book(Base):
     owner = relationship("User", back_populates="books")
     auctions = relationship("Auction", back_populates="book")
     reservations = relationship("Reservation", back_populates="book")
+    
+    __table_args__ = (
+        # a seller lists each ISBN once, imports upsert on it
+        Index(
+            "uq_books_owner_id_isbn_normalized", "owner_id", "isbn_normalized", unique=True,
+            sqlite_where=isbn_normalized.isnot(None), postgresql_where=isbn_normalized.isnot(None),
+        ),
+    )
+
+class BookTag(Base):
+    __tablename__ = "book_tags"
+    
+    # normalized (lower-case, trimmed) tags of Book.tags, one row per tag
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True)
+    tag = Column(String, primary_key=True)
+    
+    __table_args__ = (
+        Index("ix_book_tags_tag_book_id", "tag", "book_id"),
+    )
+
+class BookTrigram(Base):
+    __tablename__ = "book_trigrams"
+    
+    # trigram side table for fuzzy title/author search on SQLite (PostgreSQL uses pg_trgm instead)
+    trigram = Column(String, primary_key=True)
+    book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), primary_key=True, index=True)
+    field = Column(String, primary_key=True)  # "title" or "author"
 
 class Auction(Base):
     __tablename__ = "auctions"
@@ -143,6 +172,11 @@ class Reservation(Base):
     user = relationship("User", back_populates="reservations")
     payments = relationship("Payment", back_populates="reservation")
 
+    __table_args__ = (
+        # latest reservation per book
+        Index("ix_reservations_book_id_created_at", "book_id", "created_at"),
+    )
+
 class Payment(Base):
     __tablename__ = "payments"
     
@@ -220,3 +254,51 @@ class Donation(Base):
     pickup_date = Column(DateTime(timezone=True))
     status = Column(String, default="pending")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # "books" (/import) or "excel" (/import-excel)
+    filename = Column(String)
+    file_path = Column(String)  # the saved upload, removed once the job is finished
+    batch_size = Column(Integer, nullable=False)
+    on_conflict = Column(String)  # merge_stock, replace or skip for rows whose ISBN is already listed
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed, cancelled
+    cancel_requested = Column(Boolean, default=False)
+    rows_processed = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)  # listings merged into or replaced through their ISBN
+    skipped = Column(Integer, default=0)
+    matched = Column(Integer, default=0)
+    error_count = Column(Integer, default=0)
+    errors = Column(Text)  # json list, the first MAX_REPORTED_ERRORS
+    matches = Column(Text)  # json list of the suggested matches of an excel import
+    checkpoint = Column(Integer, default=0)  # last row number covered by a committed chunk
+    listing_id_limit = Column(Integer)  # excel imports only match listings up to this id, not their own rows
+    message = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    heartbeat_at = Column(DateTime(timezone=True))  # refreshed by the worker after every chunk
+    finished_at = Column(DateTime(timezone=True))
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token_hash = Column(String, unique=True, nullable=False)  # sha256 of the token, the token itself is not stored
+    family = Column(String, nullable=False, index=True)  # shared by a login's token and all its rotations
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True))  # set once rotated or logged out; presenting it again revokes the family
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class WebhookEvent(Base):
+    __tablename__ = "webhook_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event_id = Column(String, unique=True, nullable=False)  # deliveries of an event share it, see parse_webhook
+    event = Column(String)  # e.g. checkout.order.completed
+    merchant_order_id = Column(String, index=True)
+    state = Column(String)
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
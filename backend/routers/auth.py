@@ -2,7 +2,6 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
 import os
@@ -10,7 +9,11 @@ from dotenv import load_dotenv
 
 from database import get_db
 from models import User
+from services.password_hashing import password_hasher
+from services.principal_cache import principal_cache
+from services.refresh_tokens import issue_refresh_token, revoke_refresh_token, revoke_user_tokens, rotate_refresh_token
 from pydantic import BaseModel, EmailStr
+from typing import Optional
 
 load_dotenv()
 
@@ -27,7 +30,6 @@ except (ValueError, TypeError):
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
     print("Warning: Invalid ACCESS_TOKEN_EXPIRE_MINUTES, using default 30")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
 router = APIRouter()
@@ -58,25 +60,49 @@ class UserResponse(BaseModel):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # seconds until access_token expires
 
-def verify_password(plain_password, hashed_password):
-    # Bcrypt has a 72-byte limit, truncate if needed
-    return pwd_context.verify(plain_password[:72], hashed_password)
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
-def get_password_hash(password):
-    # Bcrypt has a 72-byte limit, truncate if needed
-    return pwd_context.hash(password[:72])
+# bcrypt runs on the password hashing pool, off the event loop; both raise 503 when it is saturated
+async def verify_password(plain_password, hashed_password):
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await password_hasher.hash(password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
+    issued_at = datetime.now(timezone.utc)
     if expires_delta:
-        expire = datetime.now(timezone.utc) + expires_delta
+        expire = issued_at + expires_delta
     else:
-        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+        expire = issued_at + timedelta(minutes=15)
+    to_encode.update({"exp": expire, "iat": issued_at})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def access_token_claims(user):
+    # the user id resolves the principal by primary key, see get_token_user; sub stays the
+    # email so tokens keep their meaning for clients that read it
+    return {"sub": user.email, "uid": user.id, "username": user.username}
+
+async def issue_tokens(db: AsyncSession, user: User, refresh_token: str = None):
+    """Access token for a user, with a new refresh token family unless one is given"""
+    if refresh_token is None:
+        refresh_token = await issue_refresh_token(db, user.id)
+    access_token = create_access_token(
+        data=access_token_claims(user), expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "token_type": "bearer",
+        "refresh_token": refresh_token,
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
 async def get_user(db: AsyncSession, email: str):
     result = await db.execute(select(User).filter(User.email == email))
     return result.scalar_one_or_none()
@@ -85,24 +111,31 @@ async def authenticate_user(db: AsyncSession, email: str, password: str):
     user = await get_user(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # end the read first, so the connection goes back to the pool while bcrypt runs
+    await db.commit()
+    if not await verify_password(password, user.hashed_password):
         return False
     return user
 
+async def get_token_user(db: AsyncSession, token: str):
+    """User a bearer token belongs to, None if the token is invalid or the user unknown"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    user_id, email = payload.get("uid"), payload.get("sub")
+    if user_id is None and not email:
+        return None
+    # served from the principal cache, without a users query, for tokens seen recently
+    return await principal_cache.load(db, user_id=user_id, email=email, issued_at=payload.get("iat"))
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = await get_user(db, email=email)
+    user = await get_token_user(db, token)
     if user is None:
         raise credentials_exception
     return user
@@ -121,8 +154,9 @@ async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
                 detail="email or username already registered"
             )
         
-        # create user
-        hashed_password = get_password_hash(user.password)
+        # create user; the connection goes back to the pool while bcrypt runs
+        await db.commit()
+        hashed_password = await get_password_hash(user.password)
         db_user = User(
             email=user.email,
             username=user.username,
@@ -162,11 +196,7 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
                 detail="incorrect email or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.email}, expires_delta=access_token_expires
-        )
-        return {"access_token": access_token, "token_type": "bearer"}
+        return await issue_tokens(db, user)
     except HTTPException:
         raise
     except Exception as e:
@@ -178,6 +208,39 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
             detail=f"Login failed: {str(e)}"
         )
 
+@router.post("/refresh", response_model=Token)
+async def refresh(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """New access token for a refresh token, which is rotated: use the returned one next time"""
+    # refuses tokens of inactive users before rotating them
+    user_id, refresh_token = await rotate_refresh_token(db, body.refresh_token)
+    user = await db.get(User, user_id)
+    if user is None or not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid or expired refresh token")
+    return await issue_tokens(db, user, refresh_token)
+
+@router.post("/logout")
+async def logout(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Revoke a refresh token and every token rotated from the same login"""
+    await revoke_refresh_token(db, body.refresh_token)
+    return {"message": "logged out"}
+
+@router.post("/logout-all")
+async def logout_all(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Revoke every refresh token of the signed-in user, signing out all their logins"""
+    await revoke_user_tokens(db, current_user.id)
+    await db.commit()
+    return {"message": "logged out everywhere"}
+
+@router.get("/password-hashing/stats")
+async def get_password_hashing_stats(current_user: User = Depends(get_current_user)):
+    """Queue depth and wait times of the password hashing pool, for signed-in users"""
+    return password_hasher.stats()
+
+@router.get("/principal-cache/stats")
+async def get_principal_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters and size of the principal cache, for signed-in users"""
+    return principal_cache.stats()
+
 @router.get("/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
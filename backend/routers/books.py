@@ -1,19 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Header
+from fastapi import APIRouter, Depends, HTTPException, File, UploadFile, Header, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import and_, or_, select
-from typing import List, Optional
-import csv
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+from typing import Any, Dict, List, Literal, Optional, Union
+from contextlib import AsyncExitStack
 import json
 from datetime import datetime
-from io import StringIO
-import openpyxl
-from io import BytesIO
 
 from database import get_db
-from models import Book, User, BookStatus, Transaction, Reservation
-from routers.auth import get_current_user, SECRET_KEY, ALGORITHM
-from jose import jwt
-from pydantic import BaseModel, ConfigDict
+from models import Book, BookTag, ImportJob, User, BookStatus, Transaction, Reservation
+from routers.auth import get_current_user, get_token_user
+from services.book_bulk import BULK_FIELDS, MAX_BULK_IDS, delete_books, selection_filter, update_books
+from services.book_export import EXPORT_FORMATS, export_books
+from services.book_import import (
+    DEFAULT_BATCH_SIZE, EXCEL_BATCH_SIZE, MAX_BATCH_SIZE, MAX_RESOLUTIONS, ON_CONFLICT_MODES, BookImportError,
+    apply_match_resolutions, books_imported, import_book_rows, import_excel_rows, read_csv_rows, read_excel_sheet,
+    read_xlsx_rows, save_book_items
+)
+from services.book_index import index_books, normalize_isbn, parse_tags, unindex_books
+from services.book_search import (
+    DEFAULT_MIN_SIMILARITY, FACETS, apply_fuzzy_search, apply_text_search, build_search_text,
+    dialect_name, facet_cache, facet_counts, tag_filter
+)
+from services.cache import make_key
+from services.geo import MAX_RADIUS_KM, distance_km, max_squared_distance, near_filter, squared_distance
+from services.import_jobs import FINISHED, cancel_import, enqueue_import, job_status
+from services.pagination import CursorPage, apply_keyset, page_size, split_page
+from services.search_cache import book_snapshot, search_cache, search_key
+from services.suggest import MAX_SUGGESTIONS, suggest_index
+from services.xlsx_reader import upload_on_disk
+from pydantic import BaseModel, ConfigDict, ValidationError
 
 router = APIRouter()
 
@@ -28,15 +46,7 @@ async def get_optional_current_user(authorization: Optional[str] = Header(None),
     scheme, token = parts
     if scheme.lower() != 'bearer':
         return None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get('sub')
-        if not email:
-            return None
-    except Exception:
-        return None
-    result = await db.execute(select(User).where(User.email == email))
-    return result.scalar_one_or_none()
+    return await get_token_user(db, token)
 
 @router.post("/reserve/{book_id}")
 async def reserve_book(
@@ -52,6 +62,7 @@ async def reserve_book(
         raise HTTPException(status_code=400, detail="book already reserved")
     book.status = BookStatus.RESERVED
     await db.commit()
+    await search_cache.invalidate_book_ids([book.id])
     await db.refresh(book)
     return {"message": "book reserved"}
 
@@ -90,6 +101,7 @@ class BookResponse(BaseModel):
     rental_duration: Optional[int] = None
     condition: Optional[str] = None
     owner_id: int
+    distance_km: Optional[float] = None  # only set by nearby search
 
 class BookUpdate(BaseModel):
     model_config = ConfigDict(from_attributes=True)
@@ -109,64 +121,263 @@ class BookUpdate(BaseModel):
     rental_duration: Optional[int] = None
     condition: Optional[str] = None
 
-@router.post("/", response_model=BookResponse)
-async def create_book(
-    book: BookCreate,
-    current_user: User = Depends(get_current_user),
-    db: AsyncSession = Depends(get_db)
-):
-    
-    # create search text by combining title, author, and tags
-    search_text = f"{book.title} {book.author or ''} {book.tags or ''} {book.description or ''}".strip()
-    
+class BookSearchPage(CursorPage[BookResponse]):
+    facets: Optional[Dict[str, Dict[str, int]]] = None  # {facet: {value: count}}
+
+def _book_values(book, owner_id):
+    # Book column values for a BookCreate
     # Use model_dump() for Pydantic v2 or dict() for v1
     try:
         book_data = book.model_dump()  # Pydantic v2
     except AttributeError:
         book_data = book.dict()  # Pydantic v1
-        
-    book_data['search_text'] = search_text
-    book_data['owner_id'] = current_user.id
     
-    db_book = Book(**book_data)
+    # create search text by combining title, author, and tags
+    book_data['search_text'] = build_search_text(book.title, book.author, book.tags, book.description)
+    book_data['isbn_normalized'] = normalize_isbn(book.isbn)
+    book_data['owner_id'] = owner_id
+    return book_data
+
+@router.post("/", response_model=BookResponse)
+async def create_book(
+    book: BookCreate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    db_book = Book(**_book_values(book, current_user.id))
     db.add(db_book)
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"you already list a book with ISBN {book.isbn}")
+    await index_books(db, [db_book])
     await db.commit()
+    await search_cache.invalidate_books([book_snapshot(db_book)])
+    suggest_index.update(added=[book_snapshot(db_book)])
     await db.refresh(db_book)
     return db_book
 
-@router.get("/", response_model=List[BookResponse])
+async def _bulk_items(request):
+    # (index, raw item) of a JSON array body, or of an NDJSON body line by line as it arrives
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        index, pending = 0, b""
+        async for chunk in request.stream():
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield index, line
+                    index += 1
+        if pending.strip():
+            yield index, pending
+        return
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        items = None
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="body must be a JSON array of books, or NDJSON with one book per line")
+    for index, item in enumerate(items):
+        yield index, item
+
+async def _bulk_books(request, owner_id):
+    # (index, Book column values or an error message) of the items of a bulk request
+    async for index, item in _bulk_items(request):
+        try:
+            if isinstance(item, bytes):
+                item = json.loads(item)
+            yield index, _book_values(BookCreate.model_validate(item), owner_id)
+        except ValidationError as e:
+            yield index, "; ".join(f"{'.'.join(map(str, err['loc'])) or 'book'}: {err['msg']}" for err in e.errors())
+        except ValueError:
+            yield index, "invalid JSON"
+
+@router.post("/bulk")
+async def bulk_create_books(
+    request: Request,
+    batch_size: int = DEFAULT_BATCH_SIZE,  # books per INSERT and per transaction
+    on_conflict: Optional[str] = None,  # merge_stock, replace or skip books whose ISBN you already list
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create many books in one request: a JSON array of books, or NDJSON (Content-Type
+    application/x-ndjson) with one book per line, each as for POST /books/. NDJSON is read
+    and saved batch by batch while it is being uploaded, use it for large catalogs.
+    The response is NDJSON too: a line per book in input order, {"index", "status", "id"}
+    or {"index", "status": "error", "error"}, then a {"summary"} line. A batch is committed
+    as a whole; without on_conflict, books whose ISBN you already list are errors.
+    """
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+    _check_on_conflict(on_conflict)
+    
+    # uvicorn speaks ASGI 2.3, where a streaming response takes over the request's receive
+    # channel, so the body is consumed here and the response starts once it is saved
+    lines = []
+    summary = {"created": 0, "updated": 0, "skipped": 0, "error": 0}
+    async for result in save_book_items(db, _bulk_books(request, current_user.id), batch_size, on_conflict):
+        summary[result['status']] += 1
+        lines.append(json.dumps(result))
+    summary = {"created": summary["created"], "updated": summary["updated"], "skipped": summary["skipped"],
+               "error_count": summary["error"]}
+    lines.append(json.dumps({"summary": summary}))
+    
+    def body():
+        for start in range(0, len(lines), 1000):
+            yield "\n".join(lines[start:start + 1000]) + "\n"
+    
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+class BookSelection(BaseModel):
+    ids: Optional[List[int]] = None  # these books
+    status: Optional[BookStatus] = None
+    is_for_sale: Optional[bool] = None
+    is_for_rent: Optional[bool] = None
+    tags: Optional[str] = None  # comma-separated, books carrying all of them
+    all: bool = False  # every book you list; required when nothing else narrows the selection
+
+class BookBulkChanges(BaseModel):
+    price: Optional[float] = None
+    price_multiplier: Optional[float] = None  # instead of price, e.g. 0.9 for 10% off
+    stock: Optional[int] = None
+    status: Optional[BookStatus] = None
+    is_for_sale: Optional[bool] = None
+    is_for_rent: Optional[bool] = None
+    weekly_fee: Optional[float] = None
+    rental_duration: Optional[int] = None
+    condition: Optional[str] = None
+
+class BookBulkUpdate(BaseModel):
+    filter: BookSelection
+    changes: BookBulkChanges
+
+def _selection_condition(selection, user):
+    criteria = selection.model_dump(exclude={'all'})
+    if not selection.all and all(value is None for value in criteria.values()):
+        raise HTTPException(status_code=400, detail="select books by ids or filters, or pass all=true")
+    if selection.ids is not None and len(selection.ids) > MAX_BULK_IDS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_BULK_IDS} ids per request, select by filter instead")
+    return selection_filter(user.id, **criteria)
+
+@router.patch("/bulk")
+async def bulk_update_books(
+    body: BookBulkUpdate,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Change price, stock, status or availability of many of your books at once, selected by ids
+       and/or filters. price_multiplier scales the current prices. Runs as a single UPDATE.
+    """
+    condition = _selection_condition(body.filter, current_user)
+    changes = body.changes.model_dump(exclude_none=True)
+    multiplier = changes.pop('price_multiplier', None)
+    if multiplier is not None and 'price' in changes:
+        raise HTTPException(status_code=400, detail="set either price or price_multiplier")
+    if multiplier is not None and multiplier <= 0:
+        raise HTTPException(status_code=400, detail="price_multiplier must be positive")
+    if not changes and multiplier is None:
+        raise HTTPException(status_code=400, detail=f"nothing to change, set one of {', '.join(BULK_FIELDS)}")
+    
+    before, after = await update_books(db, condition, changes, multiplier)
+    await db.commit()
+    await search_cache.invalidate_books(before + after)
+    return {"updated": len(after)}
+
+@router.delete("/bulk")
+async def bulk_delete_books(
+    selection: BookSelection,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Delete many of your books at once, selected by ids and/or filters, with a single DELETE.
+       Books with reservations, auctions or sales are kept and counted in "kept".
+    """
+    condition = _selection_condition(selection, current_user)
+    deleted, kept = await delete_books(db, condition)
+    await db.commit()
+    await search_cache.invalidate_books(deleted)
+    suggest_index.update(removed=deleted)
+    return {"deleted": len(deleted), "kept": kept}
+
+@router.get("/", response_model=Union[List[BookResponse], BookSearchPage])
 async def search_books(
     q: str = None,
     author: str = None,
-    tags: str = None,  # Search within comma-separated tags
+    tags: str = None,  # comma-separated tags, e.g. "fiction, romance"
+    tag_mode: str = "all",  # "all": book has every tag, "any": book has at least one
     min_price: float = None,
     max_price: float = None,
     city: str = None,
     for_sale: bool = None,
     for_rent: bool = None,
+    near_lat: float = None,  # nearby search: listings of sellers within radius_km, nearest first
+    near_lng: float = None,
+    radius_km: float = 10.0,
     skip: int = 0,
     limit: int = 100,
+    fuzzy: bool = False,  # typo-tolerant title/author matching instead of full-text search
+    min_similarity: float = DEFAULT_MIN_SIMILARITY,
+    cursor: Optional[str] = None,  # keyset pagination, pass an empty cursor for the first page
+    facets: str = None,  # comma-separated facets to count, any of tags, price_bucket, city, for_rent
     db: AsyncSession = Depends(get_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
+    """
+    Search listings. With cursor or facets set, returns {items, next_cursor, facets}
+    instead of a plain list; cursor switches skip/limit to keyset pagination.
+    """
+    facet_names = [name.strip() for name in (facets or '').split(',') if name.strip()]
+    unknown = [name for name in facet_names if name not in FACETS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"unknown facets: {unknown}, expected some of {list(FACETS)}")
+    if tag_mode not in ("all", "any"):
+        raise HTTPException(status_code=400, detail="tag_mode must be 'all' or 'any'")
+    tag_list = parse_tags(tags)
+    near = near_lat is not None and near_lng is not None
+    if near and not 0 < radius_km <= MAX_RADIUS_KM:
+        raise HTTPException(status_code=400, detail=f"radius_km must be between 0 and {MAX_RADIUS_KM}")
+    
+    # normalized filter set, identifies equivalent searches for caching
+    search_params = {
+        "q": (q or '').strip().lower() or None,
+        "fuzzy": fuzzy,
+        "min_similarity": min_similarity if fuzzy else None,
+        "author": author,
+        "tags": sorted(tag_list),
+        "tag_mode": tag_mode if len(tag_list) > 1 else None,
+        "min_price": min_price,
+        "max_price": max_price,
+        "city": (city or '').strip().lower() or None,
+        "for_sale": for_sale,
+        "for_rent": for_rent,
+        "near": [near_lat, near_lng, radius_km] if near else None,
+        "exclude_owner": current_user.id if current_user else None,
+    }
+    paging = {"cursor": cursor} if cursor is not None else {"skip": skip}
+    cache_key = search_key(search_params, limit=limit, facets=sorted(facet_names), **paging)
+    cached = await search_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = await search_cache.generation()
+    
     query = select(Book).join(User)
     
     filters = []
     
-    if q:
-        filters.append(
-            or_(
-                Book.title.ilike(f"%{q}%"),
-                Book.author.ilike(f"%{q}%"),
-                Book.description.ilike(f"%{q}%")
-            )
-        )
+    # full-text search over search_text (or trigram similarity when fuzzy), ranked by relevance
+    rank = None
+    if q and fuzzy:
+        query, rank = await apply_fuzzy_search(db, query, q, min_similarity)
+    elif q:
+        query, rank = apply_text_search(query, dialect_name(db), q)
     
     if author:
         filters.append(Book.author.ilike(f"%{author}%"))
     
-    if tags:
-        filters.append(Book.tags.ilike(f"%{tags}%"))
+    if tag_list:
+        filters.append(tag_filter(tag_list, match_all=tag_mode == "all"))
     
     if min_price is not None:
         filters.append(Book.price >= min_price)
@@ -177,6 +388,13 @@ async def search_books(
     if city:
         filters.append(User.city.ilike(f"%{city}%"))
     
+    # sellers near the point: geohash/bounding-box prefilter, then exact radius on the survivors
+    distance = None
+    if near:
+        distance = squared_distance(User.latitude, User.longitude, near_lat, near_lng)
+        filters.append(near_filter(User.geohash, User.latitude, User.longitude, near_lat, near_lng, radius_km))
+        filters.append(distance <= max_squared_distance(radius_km))
+    
     if for_sale is not None:
         filters.append(Book.is_for_sale == for_sale)
     
@@ -190,17 +408,93 @@ async def search_books(
     if filters:
         query = query.where(and_(*filters))
     
-    query = query.offset(skip).limit(limit)
-    result = await db.execute(query)
-    books = result.scalars().all()
-    return books
+    # counts per facet value for the whole filtered set, not just this page
+    facet_result = None
+    if facet_names:
+        facet_key = make_key({**search_params, "facets": sorted(facet_names)})
+        facet_result = facet_cache.get(facet_key)
+        if facet_result is None:
+            facet_result = await facet_counts(db, query, facet_names)
+            facet_cache.set(facet_key, facet_result)
+    
+    # nearest first for nearby search, relevance order when searching text, listing order otherwise
+    if distance is not None:
+        keys = [distance, Book.id]
+    elif rank is not None:
+        keys = [rank, Book.id]
+    else:
+        keys = [Book.id]
+    
+    query = query.add_columns(*keys)
+    if cursor is not None:
+        size = page_size(limit)
+        result = await db.execute(apply_keyset(query, keys, cursor, size))
+        rows, next_cursor = split_page(result.all(), size, lambda row: tuple(row[1:]))
+    else:
+        result = await db.execute(query.order_by(*keys).offset(skip).limit(limit))
+        rows, next_cursor = result.all(), None
+    
+    books = [row[0] for row in rows]
+    if distance is not None:
+        for row in rows:
+            row[0].distance_km = distance_km(row[1])
+    
+    items = [BookResponse.model_validate(book).model_dump(mode="json") for book in books]
+    response = items
+    if cursor is not None or facet_names:
+        response = {"items": items, "next_cursor": next_cursor, "facets": facet_result}
+    await search_cache.set(cache_key, search_params, response, books, generation)
+    return response
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
+@router.get("/tags", response_model=List[TagCount])
+async def get_tag_counts(
+    prefix: str = None,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_db)
+):
+    """Most used tags with the number of listings carrying each"""
+    count = func.count().label("count")
+    query = select(BookTag.tag, count).group_by(BookTag.tag)
+    if prefix:
+        prefix = prefix.strip().lower()
+        query = query.where(BookTag.tag >= prefix, BookTag.tag < prefix + "\uffff")
+    result = await db.execute(query.order_by(count.desc(), BookTag.tag).limit(limit))
+    return [{"tag": tag, "count": n} for tag, n in result.all()]
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # "title", "author" or "tag"
+    count: int  # listings carrying it
+
+@router.get("/suggest", response_model=List[Suggestion])
+async def suggest(
+    prefix: str,
+    limit: int = 10,
+    db: AsyncSession = Depends(get_db)
+):
+    """Typeahead: most popular titles, authors and tags with a word starting with prefix"""
+    if not 1 <= limit <= MAX_SUGGESTIONS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_SUGGESTIONS}")
+    await suggest_index.ensure_ready(db)
+    return suggest_index.suggest(prefix, limit)
+
+@router.get("/search-cache/stats")
+async def get_search_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit/miss counters and size of the search result cache, for signed-in users"""
+    return await search_cache.stats()
 
 @router.get("/reservations")
 async def get_user_reservations(
+    cursor: Optional[str] = None,  # keyset pagination, pass an empty cursor for the first page
+    limit: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all reservations made by the current user"""
+    """Get all reservations made by the current user, or one page of them when cursor is set"""
     from models import Reservation, ReservationStatus
     
     query = select(
@@ -218,10 +512,19 @@ async def get_user_reservations(
         User, Book.owner_id == User.id
     ).where(
         Reservation.user_id == current_user.id
-    ).order_by(Reservation.created_at.desc())
+    )
     
-    result = await db.execute(query)
-    reservations_data = result.all()
+    next_cursor = None
+    keys = [Reservation.created_at, Reservation.id]
+    if cursor is not None:
+        size = page_size(limit)
+        result = await db.execute(apply_keyset(query, keys, cursor, size, descending=True))
+        reservations_data, next_cursor = split_page(
+            result.all(), size, lambda row: (row[0].created_at, row[0].id)
+        )
+    else:
+        result = await db.execute(query.order_by(*[key.desc() for key in keys]))
+        reservations_data = result.all()
     
     reservations = []
     for reservation, book, seller_first_name, seller_last_name, seller_email, seller_phone, seller_city, seller_state in reservations_data:
@@ -262,8 +565,22 @@ async def get_user_reservations(
     
         reservations.append(reservation_dict)
     
+    if cursor is not None:
+        return {"items": reservations, "next_cursor": next_cursor}
     return reservations
 
+@router.get("/import-jobs")
+async def list_import_jobs(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """The user's most recent import jobs, newest first (declared before /{book_id})"""
+    result = await db.execute(
+        select(ImportJob).where(ImportJob.owner_id == current_user.id).order_by(ImportJob.id.desc()).limit(20)
+    )
+    return [job_status(job) for job in result.scalars().all()]
+
+
 @router.get("/{book_id}", response_model=BookResponse)
 async def get_book(book_id: int, db: AsyncSession = Depends(get_db)):
     result = await db.execute(select(Book).where(Book.id == book_id))
@@ -287,11 +604,26 @@ async def update_book(
     if book.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="not authorized to update this book")
     
+    before = book_snapshot(book)
     update_data = book_update.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(book, field, value)
     
-    await db.commit()
+    # keep the search indexes in step with the searchable fields
+    if update_data.keys() & {'title', 'author', 'tags', 'description'}:
+        book.search_text = build_search_text(book.title, book.author, book.tags, book.description)
+        await index_books(db, [book])
+    if 'isbn' in update_data:
+        book.isbn_normalized = normalize_isbn(book.isbn)
+    
+    after = book_snapshot(book)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=f"you already list a book with ISBN {book_update.isbn}")
+    await search_cache.invalidate_books([before, after])
+    suggest_index.update(removed=[before], added=[after])
     await db.refresh(book)
     return book
 
@@ -309,181 +641,111 @@ async def delete_book(
     if book.owner_id != current_user.id:
         raise HTTPException(status_code=403, detail="not authorized to delete this book")
     
+    before = book_snapshot(book)
+    await unindex_books(db, [book.id])
     await db.delete(book)
     await db.commit()
+    await search_cache.invalidate_books([before])
+    suggest_index.update(removed=[before])
     return {"message": "book deleted"}
 
+def _check_on_conflict(on_conflict):
+    if on_conflict is not None and on_conflict not in ON_CONFLICT_MODES:
+        raise HTTPException(status_code=400, detail=f"on_conflict must be one of {', '.join(ON_CONFLICT_MODES)}")
+
 @router.post("/import")
 async def import_books(
     file: UploadFile = File(...),
+    batch_size: int = DEFAULT_BATCH_SIZE,  # rows per INSERT and per transaction
+    resume_from: int = 0,  # checkpoint of an earlier attempt: skip rows up to this row number
+    background: bool = False,  # queue an import job and return its id instead of importing in the request
+    on_conflict: Optional[str] = None,  # merge_stock, replace or skip rows whose ISBN you already list
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    
+    """
+    Import books from a csv or xlsx file, streamed and committed in chunks of batch_size rows.
+    The response (or the error) carries the checkpoint to resume an interrupted import from.
+    With background=true the file is imported by a job, see GET /import-jobs/{job_id}.
+    Without on_conflict, rows whose ISBN you already list are reported as errors.
+    """
     if not file.filename.endswith(('.csv', '.xlsx')):
         raise HTTPException(status_code=400, detail="only csv and xlsx files supported")
-    
-    try:
-        books_created = 0
-        errors = []
-        
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+    _check_on_conflict(on_conflict)
+    if background:
+        job = await enqueue_import(db, file, current_user.id, "books", batch_size, on_conflict)
+        return job_status(job)
+    
+    async with AsyncExitStack() as stack:
         if file.filename.endswith('.csv'):
-            # handle csv files
-            content = await file.read()
-            csv_content = content.decode('utf-8')
-            csv_reader = csv.DictReader(StringIO(csv_content))
-            
-            required_columns = ['title', 'author', 'price']
-            headers = csv_reader.fieldnames
-            if not all(col in headers for col in required_columns):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"missing required columns: {required_columns}"
-                )
-            
-            for row in csv_reader:
-                row_num = csv_reader.line_num
-                try:
-                    # Validate required fields
-                    title = row.get('title')
-                    author = row.get('author')
-                    price_raw = row.get('price')
-                    if not title:
-                        raise ValueError('missing title')
-                    if not author:
-                        raise ValueError('missing author')
-                    if price_raw in (None, ''):
-                        raise ValueError('missing price')
-                    try:
-                        price = float(price_raw)
-                    except Exception:
-                        raise ValueError(f'invalid price: {price_raw}')
-
-                    book_data = {
-                        'title': title,
-                        'author': author,
-                        'price': price,
-                        'owner_id': current_user.id
-                    }
-
-                    # optional fields
-                    if 'isbn' in row and row['isbn']:
-                        book_data['isbn'] = str(row['isbn'])
-                    if 'tags' in row and row['tags']:
-                        book_data['tags'] = row['tags']  # Should be comma-separated
-                    if 'description' in row and row['description']:
-                        book_data['description'] = row['description']
-                    if 'stock' in row and row['stock']:
-                        try:
-                            book_data['stock'] = int(row['stock'])
-                        except Exception:
-                            raise ValueError(f'invalid stock: {row.get("stock")}')
-                    if 'condition' in row and row['condition']:
-                        book_data['condition'] = row['condition']
-
-                    db_book = Book(**book_data)
-                    db.add(db_book)
-                    books_created += 1
-                except Exception as row_err:
-                    errors.append({
-                        'row': row_num,
-                        'title': row.get('title') if row is not None else None,
-                        'message': str(row_err)
-                    })
-        
+            rows = read_csv_rows(file.file)
         else:
-            # handle xlsx files
-            content = await file.read()
-            wb = openpyxl.load_workbook(filename=content, read_only=True)
-            ws = wb.active
-            
-            # get headers from first row
-            headers = [cell.value for cell in ws[1]]
-            required_columns = ['title', 'author', 'price']
-            
-            if not all(col in headers for col in required_columns):
-                raise HTTPException(
-                    status_code=400, 
-                    detail=f"missing required columns: {required_columns}"
-                )
-            
-            # create column index mapping
-            col_indices = {header: idx for idx, header in enumerate(headers)}
-            
-            for row_idx, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
-                # skip completely empty rows
-                if not any(cell is not None and str(cell).strip() != '' for cell in row):
-                    continue
-                try:
-                    # Validate required fields
-                    title = row[col_indices['title']] if 'title' in col_indices else None
-                    author = row[col_indices['author']] if 'author' in col_indices else None
-                    price_cell = row[col_indices['price']] if 'price' in col_indices else None
-                    if not title:
-                        raise ValueError('missing title')
-                    if not author:
-                        raise ValueError('missing author')
-                    if price_cell in (None, ''):
-                        raise ValueError('missing price')
-                    try:
-                        price = float(price_cell)
-                    except Exception:
-                        raise ValueError(f'invalid price: {price_cell}')
-
-                    book_data = {
-                        'title': title,
-                        'author': author,
-                        'price': price,
-                        'owner_id': current_user.id
-                    }
-
-                    # optional fields
-                    if 'isbn' in col_indices and row[col_indices['isbn']]:
-                        book_data['isbn'] = str(row[col_indices['isbn']])
-                    if 'tags' in col_indices and row[col_indices['tags']]:
-                        book_data['tags'] = row[col_indices['tags']]  # Should be comma-separated
-                    if 'description' in col_indices and row[col_indices['description']]:
-                        book_data['description'] = row[col_indices['description']]
-                    if 'stock' in col_indices and row[col_indices['stock']]:
-                        try:
-                            book_data['stock'] = int(row[col_indices['stock']])
-                        except Exception:
-                            raise ValueError(f'invalid stock: {row[col_indices["stock"]]}')
-                    if 'condition' in col_indices and row[col_indices['condition']]:
-                        book_data['condition'] = row[col_indices['condition']]
-
-                    db_book = Book(**book_data)
-                    db.add(db_book)
-                    books_created += 1
-                except Exception as row_err:
-                    errors.append({
-                        'row': row_idx,
-                        'title': row[col_indices['title']] if 'title' in col_indices else None,
-                        'message': str(row_err)
-                    })
+            # xlsx sheets are parsed by worker processes, which read a copy on disk
+            rows = read_xlsx_rows(await stack.enter_async_context(upload_on_disk(file)))
         
-        await db.commit()
-        result = {"imported": books_created}
-        if errors:
-            result['errors'] = errors
-            result['message'] = f"imported {books_created} books, {len(errors)} errors"
-        else:
-            result['message'] = f"imported {books_created} books successfully"
-        return result
-    
-    except Exception as e:
-        # If we already have structured errors, return them; otherwise provide the exception message
-        raise HTTPException(status_code=400, detail=f"import failed: {str(e)}")
-
-@router.get("/my/books", response_model=List[BookResponse])
+        try:
+            outcome = await import_book_rows(
+                db, rows, current_user.id, batch_size, resume_from, on_conflict=on_conflict
+            )
+        except HTTPException:
+            raise
+        except BookImportError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"import failed: {e}; {e.imported} books were imported, retry with resume_from={e.checkpoint}"
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"import failed: {str(e)}")
+    
+    books_created = outcome['imported']
+    result = {"imported": books_created, "checkpoint": outcome['checkpoint']}
+    if on_conflict:
+        result['updated'] = outcome['updated']
+        result['skipped'] = outcome['skipped']
+    if outcome['error_count']:
+        result['errors'] = outcome['errors']
+        result['error_count'] = outcome['error_count']
+        result['message'] = f"imported {books_created} books, {outcome['error_count']} errors"
+    else:
+        result['message'] = f"imported {books_created} books successfully"
+    return result
+
+@router.get("/my/books", response_model=Union[List[BookResponse], CursorPage[BookResponse]])
 async def get_my_books(
+    cursor: Optional[str] = None,  # keyset pagination, pass an empty cursor for the first page
+    limit: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(select(Book).filter(Book.owner_id == current_user.id))
+    query = select(Book).filter(Book.owner_id == current_user.id)
+    if cursor is not None:
+        size = page_size(limit)
+        result = await db.execute(apply_keyset(query, [Book.id], cursor, size))
+        books, next_cursor = split_page(result.scalars().all(), size, lambda book: (book.id,))
+        return {"items": books, "next_cursor": next_cursor}
+    result = await db.execute(query.order_by(Book.id))
     books = result.scalars().all()
     return books
 
+@router.get("/my/books/export")
+async def export_my_books(
+    format: str = "csv",  # csv, xlsx or ndjson
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Download all your books as a file that /import (csv, xlsx) or /bulk (ndjson) takes back.
+    The file is streamed while the books are read, however many there are.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(EXPORT_FORMATS)}")
+    return StreamingResponse(
+        export_books(current_user.id, format),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="inventory.{format}"'}
+    )
+
 class ReservationInfo(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     
@@ -520,42 +782,41 @@ async def get_my_books_with_reservations(
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    # Get books owned by the current user with their reservations
+    # latest reservation per book (by created_at, then id) and its buyer, in one statement
+    latest = (
+        select(
+            Reservation,
+            func.row_number().over(
+                partition_by=Reservation.book_id,
+                order_by=(Reservation.created_at.desc(), Reservation.id.desc()),
+            ).label("position"),
+        )
+        .join(Book, Book.id == Reservation.book_id)
+        .where(Book.owner_id == current_user.id)
+        .subquery()
+    )
+    latest_reservation = aliased(Reservation, latest)
     result = await db.execute(
-        select(Book)
+        select(Book, latest_reservation, User)
+        .outerjoin(latest_reservation, and_(latest.c.book_id == Book.id, latest.c.position == 1))
+        .outerjoin(User, User.id == latest.c.user_id)
         .filter(Book.owner_id == current_user.id)
         .order_by(Book.created_at.desc())
     )
-    books = result.scalars().all()
     
     books_with_reservations = []
-    for book in books:
-        # Get the most recent active reservation for this book
-        reservation_result = await db.execute(
-            select(Reservation)
-            .filter(Reservation.book_id == book.id)
-            .order_by(Reservation.created_at.desc())
-        )
-        reservation = reservation_result.scalars().first()  # Use first() instead of scalar_one_or_none()
-        
+    for book, reservation, buyer in result.all():
         reservation_info = None
-        if reservation:
-            # Get buyer information
-            buyer_result = await db.execute(
-                select(User).filter(User.id == reservation.user_id)
+        if reservation and buyer:
+            reservation_info = ReservationInfo(
+                reservation_id=reservation.id,
+                buyer_id=buyer.id,
+                buyer_name=f"{buyer.first_name} {buyer.last_name}",
+                buyer_email=buyer.email,
+                reservation_fee=reservation.reservation_fee,
+                status=reservation.status.value,
+                created_at=reservation.created_at
             )
-            buyer = buyer_result.scalar_one_or_none()
-            
-            if buyer:
-                reservation_info = ReservationInfo(
-                    reservation_id=reservation.id,
-                    buyer_id=buyer.id,
-                    buyer_name=f"{buyer.first_name} {buyer.last_name}",
-                    buyer_email=buyer.email,
-                    reservation_fee=reservation.reservation_fee,
-                    status=reservation.status.value,
-                    created_at=reservation.created_at
-                )
         
         book_dict = {
             "id": book.id,
@@ -583,135 +844,120 @@ async def get_my_books_with_reservations(
 @router.post('/import-excel')
 async def import_books_from_excel(
     file: UploadFile = File(...),
+    background: bool = False,  # queue an import job and return its id instead of importing in the request
+    on_conflict: Optional[str] = None,  # merge_stock, replace or skip rows whose ISBN you already list
+    resume_from: int = 0,  # checkpoint of an earlier attempt: skip rows up to this row number
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ):
     """Import books from an uploaded Excel file. Expected header columns:
        title, author, price, stock, is_for_sale, is_for_rent, weekly_fee, condition, tags, description, isbn
+       With on_conflict, rows with an ISBN are synced on it instead of being matched by title.
+       If the file cannot be read to the end, the error carries the checkpoint to resume from.
     """
-    content = await file.read()
+    _check_on_conflict(on_conflict)
+    if background:
+        job = await enqueue_import(db, file, current_user.id, "excel", EXCEL_BATCH_SIZE, on_conflict)
+        return job_status(job)
+
+    # the sheet is parsed by worker processes, which read a copy on disk
+    async with upload_on_disk(file) as path:
+        # rows that look like one of the user's listings come back as matches, the rest are inserted in batches
+        try:
+            outcome = await import_excel_rows(
+                db, read_excel_sheet(path), current_user.id, resume_from=resume_from, on_conflict=on_conflict
+            )
+        except BookImportError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"import failed: {e}; {e.imported} books were created, retry with resume_from={e.checkpoint}"
+            )
+    result = {"created": outcome['created'], "matches": outcome['matches'], "errors": outcome['errors'],
+              "checkpoint": outcome['checkpoint']}
+    if on_conflict:
+        result['updated'] = outcome['updated']
+        result['skipped'] = outcome['skipped']
+    return result
+
+
+class MatchResolution(BaseModel):
+    row: int  # row number of the match
+    action: Literal["merge", "create", "skip"]
+    book_id: Optional[int] = None  # merge: the listing to add the stock to, the match's suggested id
+    title: Optional[str] = None  # create: the title of the row
+    row_data: Optional[Dict[str, Any]] = None  # the match's row_data
+
+class MatchResolutions(BaseModel):
+    resolutions: List[MatchResolution]
+
+@router.post("/import-matches/apply")
+async def apply_import_matches(
+    body: MatchResolutions,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Apply the decisions on the matches of /import-excel in one transaction: merge the row's stock
+       into the suggested listing, create the row as a new listing or skip it. Returns an outcome per row;
+       a resolution that cannot be applied is reported as an error and does not stop the others.
+    """
+    if len(body.resolutions) > MAX_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_RESOLUTIONS} resolutions per request")
     try:
-        wb = openpyxl.load_workbook(filename=BytesIO(content), data_only=True)
+        outcomes, saved, merged_ids = await apply_match_resolutions(
+            db, [resolution.model_dump() for resolution in body.resolutions], current_user.id
+        )
+        await db.commit()
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
-
-    sheet = wb.active
-    rows = list(sheet.iter_rows(values_only=True))
-    if not rows or len(rows) < 2:
-        raise HTTPException(status_code=400, detail="Excel file must contain a header row and at least one data row")
-
-    header = [str(h).strip().lower() if h is not None else '' for h in rows[0]]
-    # Map header names to indices
-    idx = {name: i for i, name in enumerate(header)}
-
-    created = 0
-    errors = []
-    matches = []
-
-    # load current user's existing books for matching
-    existing_books_result = await db.execute(select(Book).where(Book.owner_id == current_user.id))
-    existing_books = existing_books_result.scalars().all()
-
-    def normalize_title(s):
-        return (str(s).lower().replace('\n',' ').replace('\r',' ')).strip()
-
-    def jaccard(a, b):
-        A = set(a.split())
-        B = set(b.split())
-        if not A or not B:
-            return 0.0
-        inter = len(A & B)
-        union = len(A | B)
-        return inter / union if union else 0.0
-
-    for rnum, row in enumerate(rows[1:], start=2):
-        try:
-            title = row[idx.get('title')] if 'title' in idx else None
-            if not title:
-                raise ValueError('Missing title')
-
-            author = row[idx.get('author')] if 'author' in idx else None
-            price = row[idx.get('price')] if 'price' in idx else None
-            stock = row[idx.get('stock')] if 'stock' in idx else 1
-            is_for_sale = row[idx.get('is_for_sale')] if 'is_for_sale' in idx else True
-            is_for_rent = row[idx.get('is_for_rent')] if 'is_for_rent' in idx else False
-            weekly_fee = row[idx.get('weekly_fee')] if 'weekly_fee' in idx else None
-            condition = row[idx.get('condition')] if 'condition' in idx else None
-            tags = row[idx.get('tags')] if 'tags' in idx else None
-            description = row[idx.get('description')] if 'description' in idx else None
-            isbn = row[idx.get('isbn')] if 'isbn' in idx else None
-
-            # Basic parsing
-            try:
-                price = float(price)
-            except Exception:
-                raise ValueError('Invalid price')
-
-            try:
-                stock = int(stock)
-            except Exception:
-                stock = 1
-
-            # Check for similar existing book titles (basic Jaccard on normalized words)
-            norm_title = normalize_title(title)
-            best = None
-            best_score = 0.0
-            for eb in existing_books:
-                eb_title = normalize_title(eb.title or '')
-                score = jaccard(norm_title, eb_title)
-                if score > best_score:
-                    best_score = score
-                    best = eb
-
-            # threshold for suggesting a match
-            if best and best_score >= 0.6:
-                matches.append({
-                    'row': rnum,
-                    'title': str(title),
-                    'suggested': {
-                        'id': best.id,
-                        'title': best.title,
-                        'author': best.author,
-                        'stock': best.stock,
-                        'score': round(best_score, 2)
-                    },
-                    'row_data': {
-                        'price': price,
-                        'stock': stock,
-                        'is_for_sale': bool(is_for_sale),
-                        'is_for_rent': bool(is_for_rent),
-                        'weekly_fee': float(weekly_fee) if weekly_fee not in (None, '') else None,
-                        'condition': condition,
-                        'tags': tags,
-                        'description': description,
-                        'isbn': isbn
-                    }
-                })
-            else:
-                book = Book(
-                    isbn=str(isbn) if isbn is not None else None,
-                    title=str(title),
-                    author=str(author) if author is not None else None,
-                    search_text=f"{title} {author or ''} {tags or ''} {description or ''}",
-                    description=str(description) if description is not None else None,
-                    tags=str(tags) if tags is not None else None,
-                    price=price,
-                    stock=stock,
-                    owner_id=current_user.id,
-                    is_for_sale=bool(is_for_sale),
-                    is_for_rent=bool(is_for_rent),
-                    weekly_fee=float(weekly_fee) if weekly_fee not in (None, '') else None,
-                    condition=str(condition) if condition is not None else None,
-                )
-
-                db.add(book)
-                await db.commit()
-                await db.refresh(book)
-                created += 1
-        except Exception as e:
-            errors.append({'row': rnum, 'error': str(e)})
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=f"applying the resolutions failed, nothing was changed: {e}")
+    await books_imported(saved['inserted'])
+    await search_cache.invalidate_book_ids(merged_ids)
+
+    counts = {status: 0 for status in ("merged", "created", "skipped", "error")}
+    for outcome in outcomes:
+        counts[outcome['status']] += 1
+    return {
+        "merged": counts["merged"],
+        "created": counts["created"],
+        "skipped": counts["skipped"],
+        "error_count": counts["error"],
+        "results": outcomes,
+    }
+
+
+async def _get_import_job(db, job_id, user):
+    job = await db.get(ImportJob, job_id)
+    if not job or job.owner_id != user.id:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+
+@router.get("/import-jobs/{job_id}")
+async def get_import_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Progress of a background import: rows processed, inserted, matched and errors"""
+    job = await _get_import_job(db, job_id, current_user)
+    result = job_status(job)
+    if job.kind == "excel":
+        result["matches"] = json.loads(job.matches) if job.matches else []
+    return result
+
 
-    return {"created": created, "matches": matches, "errors": errors}
+@router.post("/import-jobs/{job_id}/cancel")
+async def cancel_import_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Cancel a background import; a running one stops after its current chunk, which stays imported"""
+    job = await _get_import_job(db, job_id, current_user)
+    if job.status in FINISHED:
+        raise HTTPException(status_code=400, detail=f"Import job is already {job.status}")
+    job = await cancel_import(db, job)
+    return job_status(job)
 
 
 class TransactionResponse(BaseModel):
@@ -726,20 +972,31 @@ class TransactionResponse(BaseModel):
 
 @router.get("/my/sales")
 async def get_my_sales(
+    cursor: Optional[str] = None,  # keyset pagination, pass an empty cursor for the first page
+    limit: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     # get all sales by current user
-    result = await db.execute(
+    query = (
         select(Transaction, Book, User)
         .join(Book, Transaction.book_id == Book.id)
         .join(User, Transaction.buyer_id == User.id)
         .where(Transaction.seller_id == current_user.id)
-        .order_by(Transaction.created_at.desc())
     )
-    sales = result.all()
+    keys = [Transaction.created_at, Transaction.id]
+    next_cursor = None
+    if cursor is not None:
+        size = page_size(limit)
+        result = await db.execute(apply_keyset(query, keys, cursor, size, descending=True))
+        sales, next_cursor = split_page(
+            result.all(), size, lambda row: (row[0].created_at, row[0].id)
+        )
+    else:
+        result = await db.execute(query.order_by(*[key.desc() for key in keys]))
+        sales = result.all()
     
-    return [
+    items = [
         {
             "id": transaction.id,
             "book_title": book.title,
@@ -752,3 +1009,7 @@ async def get_my_sales(
         }
         for transaction, book, buyer in sales
     ]
+    
+    if cursor is not None:
+        return {"items": items, "next_cursor": next_cursor}
+    return items
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import List
+from typing import List, Optional, Union
 
 from database import get_db
 from models import Charity, Donation, User
 from routers.auth import get_current_user
+from services.pagination import CursorPage, apply_keyset, page_size, split_page
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -33,11 +34,12 @@ class DonationResponse(BaseModel):
     pickup_date: str = None
     status: str
 
-@router.get("/", response_model=List[CharityResponse])
+@router.get("/", response_model=Union[List[CharityResponse], CursorPage[CharityResponse]])
 async def get_charities(
     skip: int = 0,
     limit: int = 100,
     verified_only: bool = True,
+    cursor: Optional[str] = None,  # keyset pagination, pass an empty cursor for the first page
     db: AsyncSession = Depends(get_db)
 ):
     query = select(Charity)
@@ -45,7 +47,13 @@ async def get_charities(
     if verified_only:
         query = query.where(Charity.is_verified == True)
     
-    query = query.offset(skip).limit(limit)
+    if cursor is not None:
+        size = page_size(limit)
+        result = await db.execute(apply_keyset(query, [Charity.id], cursor, size))
+        charities, next_cursor = split_page(result.scalars().all(), size, lambda charity: (charity.id,))
+        return {"items": charities, "next_cursor": next_cursor}
+    
+    query = query.order_by(Charity.id).offset(skip).limit(limit)
     result = await db.execute(query)
     charities = result.scalars().all()
     return charities
@@ -1,17 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Header
 from fastapi.responses import RedirectResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from typing import Dict, Any
+from sqlalchemy.exc import IntegrityError
+from typing import Dict, Any, Optional
 import os
 from datetime import datetime, timedelta
 import json
 
 from database import get_db
-from models import Book, User, Reservation, Payment, BookStatus, ReservationStatus, PaymentStatus
+from models import Book, User, Reservation, Payment, BookStatus, ReservationStatus, PaymentStatus, WebhookEvent
 from routers.auth import get_current_user
 from pydantic import BaseModel
-from services.phonepe_service import create_payment_order, check_payment_status
+from services.phonepe_service import (
+    FINAL_STATES, create_payment_order, check_payment_status, parse_webhook, payment_status_cache, phonepe_gateway,
+    verify_webhook_authorization, webhook_configured
+)
+from services.pagination import apply_keyset, page_size, split_page
+from services.search_cache import search_cache
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
@@ -104,7 +110,8 @@ async def create_reservation(
     redirect_url = f"{BACKEND_URL}/api/payments/phonepe/callback?reservation_id={reservation.id}"
     
     # Create PhonePe payment order
-    payment_response = create_payment_order(
+    await db.commit()  # release the connection while PhonePe responds
+    payment_response = await create_payment_order(
         amount=advance_amount,
         redirect_url=redirect_url,
         merchant_order_id=merchant_order_id,
@@ -180,7 +187,8 @@ async def verify_payment(
     if not merchant_order_id:
         raise HTTPException(status_code=400, detail="No PhonePe order found for this reservation")
     
-    status_response = check_payment_status(merchant_order_id)
+    await db.commit()  # release the connection while PhonePe responds
+    status_response = await check_payment_status(merchant_order_id, fresh=True)
     
     if not status_response.get("success"):
         raise HTTPException(status_code=500, detail="Failed to verify payment status with PhonePe")
@@ -215,10 +223,59 @@ async def verify_payment(
         book.status = BookStatus.RESERVED
     
     await db.commit()
+    await search_cache.invalidate_book_ids([reservation.book_id])
     
     return {"message": "Payment verified successfully", "reservation_id": reservation.id}
 
 
+async def apply_payment_state(db: AsyncSession, reservation: Reservation, state: str, transaction_id: str = None):
+    """
+    Bring a reservation in line with the state of its PhonePe order; the caller commits
+
+    COMPLETED confirms the reservation, reserves the book and records the payment as
+    paid; any other state cancels the reservation unless it is paid already.
+
+    Returns:
+        True when the book was reserved, invalidate the search cache after committing
+    """
+    if state != "COMPLETED":
+        if reservation.payment_status != PaymentStatus.PAID:
+            reservation.payment_status = PaymentStatus.FAILED
+            reservation.status = ReservationStatus.CANCELLED
+        return False
+    if reservation.payment_status == PaymentStatus.PAID:
+        return False
+    
+    reservation.payment_status = PaymentStatus.PAID
+    reservation.status = ReservationStatus.CONFIRMED
+    
+    # Set rental start date and due date for rentals
+    if reservation.payment_type == 'rental' and reservation.rental_weeks:
+        reservation.rental_start_date = datetime.now()
+        reservation.due_date = datetime.now() + timedelta(weeks=reservation.rental_weeks)
+    
+    # Update book status
+    result = await db.execute(select(Book).where(Book.id == reservation.book_id))
+    book = result.scalar_one_or_none()
+    if book:
+        book.status = BookStatus.RESERVED
+    
+    # Mark the payment record paid, create it if missing
+    result = await db.execute(select(Payment).where(Payment.reservation_id == reservation.id))
+    payment = result.scalars().first()
+    if payment:
+        payment.status = PaymentStatus.PAID
+        payment.transaction_id = payment.transaction_id or transaction_id
+    else:
+        db.add(Payment(
+            reservation_id=reservation.id,
+            amount=reservation.reservation_fee,
+            payment_method="phonepe",
+            transaction_id=transaction_id,
+            status=PaymentStatus.PAID
+        ))
+    return book is not None
+
 # PhonePe Callback Handler
 @router.get("/phonepe/callback")
 async def phonepe_payment_callback(
@@ -244,6 +301,10 @@ async def phonepe_payment_callback(
         print(f"Reservation {reservation_id} not found")
         return RedirectResponse(url=f"{FRONTEND_URL}/payment-failed")
     
+    # confirmed already, by the webhook or an earlier check; nothing to ask PhonePe
+    if reservation.payment_status == PaymentStatus.PAID:
+        return RedirectResponse(url=f"{FRONTEND_URL}/payment-success?reservation_id={reservation_id}")
+    
     # Check payment status with PhonePe
     merchant_order_id = reservation.phonepe_order_id
     print(f"Checking payment status for merchant_order_id: {merchant_order_id}")
@@ -252,7 +313,8 @@ async def phonepe_payment_callback(
         print("No merchant_order_id found, treating as failed")
         return RedirectResponse(url=f"{FRONTEND_URL}/payment-failed?reservation_id={reservation_id}")
     
-    status_response = check_payment_status(merchant_order_id)
+    await db.commit()  # release the connection while PhonePe responds
+    status_response = await check_payment_status(merchant_order_id, fresh=True)
     print(f"PhonePe status response: {status_response}")
     
     if not status_response.get("success"):
@@ -263,54 +325,93 @@ async def phonepe_payment_callback(
     print(f"Payment state received: '{payment_state}'")
     
     # Check payment state and redirect accordingly
+    book_changed = await apply_payment_state(db, reservation, payment_state, status_response.get("transaction_id"))
+    await db.commit()
+    if book_changed:
+        await search_cache.invalidate_book_ids([reservation.book_id])
+    
     if payment_state == "COMPLETED":
-        print("Payment COMPLETED - updating reservation to CONFIRMED")
-        # Update reservation status
-        reservation.payment_status = PaymentStatus.PAID
-        reservation.status = ReservationStatus.CONFIRMED
-        
-        # Set rental start date and due date for rentals
-        if reservation.payment_type == 'rental' and reservation.rental_weeks:
-            reservation.rental_start_date = datetime.now()
-            reservation.due_date = datetime.now() + timedelta(weeks=reservation.rental_weeks)
-        
-        # Update book status
-        result = await db.execute(select(Book).where(Book.id == reservation.book_id))
-        book = result.scalar_one_or_none()
-        if book:
-            book.status = BookStatus.RESERVED
-        
-        # Create payment record if not exists
-        payment_exists = await db.execute(
-            select(Payment).where(Payment.reservation_id == reservation.id)
-        )
-        existing_payment = payment_exists.scalar_one_or_none()
-        
-        if not existing_payment:
-            payment = Payment(
-                reservation_id=reservation.id,
-                amount=reservation.reservation_fee,
-                payment_method="phonepe",
-                transaction_id=status_response.get("transaction_id"),
-                status=PaymentStatus.PAID
-            )
-            db.add(payment)
-        
-        await db.commit()
-        
-        print(f"Redirecting to payment-success page for reservation {reservation_id}")
+        print(f"Payment COMPLETED - redirecting to payment-success page for reservation {reservation_id}")
         return RedirectResponse(url=f"{FRONTEND_URL}/payment-success?reservation_id={reservation_id}")
     
-    else:
-        print(f"Payment not completed (state: {payment_state}) - updating reservation to CANCELLED")
-        # Update reservation as failed/cancelled for any non-completed state
-        reservation.payment_status = PaymentStatus.FAILED
-        reservation.status = ReservationStatus.CANCELLED
-        await db.commit()
-        
-        print(f"Redirecting to payment-failed page for reservation {reservation_id}")
-        return RedirectResponse(url=f"{FRONTEND_URL}/payment-failed?reservation_id={reservation_id}")
+    print(f"Payment not completed (state: {payment_state}) - redirecting to payment-failed page for reservation {reservation_id}")
+    return RedirectResponse(url=f"{FRONTEND_URL}/payment-failed?reservation_id={reservation_id}")
+
+
+@router.post("/phonepe/webhook")
+async def phonepe_webhook(
+    request: Request,
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Order state events sent by PhonePe, server to server
 
+    Applied like the redirect callback, once per event: redeliveries are acknowledged
+    without being applied again. A final state that is applied is also recorded in the
+    status cache, so later status checks of the order cost no gateway call. The response
+    status is "applied", "duplicate", or "ignored" for unknown orders, states that are not
+    final and failures reported for a reservation that is paid already.
+    """
+    if not webhook_configured():
+        raise HTTPException(status_code=503, detail="PhonePe webhook not configured")
+    if not verify_webhook_authorization(authorization):
+        raise HTTPException(status_code=401, detail="invalid webhook authorization")
+    try:
+        event = parse_webhook(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # the event row is committed together with its effects, so a failed delivery is retried
+    db.add(WebhookEvent(
+        event_id=event["event_id"],
+        event=event["event"],
+        merchant_order_id=event["merchant_order_id"],
+        state=event["state"]
+    ))
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        return {"status": "duplicate"}
+    
+    result = await db.execute(select(Reservation).where(Reservation.phonepe_order_id == event["merchant_order_id"]))
+    reservation = result.scalar_one_or_none()
+    book_changed = False
+    outcome = "ignored"  # unknown orders, states that are not final, failures of paid reservations
+    if not reservation:
+        print(f"PhonePe webhook for unknown order {event['merchant_order_id']}")
+    elif event["state"] == "COMPLETED" or (
+        event["state"] in FINAL_STATES and reservation.payment_status != PaymentStatus.PAID
+    ):
+        book_changed = await apply_payment_state(db, reservation, event["state"], event["transaction_id"])
+        outcome = "applied"
+    await db.commit()
+    
+    if outcome == "applied":
+        # only a state the reservation now reflects; the cache keeps the first final state
+        payment_status_cache.record(event["merchant_order_id"], {
+            "success": True,
+            "state": event["state"],
+            "payment_method": event["payment_method"],
+            "transaction_id": event["transaction_id"],
+            "amount": event["amount"],
+            "response": None
+        })
+    if book_changed:
+        await search_cache.invalidate_book_ids([reservation.book_id])
+    return {"status": outcome}
+
+
+@router.get("/phonepe/gateway/stats")
+async def get_phonepe_gateway_stats(current_user: User = Depends(get_current_user)):
+    """Calls in flight, timeouts and rejections of the PhonePe gateway pool, for signed-in users"""
+    return phonepe_gateway.stats()
+
+@router.get("/phonepe/status-cache/stats")
+async def get_phonepe_status_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hits, merged lookups and upstream calls of the PhonePe status cache, for signed-in users"""
+    return payment_status_cache.stats()
 
 # PhonePe Status Check
 @router.get("/phonepe/status/{reservation_id}")
@@ -337,48 +438,31 @@ async def get_phonepe_payment_status(
         if not book or book.owner_id != current_user.id:
             raise HTTPException(status_code=403, detail="Not authorized to view this reservation")
     
-    # Check payment status with PhonePe
+    # Check payment status with PhonePe; the payment pages poll this, so it is served
+    # from the status cache
     phonepe_status = None
     transaction_id = None
     
-    if reservation.phonepe_order_id:
-        status_response = check_payment_status(reservation.phonepe_order_id)
+    if reservation.payment_status == PaymentStatus.PAID:
+        # confirmed already, by the webhook or an earlier check
+        phonepe_status = "COMPLETED"
+        transaction_id = await db.scalar(
+            select(Payment.transaction_id).where(Payment.reservation_id == reservation.id).limit(1)
+        )
+    elif reservation.phonepe_order_id:
+        await db.commit()  # release the connection while PhonePe responds
+        status_response = await check_payment_status(reservation.phonepe_order_id)
         
         if status_response.get("success"):
             phonepe_status = status_response.get("state")
             transaction_id = status_response.get("transaction_id")
             
             # Update reservation status based on PhonePe status if it changed
-            if phonepe_status == "COMPLETED" and reservation.payment_status != PaymentStatus.PAID:
-                reservation.payment_status = PaymentStatus.PAID
-                reservation.status = ReservationStatus.CONFIRMED
-                
-                # Update book status
-                result = await db.execute(select(Book).where(Book.id == reservation.book_id))
-                book = result.scalar_one_or_none()
-                if book:
-                    book.status = BookStatus.RESERVED
-                
-                # Create payment record if not exists
-                payment_exists = await db.execute(
-                    select(Payment).where(Payment.reservation_id == reservation.id)
-                )
-                if not payment_exists.scalar_one_or_none():
-                    payment = Payment(
-                        reservation_id=reservation.id,
-                        amount=reservation.reservation_fee,
-                        payment_method="phonepe",
-                        transaction_id=transaction_id,
-                        status=PaymentStatus.PAID
-                    )
-                    db.add(payment)
-                
-                await db.commit()
-                
-            elif phonepe_status in ["FAILED", "PENDING"] and reservation.payment_status != PaymentStatus.FAILED:
-                reservation.payment_status = PaymentStatus.FAILED
-                reservation.status = ReservationStatus.CANCELLED
+            if phonepe_status == "COMPLETED" or reservation.payment_status != PaymentStatus.FAILED:
+                book_changed = await apply_payment_state(db, reservation, phonepe_status, transaction_id)
                 await db.commit()
+                if book_changed:
+                    await search_cache.invalidate_book_ids([reservation.book_id])
     
     return {
         "reservation_id": reservation.id,
@@ -500,16 +584,19 @@ async def mark_book_collected(
     book.status = BookStatus.SOLD
     
     await db.commit()
+    await search_cache.invalidate_book_ids([book.id])
     
     return {"message": "Book marked as collected and sold successfully"}
 
 
 @router.get("/seller-reservations")
 async def get_seller_reservations(
+    cursor: Optional[str] = None,  # keyset pagination, pass an empty cursor for the first page
+    limit: Optional[int] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all reservations for books owned by the current user"""
+    """Get all reservations for books owned by the current user, or one page of them when cursor is set"""
     
     query = select(
         Reservation,
@@ -524,10 +611,19 @@ async def get_seller_reservations(
         User, Reservation.user_id == User.id
     ).where(
         Book.owner_id == current_user.id
-    ).order_by(Reservation.created_at.desc())
+    )
     
-    result = await db.execute(query)
-    reservations_data = result.all()
+    next_cursor = None
+    keys = [Reservation.created_at, Reservation.id]
+    if cursor is not None:
+        size = page_size(limit)
+        result = await db.execute(apply_keyset(query, keys, cursor, size, descending=True))
+        reservations_data, next_cursor = split_page(
+            result.all(), size, lambda row: (row[0].created_at, row[0].id)
+        )
+    else:
+        result = await db.execute(query.order_by(*[key.desc() for key in keys]))
+        reservations_data = result.all()
     
     reservations = []
     for reservation, book, buyer_first_name, buyer_last_name, buyer_email, buyer_phone in reservations_data:
@@ -563,6 +659,8 @@ async def get_seller_reservations(
         
         reservations.append(reservation_dict)
     
+    if cursor is not None:
+        return {"items": reservations, "next_cursor": next_cursor}
     return reservations
 
 
@@ -610,7 +708,8 @@ async def create_payment_page(
     redirect_url = f"{BACKEND_URL}/api/payments/phonepe/callback?reservation_id={reservation.id}"
     
     # Create PhonePe payment order
-    payment_response = create_payment_order(
+    await db.commit()  # release the connection while PhonePe responds
+    payment_response = await create_payment_order(
         amount=float(book.price),
         redirect_url=redirect_url,
         merchant_order_id=merchant_order_id,
@@ -683,7 +782,8 @@ async def verify_payment_page_payment(
     merchant_order_id = reservation.phonepe_order_id
     
     if merchant_order_id:
-        status_response = check_payment_status(merchant_order_id)
+        await db.commit()  # release the connection while PhonePe responds
+        status_response = await check_payment_status(merchant_order_id, fresh=True)
         
         if status_response.get("success") and status_response.get("state") == "COMPLETED":
             # Update reservation status
@@ -709,6 +809,7 @@ async def verify_payment_page_payment(
                 book.status = BookStatus.RESERVED
             
             await db.commit()
+            await search_cache.invalidate_book_ids([reservation.book_id])
             
             return {
                 "status": "success",
@@ -7,6 +7,9 @@ from typing import List
 from database import get_db
 from models import User
 from routers.auth import get_current_user
+from services.geo import encode_geohash
+from services.principal_cache import principal_cache
+from services.search_cache import search_cache
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -61,6 +64,14 @@ async def update_profile(
     for field, value in update_data.items():
         setattr(current_user, field, value)
     
+    # keep the nearby-search cell in step with the coordinates
+    if update_data.keys() & {'latitude', 'longitude'}:
+        current_user.geohash = encode_geohash(current_user.latitude, current_user.longitude)
+    
     await db.commit()
+    principal_cache.invalidate(current_user.id)
+    # city and coordinates are search filters on the seller's listings
+    if update_data.keys() & {'city', 'latitude', 'longitude'}:
+        await search_cache.invalidate_seller(current_user.id)
     await db.refresh(current_user)
     return current_user
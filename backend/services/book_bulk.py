@@ -0,0 +1,104 @@
+"""
+Bulk Book Changes
+Set-based updates and deletes of a seller's books: one UPDATE or DELETE scoped to the
+owner, whatever the number of books, instead of a SELECT, check and commit per book.
+
+The callers commit and then bring the caches up to date once, with the snapshots these
+functions return.
+"""
+from sqlalchemy import Numeric, and_, cast, delete, exists, func, not_, or_, select, update
+
+from models import Auction, Book, Reservation, Transaction
+from services.book_index import parse_tags, unindex_books
+from services.book_search import tag_filter
+from services.search_cache import SNAPSHOT_FIELDS
+
+MAX_BULK_IDS = 10000  # ids one bulk request may list; larger selections go by filter
+
+# columns a bulk update may set; the searchable text is left to PUT /books/{id}, which reindexes
+BULK_FIELDS = ('price', 'stock', 'status', 'is_for_sale', 'is_for_rent', 'weekly_fee', 'rental_duration', 'condition')
+
+
+def selection_filter(owner_id, ids=None, status=None, is_for_sale=None, is_for_rent=None, tags=None):
+    """
+    Condition selecting a seller's books
+
+    Args:
+        owner_id: the seller, every selection is limited to their books
+        ids: only these books
+        status, is_for_sale, is_for_rent: only books with these values
+        tags: comma-separated tags, only books carrying all of them
+    """
+    conditions = [Book.owner_id == owner_id]
+    if ids is not None:
+        conditions.append(Book.id.in_(ids))
+    if status is not None:
+        conditions.append(Book.status == status)
+    if is_for_sale is not None:
+        conditions.append(Book.is_for_sale == is_for_sale)
+    if is_for_rent is not None:
+        conditions.append(Book.is_for_rent == is_for_rent)
+    if tags:
+        conditions.append(tag_filter(parse_tags(tags)))
+    return and_(*conditions)
+
+
+async def update_books(db, condition, changes, price_multiplier=None):
+    """
+    Change the selected books with one UPDATE
+
+    Args:
+        db: AsyncSession
+        condition: see selection_filter
+        changes: {column: new value}, columns from BULK_FIELDS
+        price_multiplier: multiply the prices by this instead of setting them, rounded to 2 places
+
+    Returns:
+        (before, after): snapshots (see SNAPSHOT_FIELDS) of the changed books
+    """
+    columns = [Book.__table__.c[field] for field in SNAPSHOT_FIELDS]
+    # set explicitly, as the import upserts do
+    values = {**changes, 'updated_at': func.now()}
+    if price_multiplier is not None:
+        values['price'] = func.round(cast(Book.price * price_multiplier, Numeric), 2)
+    before = (await db.execute(select(*columns).where(condition).with_for_update())).mappings().all()
+    after = (await db.execute(
+        update(Book).where(condition).values(**values).returning(*columns).execution_options(synchronize_session=False)
+    )).mappings().all()
+    return [dict(book) for book in before], [dict(book) for book in after]
+
+
+def _in_use():
+    # books that reservations, auctions or sales refer to; deleting them would orphan those
+    return [
+        exists().where(Reservation.book_id == Book.id),
+        exists().where(Auction.book_id == Book.id),
+        exists().where(Transaction.book_id == Book.id),
+    ]
+
+
+async def delete_books(db, condition):
+    """
+    Delete the selected books with one DELETE, together with their search index entries
+
+    Books with reservations, auctions or sales are kept; mark those with a status or take
+    them off sale instead.
+
+    Args:
+        db: AsyncSession
+        condition: see selection_filter
+
+    Returns:
+        (deleted, kept): snapshots (see SNAPSHOT_FIELDS) of the deleted books and the number
+        of selected books that were kept
+    """
+    in_use = _in_use()
+    deletable = and_(condition, *(not_(reference) for reference in in_use))
+    kept = await db.scalar(select(func.count()).select_from(Book).where(condition, or_(*in_use)))
+    columns = [Book.__table__.c[field] for field in SNAPSHOT_FIELDS]
+    deleted = (await db.execute(
+        delete(Book).where(deletable).returning(*columns).execution_options(synchronize_session=False)
+    )).mappings().all()
+    # afterwards, a tags filter in the condition reads the index
+    await unindex_books(db, [book['id'] for book in deleted])
+    return [dict(book) for book in deleted], kept
@@ -0,0 +1,97 @@
+"""
+Book Export
+Streams a seller's inventory as CSV, XLSX or NDJSON. Books are read through a server-side
+cursor EXPORT_BATCH rows at a time and written out batch by batch, so memory stays flat
+whatever the size of the inventory.
+
+The columns are the ones /import and /import-excel read, so an export imports back as
+it is, except that /import requires an author: books without one import back through
+/import-excel or /bulk. Imports match existing listings by ISBN only: with on_conflict=replace the rows
+with an ISBN update their listings in place, the others are inserted as new listings.
+"""
+import asyncio
+import csv
+import enum
+import io
+import json
+import tempfile
+
+import openpyxl
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Book
+
+EXPORT_COLUMNS = ['title', 'author', 'price', 'stock', 'isbn', 'tags', 'description', 'condition',
+                  'is_for_sale', 'is_for_rent', 'weekly_fee', 'rental_duration', 'status']
+EXPORT_BATCH = 1000  # rows per cursor fetch and per written chunk
+XLSX_CHUNK = 64 * 1024  # bytes per chunk of the finished workbook
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "ndjson": "application/x-ndjson",
+}
+
+
+async def _batches(owner_id):
+    # own session: the export is read while the response streams, after the request's session is gone
+    async with AsyncSessionLocal() as db:
+        columns = [getattr(Book, column) for column in EXPORT_COLUMNS]
+        result = await db.stream(
+            select(*columns).where(Book.owner_id == owner_id).order_by(Book.id)
+            .execution_options(yield_per=EXPORT_BATCH)
+        )
+        async for rows in result.partitions():
+            # enums (status) are written as the values the importers read
+            yield [tuple(value.value if isinstance(value, enum.Enum) else value for value in row) for row in rows]
+
+
+async def _export_csv(owner_id):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    # a BOM so spreadsheet apps read it as UTF-8; read_csv_rows skips it
+    yield ('\ufeff' + buffer.getvalue()).encode()
+    async for rows in _batches(owner_id):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+async def _export_ndjson(owner_id):
+    async for rows in _batches(owner_id):
+        yield "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows).encode()
+
+
+def _append_rows(sheet, rows):
+    for row in rows:
+        sheet.append([ILLEGAL_CHARACTERS_RE.sub('', value) if isinstance(value, str) else value for value in row])
+
+
+async def _export_xlsx(owner_id):
+    # write-only mode keeps the sheet in a temporary file rather than in memory; the zip
+    # container can only be written once the sheet is complete, then it is streamed out
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("books")
+    sheet.append(EXPORT_COLUMNS)
+    async for rows in _batches(owner_id):
+        await asyncio.to_thread(_append_rows, sheet, rows)
+    with tempfile.TemporaryFile() as out:
+        await asyncio.to_thread(workbook.save, out)
+        out.seek(0)
+        while chunk := await asyncio.to_thread(out.read, XLSX_CHUNK):
+            yield chunk
+
+
+def export_books(owner_id, format):
+    """
+    The bytes of a seller's inventory in one of EXPORT_FORMATS, as an async iterator
+
+    Args:
+        owner_id: the seller
+        format: "csv", "xlsx" or "ndjson"
+    """
+    exporters = {"csv": _export_csv, "xlsx": _export_xlsx, "ndjson": _export_ndjson}
+    return exporters[format](owner_id)
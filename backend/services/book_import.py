@@ -0,0 +1,827 @@
+"""
+Book Import Service
+Streaming bulk import of seller inventories: rows are parsed as the upload is read,
+validated a chunk at a time and written with multi-row INSERTs, one transaction per chunk.
+Memory use depends on the chunk size, not on the size of the file.
+
+A seller lists each ISBN once. Rows whose ISBN is already listed are merged into that
+listing, replace it or are skipped, depending on the on_conflict mode; the INSERT does
+it with ON CONFLICT on (owner_id, isbn_normalized).
+"""
+import asyncio
+import csv
+import io
+import math
+from itertools import islice
+
+from fastapi import HTTPException
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Book, BookStatus
+from services.book_index import index_books, normalize_isbn, trigram_filler
+from services.book_search import build_search_text, dialect_name
+from services.search_cache import SNAPSHOT_FIELDS, search_cache
+from services.suggest import suggest_index
+from services.xlsx_reader import XlsxReadError, stream_rows
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+EXCEL_BATCH_SIZE = 2000  # /import-excel has the whole sheet in hand, so it uses larger batches
+MAX_REPORTED_ERRORS = 1000  # further errors are only counted
+REQUIRED_COLUMNS = ['title', 'author', 'price']
+MATCH_THRESHOLD = 0.6  # title similarity from which /import-excel suggests an existing listing
+# what to do with a row whose ISBN the seller already lists: add its stock to the listing,
+# overwrite the listing with it, or leave the listing alone; without a mode the row is an error
+ON_CONFLICT_MODES = ('merge_stock', 'replace', 'skip')
+MAX_RESOLUTIONS = 10000  # match resolutions one /import-matches/apply request may carry
+
+
+class BookImportError(Exception):
+    """An import stopped part way; the rows up to checkpoint were committed"""
+
+    def __init__(self, message, imported, checkpoint):
+        super().__init__(message)
+        self.imported = imported
+        self.checkpoint = checkpoint
+
+
+def _check_columns(headers):
+    if not all(col in (headers or []) for col in REQUIRED_COLUMNS):
+        raise HTTPException(status_code=400, detail=f"missing required columns: {REQUIRED_COLUMNS}")
+
+
+def read_csv_rows(binary_file):
+    """
+    Yield (row number, {column: value}) from a CSV file object, reading it incrementally
+
+    The row number is the line the row ends on, as reported by csv.reader.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    _check_columns(reader.fieldnames)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_xlsx_rows(path):
+    """
+    Yield (row number, {column: value}) from the active sheet of an xlsx file
+
+    The sheet is parsed in a worker process (see services/xlsx_reader.py); iterating
+    blocks while waiting for it.
+    """
+    rows = stream_rows(path)
+    headers = [str(h).strip() if h is not None else '' for h in next(rows, ())]
+    _check_columns(headers)
+    for row_num, values in enumerate(rows, start=2):
+        # skip completely empty rows
+        if not any(cell is not None and str(cell).strip() != '' for cell in values):
+            continue
+        # trailing empty cells may be left out of a row; every row gets every column
+        values = tuple(values) + (None,) * (len(headers) - len(values))
+        yield row_num, dict(zip(headers, values))
+
+
+def read_excel_sheet(path):
+    """
+    Yield (row number, {lower-cased column: value}) for every row after the header of
+    the active sheet of an /import-excel workbook
+
+    The sheet is parsed in a worker process, as in read_xlsx_rows.
+
+    Raises:
+        HTTPException: 400 if the file is not a workbook or has no data rows
+    """
+    rows = stream_rows(path)
+    try:
+        header = next(rows, None)
+        first = next(rows, None)
+    except XlsxReadError as e:
+        raise HTTPException(status_code=400, detail=f"Failed to read Excel file: {e}")
+    if first is None:
+        raise HTTPException(status_code=400, detail="Excel file must contain a header row and at least one data row")
+
+    header = [str(h).strip().lower() if h is not None else '' for h in header]
+    yield 2, dict(zip(header, first))
+    for row_num, row in enumerate(rows, start=3):
+        yield row_num, dict(zip(header, row))
+
+
+def _parse_flag(row, name, default):
+    # CSV cells are text: "False" must not read as true the way bool("False") does
+    value = row.get(name)
+    if value in (None, ''):
+        return default
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in ('true', '1', 'yes', 'y'):
+        return True
+    if text in ('false', '0', 'no', 'n'):
+        return False
+    raise ValueError(f'invalid {name}: {value}')
+
+
+def _parse_listing_state(row):
+    # rental_duration and status, only for the columns the file has (as an export writes them)
+    state = {}
+    if 'rental_duration' in row:
+        value = row.get('rental_duration')
+        try:
+            state['rental_duration'] = int(value) if value not in (None, '') else None
+        except Exception:
+            raise ValueError(f'invalid rental_duration: {value}')
+    if 'status' in row:
+        value = row.get('status')
+        try:
+            state['status'] = BookStatus(value) if value not in (None, '') else BookStatus.IN_STOCK
+        except ValueError:
+            raise ValueError(f'invalid status: {value}')
+    return state
+
+
+def parse_book_row(row, owner_id):
+    """
+    Validate one import row and turn it into Book column values
+
+    Rows with the same columns give results with the same keys, so a chunk can go into a
+    single executemany INSERT. is_for_sale, is_for_rent, weekly_fee, rental_duration and
+    status are only set when the file has those columns, so a replace import without them
+    leaves them as they are. Unlike POST /books and /bulk, every row needs an author.
+
+    Raises:
+        ValueError: with a message for the seller if the row is invalid
+    """
+    title = row.get('title')
+    author = row.get('author')
+    price_raw = row.get('price')
+    if title in (None, ''):
+        raise ValueError('missing title')
+    if author in (None, ''):
+        raise ValueError('missing author')
+    if price_raw in (None, ''):
+        raise ValueError('missing price')
+    try:
+        price = float(price_raw)
+    except Exception:
+        raise ValueError(f'invalid price: {price_raw}')
+
+    stock = 1
+    if row.get('stock') not in (None, ''):
+        try:
+            stock = int(row['stock'])
+        except Exception:
+            raise ValueError(f'invalid stock: {row.get("stock")}')
+
+    def optional(name):
+        value = row.get(name)
+        return str(value) if value not in (None, '') else None
+
+    title, author = str(title), str(author)
+    tags, description = optional('tags'), optional('description')
+    listing = {}
+    if 'is_for_sale' in row:
+        listing['is_for_sale'] = _parse_flag(row, 'is_for_sale', True)
+    if 'is_for_rent' in row:
+        listing['is_for_rent'] = _parse_flag(row, 'is_for_rent', False)
+    if 'weekly_fee' in row:
+        weekly_fee = row.get('weekly_fee')
+        try:
+            listing['weekly_fee'] = float(weekly_fee) if weekly_fee not in (None, '') else None
+        except Exception:
+            raise ValueError(f'invalid weekly_fee: {weekly_fee}')
+    listing.update(_parse_listing_state(row))
+    return {
+        'title': title,
+        'author': author,
+        'price': price,
+        'owner_id': owner_id,
+        'isbn': optional('isbn'),
+        'isbn_normalized': normalize_isbn(row.get('isbn')),
+        'tags': tags,  # comma-separated
+        'description': description,
+        'stock': stock,
+        'condition': optional('condition'),
+        'search_text': build_search_text(title, author, tags, description),
+        **listing,
+    }
+
+
+def parse_excel_row(row, owner_id):
+    """
+    Validate one /import-excel row and turn it into Book column values
+
+    Unlike parse_book_row a bad stock falls back to 1. rental_duration and status are
+    read as parse_book_row does.
+
+    Raises:
+        ValueError: with a message for the seller if the row is invalid
+    """
+    title = row.get('title')
+    if not title:
+        raise ValueError('Missing title')
+    try:
+        price = float(row.get('price'))
+    except Exception:
+        raise ValueError('Invalid price')
+    try:
+        stock = int(row.get('stock', 1))
+    except Exception:
+        stock = 1
+    weekly_fee = row.get('weekly_fee')
+
+    def optional(name):
+        value = row.get(name)
+        return str(value) if value is not None else None
+
+    author, tags, description = optional('author'), optional('tags'), optional('description')
+    return {
+        'isbn': optional('isbn'),
+        'isbn_normalized': normalize_isbn(row.get('isbn')),
+        'title': str(title),
+        'author': author,
+        'search_text': build_search_text(title, author, tags, description),
+        'description': description,
+        'tags': tags,
+        'price': price,
+        'stock': stock,
+        'owner_id': owner_id,
+        'is_for_sale': bool(row.get('is_for_sale', True)),
+        'is_for_rent': bool(row.get('is_for_rent', False)),
+        'weekly_fee': float(weekly_fee) if weekly_fee not in (None, '') else None,
+        'condition': optional('condition'),
+        **_parse_listing_state(row),
+    }
+
+
+def normalize_title(value):
+    return str(value).lower().replace('\n', ' ').replace('\r', ' ').strip()
+
+
+class TitleMatcher:
+    """
+    Near-duplicate lookup of import titles among a seller's listings
+
+    Titles are compared by the Jaccard similarity of their word sets. An inverted index
+    from word to listings means a title is only scored against listings sharing one of
+    its rarest words, instead of against every listing: a listing reaching the threshold
+    shares at least threshold * len(words) of the title's words, so it must share one of
+    the len(words) - that + 1 rarest.
+    """
+
+    def __init__(self, books, threshold=MATCH_THRESHOLD):
+        """
+        Args:
+            books: listings with id and title, in the order ties should be resolved in
+            threshold: lowest similarity match() reports
+        """
+        self.books = list(books)
+        self.threshold = threshold
+        self.words = [frozenset(normalize_title(book.title or '').split()) for book in self.books]
+        self.postings = {}  # word -> positions in self.books of the listings with it
+        for position, words in enumerate(self.words):
+            for word in words:
+                self.postings.setdefault(word, []).append(position)
+
+    def match(self, title):
+        """
+        Most similar listing for a title
+
+        Returns:
+            (listing, score) when the best score reaches the threshold, else None;
+            of equally similar listings the earliest wins
+        """
+        words = set(normalize_title(title).split())
+        if not words:
+            return None
+        required = max(1, math.ceil(self.threshold * len(words) - 1e-9))
+        probe = sorted(words, key=lambda word: len(self.postings.get(word, ())))[:len(words) - required + 1]
+        candidates = {position for word in probe for position in self.postings.get(word, ())}
+        best, best_score = None, 0.0
+        for position in candidates:
+            other = self.words[position]
+            score = len(words & other) / len(words | other)
+            if score > best_score or (score == best_score and best is not None and position < best):
+                best, best_score = position, score
+        if best is None or best_score < self.threshold:
+            return None
+        return self.books[best], best_score
+
+
+async def save_books(db, pending, on_conflict=None):
+    """
+    Write and index a batch of parsed rows with one INSERT ... ON CONFLICT statement;
+    on PostgreSQL the rows without an ISBN get a plain INSERT of their own
+
+    Rows repeating an ISBN within the batch are first combined according to on_conflict
+    as well, since one statement cannot touch a listing twice.
+
+    Args:
+        db: AsyncSession
+        pending: [(row number, Book column values)], all with the same keys and owner
+        on_conflict: None or one of ON_CONFLICT_MODES
+
+    Returns:
+        {"inserted", "updated", "before", "skipped", "conflicts", "ids"}: rows with the
+        searchable columns (see SNAPSHOT_FIELDS) of the inserted and of the merged or
+        replaced books, snapshots of the latter from before the change, the row numbers of
+        the skipped rows, [(row number, message)] for the rows that conflict when there is no
+        mode and {row number: book id} for the rows written
+    """
+    saved = {"inserted": [], "updated": [], "before": [], "skipped": [], "conflicts": [], "ids": {}}
+    rows = []
+    position = {}  # isbn_normalized -> index in rows
+    combined = {}  # row number -> row number of the row it was combined into
+    for row_num, values in pending:
+        key = values['isbn_normalized']
+        if key is None or key not in position:
+            if key is not None:
+                position[key] = len(rows)
+            rows.append((row_num, values))
+        elif on_conflict == 'merge_stock':
+            first_num, first = rows[position[key]]
+            rows[position[key]] = (first_num, {**first, 'stock': first['stock'] + values['stock']})
+            combined[row_num] = first_num
+        elif on_conflict == 'replace':
+            combined[rows[position[key]][0]] = row_num
+            rows[position[key]] = (row_num, values)
+        elif on_conflict == 'skip':
+            saved['skipped'].append(row_num)
+        else:
+            saved['conflicts'].append((row_num, f"ISBN {values['isbn']} is repeated in row {rows[position[key]][0]}"))
+    if not rows:
+        return saved
+
+    table = Book.__table__
+    columns = [table.c[field] for field in SNAPSHOT_FIELDS]
+    existing = {}  # isbn_normalized -> the listing
+    if position:
+        result = await db.execute(
+            select(*columns, table.c.isbn_normalized)
+            .where(table.c.owner_id == rows[0][1]['owner_id'], table.c.isbn_normalized.in_(list(position)))
+        )
+        existing = {book.isbn_normalized: book for book in result.all()}
+    if existing and on_conflict not in ('merge_stock', 'replace'):
+        kept = []
+        for row_num, values in rows:
+            listing = existing.get(values['isbn_normalized'])
+            if listing is None:
+                kept.append((row_num, values))
+            elif on_conflict == 'skip':
+                saved['skipped'].append(row_num)
+            else:
+                saved['conflicts'].append((row_num, f"ISBN {values['isbn']} is already listed (book {listing.id})"))
+        rows = kept
+        if not rows:
+            return saved
+
+    insert = postgresql_insert if dialect_name(db) == 'postgresql' else sqlite_insert
+    statement = insert(table)
+    target = {'index_elements': [table.c.owner_id, table.c.isbn_normalized],
+              'index_where': table.c.isbn_normalized.isnot(None)}
+    if on_conflict == 'merge_stock':
+        changes = {'stock': table.c.stock + statement.excluded.stock}
+    elif on_conflict == 'replace':
+        changes = {name: statement.excluded[name] for name in rows[0][1] if name != 'owner_id'}
+    if on_conflict in ('merge_stock', 'replace'):
+        statement = statement.on_conflict_do_update(**target, set_={**changes, 'updated_at': func.now()})
+    else:
+        # a listing added since the check above is left alone rather than failing the batch
+        statement = statement.on_conflict_do_nothing(**target)
+    returning = [*columns, table.c.isbn_normalized]
+    keyed = {values['isbn_normalized']: row_num for row_num, values in rows if values['isbn_normalized']}
+    unkeyed = [row_num for row_num, values in rows if not values['isbn_normalized']]
+    if dialect_name(db) == 'postgresql':
+        # ids are not promised in row order there. Rows with an ISBN are told apart by it;
+        # the others never conflict, so they get a plain INSERT whose RETURNING SQLAlchemy
+        # sorts into parameter order (it cannot when ON CONFLICT DO NOTHING drops rows)
+        returned, new_books = [], []
+        if keyed:
+            result = await db.execute(
+                statement.returning(*returning), [values for _, values in rows if values['isbn_normalized']]
+            )
+            returned = result.all()
+        if unkeyed:
+            result = await db.execute(
+                insert(table).returning(*returning, sort_by_parameter_order=True),
+                [values for _, values in rows if not values['isbn_normalized']]
+            )
+            new_books = result.all()
+    else:
+        # one statement; SQLite numbers the rows it inserts in order, so the ones
+        # without an ISBN (all new) are told apart by their ids
+        result = (await db.execute(statement.returning(*returning), [values for _, values in rows])).all()
+        returned = [book for book in result if book.isbn_normalized]
+        new_books = sorted((book for book in result if not book.isbn_normalized), key=lambda book: book.id)
+    saved['ids'] = {keyed[book.isbn_normalized]: book.id for book in returned}
+    saved['ids'].update(zip(unkeyed, (book.id for book in new_books)))
+    returned += new_books
+
+    updated_ids = {book.id: book for book in existing.values()}
+    for book in returned:
+        if book.id in updated_ids:
+            saved['updated'].append(book)
+            saved['before'].append({field: getattr(updated_ids[book.id], field) for field in SNAPSHOT_FIELDS})
+        else:
+            saved['inserted'].append(book)
+
+    for row_num, values in rows:
+        if row_num not in saved['ids']:
+            # listed by someone else's request since the check above
+            if on_conflict == 'skip':
+                saved['skipped'].append(row_num)
+            else:
+                saved['conflicts'].append((row_num, f"ISBN {values['isbn']} is already listed"))
+    for row_num in combined:
+        target = row_num
+        while target in combined:
+            target = combined[target]
+        if target in saved['ids']:
+            saved['ids'][row_num] = saved['ids'][target]
+    # trigrams are written once the batch committed, see books_imported
+    await index_books(db, saved['inserted'], new=True, with_trigrams=False)
+    if on_conflict == 'replace':
+        await index_books(db, saved['updated'], with_trigrams=False)
+    return saved
+
+
+async def save_book_batches(db, pending, batch_size=DEFAULT_BATCH_SIZE, on_conflict=None):
+    """
+    Save validated rows batch by batch, one transaction per batch
+
+    A batch the database rejects is retried row by row, so a bad row only fails itself.
+
+    Args:
+        db: AsyncSession
+        pending: list of (row number, Book column values), all with the same keys
+        batch_size: rows per INSERT and per transaction
+        on_conflict: None or one of ON_CONFLICT_MODES, see save_books
+
+    Returns:
+        (saved, errors): the combined save_books results of the batches and
+        [{"row", "error"}] for the rows that could not be saved or conflict
+    """
+    saved = {"inserted": [], "updated": [], "before": [], "skipped": [], "conflicts": [], "ids": {}}
+    errors = []
+
+    def collect(batch_saved):
+        for key, items in batch_saved.items():
+            if key == 'ids':
+                saved[key].update(items)
+            else:
+                saved[key].extend(items)
+        errors.extend({'row': row_num, 'error': message} for row_num, message in batch_saved['conflicts'])
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        try:
+            batch_saved = await save_books(db, batch, on_conflict)
+            await db.commit()
+            collect(batch_saved)
+            continue
+        except Exception:
+            await db.rollback()
+        for row_num, values in batch:
+            try:
+                batch_saved = await save_books(db, [(row_num, values)], on_conflict)
+                await db.commit()
+                collect(batch_saved)
+            except Exception as e:
+                await db.rollback()
+                errors.append({'row': row_num, 'error': str(e)})
+    return saved, errors
+
+
+async def books_imported(books, updated=(), before=()):
+    """
+    Bring the search caches and trigrams up to date with imported books, after the commit
+
+    Args:
+        books: rows of the inserted books, see save_books
+        updated: rows of the books merged into or replaced
+        before: snapshots of the updated books from before the change
+    """
+    snapshots = [{field: getattr(book, field) for field in SNAPSHOT_FIELDS} for book in [*books, *updated]]
+    before = list(before)
+    await search_cache.invalidate_books(before + snapshots)
+    suggest_index.update(removed=before, added=snapshots)
+    indexed = {snapshot['id']: (snapshot['title'], snapshot['author']) for snapshot in before}
+    trigram_filler.add(
+        snapshot['id'] for snapshot in snapshots if indexed.get(snapshot['id']) != (snapshot['title'], snapshot['author'])
+    )
+
+
+async def save_book_items(db, items, batch_size=DEFAULT_BATCH_SIZE, on_conflict=None):
+    """
+    Save a stream of books batch by batch as they arrive, one transaction per batch
+
+    Args:
+        db: AsyncSession
+        items: async iterator of (index, Book column values or an error message), the
+            values all with the same keys and owner
+        batch_size: items per INSERT and per transaction
+        on_conflict: None or one of ON_CONFLICT_MODES, see save_books
+
+    Yields:
+        per item, once its batch is committed: {"index", "status", "id"} with status
+        "created" or "updated", {"index", "status": "skipped"} or
+        {"index", "status": "error", "error"}
+    """
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            for result in await _save_item_batch(db, batch, on_conflict):
+                yield result
+            batch = []
+    if batch:
+        for result in await _save_item_batch(db, batch, on_conflict):
+            yield result
+
+
+async def _save_item_batch(db, batch, on_conflict):
+    pending = [(index, values) for index, values in batch if isinstance(values, dict)]
+    saved, errors = await save_book_batches(db, pending, len(pending) or 1, on_conflict)
+    await books_imported(saved['inserted'], saved['updated'], saved['before'])
+    errors = {error['row']: error['error'] for error in errors}
+    skipped = set(saved['skipped'])
+    updated = {book.id for book in saved['updated']}
+    results = []
+    for index, values in batch:
+        if not isinstance(values, dict):
+            results.append({'index': index, 'status': 'error', 'error': values})
+        elif index in errors:
+            results.append({'index': index, 'status': 'error', 'error': errors[index]})
+        elif index in skipped:
+            results.append({'index': index, 'status': 'skipped'})
+        else:
+            book_id = saved['ids'][index]
+            results.append({'index': index, 'status': 'updated' if book_id in updated else 'created', 'id': book_id})
+    return results
+
+
+async def _read_chunk(rows, batch_size, imported, checkpoint):
+    # a file that turns out unreadable part way (a broken workbook, bytes that are not
+    # UTF-8, malformed CSV) stops the import like a failed chunk
+    try:
+        return await asyncio.to_thread(lambda: list(islice(rows, batch_size)))
+    except (XlsxReadError, UnicodeDecodeError, csv.Error) as e:
+        raise BookImportError(f"rows after {checkpoint} could not be read: {e}", imported, checkpoint)
+
+
+async def import_book_rows(db, rows, owner_id, batch_size=DEFAULT_BATCH_SIZE, resume_from=0, on_chunk=None,
+                           on_conflict=None):
+    """
+    Import rows chunk by chunk, committing each chunk
+
+    Parsing runs in a worker thread so reading the upload does not block the event loop.
+
+    Args:
+        db: AsyncSession
+        rows: iterator of (row number, {column: value}), see read_csv_rows / read_xlsx_rows
+        owner_id: seller the books belong to
+        batch_size: rows per chunk and per transaction
+        resume_from: skip rows up to and including this row number (a previous checkpoint)
+        on_chunk: optional coroutine function called with the result so far after every
+            committed chunk; an exception it raises stops the import
+        on_conflict: None or one of ON_CONFLICT_MODES, for rows whose ISBN is already listed
+
+    Returns:
+        {"imported", "updated", "skipped", "processed", "checkpoint", "errors", "error_count"}
+        where checkpoint is the last row number covered by a committed chunk
+
+    Raises:
+        BookImportError: if reading or writing a chunk failed; earlier chunks stay committed
+    """
+    result = {"imported": 0, "updated": 0, "skipped": 0, "processed": 0, "checkpoint": resume_from,
+              "errors": [], "error_count": 0}
+
+    def error(row_num, title, message):
+        result['error_count'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'row': row_num, 'title': title, 'message': message})
+
+    while True:
+        chunk = await _read_chunk(rows, batch_size, result['imported'], result['checkpoint'])
+        if not chunk:
+            break
+        pending = []
+        titles = {}
+        for row_num, row in chunk:
+            if row_num <= resume_from:
+                continue
+            result['processed'] += 1
+            titles[row_num] = row.get('title')
+            try:
+                pending.append((row_num, parse_book_row(row, owner_id)))
+            except Exception as row_err:
+                error(row_num, row.get('title'), str(row_err))
+        try:
+            saved = await save_books(db, pending, on_conflict)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            raise BookImportError(
+                f"rows {chunk[0][0]}-{chunk[-1][0]} could not be saved: {e}", result['imported'], result['checkpoint']
+            )
+        await books_imported(saved['inserted'], saved['updated'], saved['before'])
+        for row_num, message in saved['conflicts']:
+            error(row_num, titles[row_num], message)
+        result['imported'] += len(saved['inserted'])
+        result['updated'] += len(saved['updated'])
+        result['skipped'] += len(saved['skipped'])
+        result['checkpoint'] = max(result['checkpoint'], chunk[-1][0])
+        if on_chunk:
+            await on_chunk(result)
+    return result
+
+
+def _excel_match(row_num, values, row, listing, score):
+    # an import row that looks like an existing listing, for the seller to decide on
+    return {
+        'row': row_num,
+        'title': values['title'],
+        'suggested': {
+            'id': listing.id,
+            'title': listing.title,
+            'author': listing.author,
+            'stock': listing.stock,
+            'score': round(score, 2)
+        },
+        'row_data': {
+            'price': values['price'],
+            'stock': values['stock'],
+            'is_for_sale': values['is_for_sale'],
+            'is_for_rent': values['is_for_rent'],
+            'weekly_fee': values['weekly_fee'],
+            'rental_duration': values.get('rental_duration'),
+            'status': values['status'].value if values.get('status') else None,
+            'condition': row.get('condition'),
+            'tags': row.get('tags'),
+            'description': row.get('description'),
+            'isbn': row.get('isbn')
+        }
+    }
+
+
+async def import_excel_rows(db, rows, owner_id, batch_size=EXCEL_BATCH_SIZE, resume_from=0,
+                            listing_id_limit=None, on_chunk=None, on_conflict=None):
+    """
+    Import /import-excel rows chunk by chunk, committing each chunk
+
+    Rows whose title looks like one of the seller's existing listings are not inserted
+    but returned as matches (see TitleMatcher). With an on_conflict mode, rows with an
+    ISBN are matched on it instead: they are saved and merged as save_books does.
+
+    Args:
+        db: AsyncSession
+        rows: iterator of (row number, {column: value}), see read_excel_sheet
+        owner_id: seller the books belong to
+        batch_size: rows per chunk and per transaction
+        resume_from: skip rows up to and including this row number (a previous checkpoint)
+        listing_id_limit: only match listings with an id up to this, so a resumed import
+            does not match the rows it inserted itself
+        on_chunk: optional coroutine function called with the result so far after every
+            committed chunk; an exception it raises stops the import
+        on_conflict: None or one of ON_CONFLICT_MODES, for rows whose ISBN is already listed
+
+    Returns:
+        {"created", "updated", "skipped", "processed", "checkpoint", "matches", "errors"}
+
+    Raises:
+        BookImportError: if the workbook could not be read past some row; earlier chunks
+            stay committed
+    """
+    query = select(Book.id, Book.title, Book.author, Book.stock).where(Book.owner_id == owner_id).order_by(Book.id)
+    if listing_id_limit is not None:
+        query = query.where(Book.id <= listing_id_limit)
+    matcher = TitleMatcher((await db.execute(query)).all())
+
+    result = {"created": 0, "updated": 0, "skipped": 0, "processed": 0, "checkpoint": resume_from,
+              "matches": [], "errors": []}
+    rows = iter(rows)
+    while True:
+        chunk = await _read_chunk(rows, batch_size, result['created'], result['checkpoint'])
+        if not chunk:
+            break
+        errors = []
+        pending = []  # (row number, Book column values) of the rows to insert
+        for row_num, row in chunk:
+            if row_num <= resume_from:
+                continue
+            result['processed'] += 1
+            try:
+                values = parse_excel_row(row, owner_id)
+                keyed = on_conflict and values['isbn_normalized']
+                match = None if keyed else matcher.match(values['title'])
+                if match:
+                    result['matches'].append(_excel_match(row_num, values, row, *match))
+                else:
+                    pending.append((row_num, values))
+            except Exception as e:
+                errors.append({'row': row_num, 'error': str(e)})
+
+        saved, save_errors = await save_book_batches(db, pending, batch_size, on_conflict)
+        result['errors'].extend(sorted(errors + save_errors, key=lambda error: error['row']))
+        await books_imported(saved['inserted'], saved['updated'], saved['before'])
+        result['created'] += len(saved['inserted'])
+        result['updated'] += len(saved['updated'])
+        result['skipped'] += len(saved['skipped'])
+        result['checkpoint'] = max(result['checkpoint'], chunk[-1][0])
+        if on_chunk:
+            await on_chunk(result)
+    return result
+
+
+async def apply_match_resolutions(db, resolutions, owner_id):
+    """
+    Apply the seller's decisions on /import-excel matches in one transaction
+
+    A merge adds the row's stock to the suggested listing, a create inserts the row as
+    /import-excel would have, a skip does nothing. All merges are one executemany UPDATE
+    and the creates are batched INSERTs (see save_books), so the number of statements does
+    not grow with the number of resolutions. Invalid resolutions only fail themselves.
+
+    Args:
+        db: AsyncSession
+        resolutions: [{"row", "action", "book_id", "title", "row_data"}], action being
+            "merge", "create" or "skip"; book_id and row_data as in the match
+        owner_id: seller applying them; merges into other sellers' books fail
+
+    Returns:
+        (outcomes, saved, merged_ids): {"row", "action", "status"} per resolution in the
+        order given, with "book_id" for merges and creates, "stock" for merges and "error"
+        when the status is "error"; the save_books result of the creates and the ids of the merged listings,
+        for the caches to be updated after the commit
+    """
+    outcomes = []
+    merges = {}  # outcome index -> (book id, stock to add)
+    creates = {}  # row number -> outcome index
+    pending = []
+    seen = set()
+    for resolution in resolutions:
+        row_num, action = resolution['row'], resolution['action']
+        outcome = {'row': row_num, 'action': action, 'status': 'skipped'}
+        outcomes.append(outcome)
+        row_data = resolution.get('row_data') or {}
+        if row_num in seen:
+            outcome.update(status='error', error=f'row {row_num} is resolved more than once')
+            continue
+        seen.add(row_num)
+        if action == 'merge':
+            if resolution.get('book_id') is None:
+                outcome.update(status='error', error='merge needs the book_id of the listing')
+                continue
+            try:
+                stock = int(row_data.get('stock') or 1)
+            except Exception:
+                stock = 1  # as parse_excel_row does
+            merges[len(outcomes) - 1] = (resolution['book_id'], stock)
+        elif action == 'create':
+            try:
+                pending.append((row_num, parse_excel_row({**row_data, 'title': resolution.get('title')}, owner_id)))
+                creates[row_num] = len(outcomes) - 1
+            except Exception as e:
+                outcome.update(status='error', error=str(e))
+
+    merged_ids = set()
+    if merges:
+        table = Book.__table__
+        book_ids = {book_id for book_id, _ in merges.values()}
+        owned = set((await db.execute(
+            select(table.c.id).where(table.c.id.in_(book_ids), table.c.owner_id == owner_id)
+        )).scalars())
+        added = {}  # book id -> total stock to add
+        for index, (book_id, stock) in merges.items():
+            if book_id in owned:
+                added[book_id] = added.get(book_id, 0) + stock
+            else:
+                outcomes[index].update(status='error', error=f'book {book_id} not found')
+        if added:
+            await db.execute(
+                update(table).where(table.c.id == bindparam('book_id')).values(stock=table.c.stock + bindparam('added')),
+                [{'book_id': book_id, 'added': stock} for book_id, stock in added.items()]
+            )
+            stocks = dict((await db.execute(select(table.c.id, table.c.stock).where(table.c.id.in_(added)))).all())
+            for index, (book_id, _) in merges.items():
+                if book_id in added:
+                    outcomes[index].update(status='merged', book_id=book_id, stock=stocks[book_id])
+            merged_ids = set(added)
+
+    saved = {"inserted": [], "updated": [], "before": [], "skipped": [], "conflicts": [], "ids": {}}
+    for start in range(0, len(pending), EXCEL_BATCH_SIZE):
+        batch_saved = await save_books(db, pending[start:start + EXCEL_BATCH_SIZE])
+        for key, items in batch_saved.items():
+            if key == 'ids':
+                saved[key].update(items)
+            else:
+                saved[key].extend(items)
+    conflicts = dict(saved['conflicts'])
+    for row_num, index in creates.items():
+        if row_num in conflicts:
+            outcomes[index].update(status='error', error=conflicts[row_num])
+        else:
+            outcomes[index].update(status='created', book_id=saved['ids'][row_num])
+    return outcomes, saved, merged_ids
@@ -0,0 +1,256 @@
+"""
+Book Index Service
+Keeps the derived search structures of books in step with the books table.
+Call index_books after books are inserted or their searchable fields change,
+and unindex_books when books are deleted.
+
+Imports leave the trigrams out of their transactions and hand the books to
+trigram_filler once a batch has committed, see TrigramFiller.
+"""
+import asyncio
+import re
+import time
+from sqlalchemy import delete, exists, insert, inspect, select
+
+from database import AsyncSessionLocal
+from models import Book, BookTag, BookTrigram
+
+TRIGRAM_FIELDS = ("title", "author")
+THREADED_BATCH = 200  # batches of at least this many books compute their trigrams in a worker thread
+UNINDEX_CHUNK = 10000  # book ids per DELETE in unindex_books
+TRIGRAM_FILL_CHUNK = 2000  # books per transaction of the deferred trigram fill
+TRIGRAM_FILL_DELAY = 1.0  # seconds without new imports before the fill starts
+TRIGRAM_FILL_MAX_DELAY = 30.0  # ... but no book waits longer than this for it
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def parse_tags(value):
+    """
+    Split a comma-separated tag string into normalized tags
+
+    Tags are trimmed, lower-cased and de-duplicated, so "Fiction,  fiction , Non-Fiction"
+    gives ["fiction", "non-fiction"].
+    """
+    tags = []
+    for raw in str(value or "").split(","):
+        tag = _SPACE_RE.sub(" ", raw).strip().lower()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def tag_rows(book):
+    """BookTag rows (as dicts) for a book or any object with id/tags"""
+    return [{"book_id": book.id, "tag": tag} for tag in parse_tags(getattr(book, "tags", None))]
+
+
+def normalize_isbn(value):
+    """
+    Canonical ISBN-13 of an ISBN as sellers type it, or None if it is not shaped like one
+
+    Separators are dropped and ISBN-10s converted, so "0-306-40615-2", "0306406152" and
+    "978-0-306-40615-7" all give "9780306406157". Numbers read from spreadsheets
+    ("9780306406157.0") are accepted too.
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = re.sub(r"\.0+$", "", str(value or "").strip())
+    digits = re.sub(r"[\s-]", "", text).upper()
+    if re.fullmatch(r"\d{13}", digits):
+        return digits
+    if re.fullmatch(r"\d{9}[\dX]", digits):
+        body = "978" + digits[:9]
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body)) % 10) % 10
+        return body + str(check)
+    return None
+
+
+def trigrams(value):
+    """
+    Trigram set of a string, computed the same way as PostgreSQL's pg_trgm
+
+    Words are lower-cased and padded with two spaces in front and one behind,
+    so "Bond" gives {"  b", " bo", "bon", "ond", "nd "}.
+    """
+    result = set()
+    for word in _WORD_RE.findall((value or "").lower()):
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def trigram_rows(book):
+    """BookTrigram rows (as dicts) for a book or any object with id/title/author"""
+    rows = []
+    for field in TRIGRAM_FIELDS:
+        rows.extend(
+            {"trigram": gram, "book_id": book.id, "field": field}
+            for gram in trigrams(getattr(book, field, None))
+        )
+    return rows
+
+
+async def index_books(db, books, new=False, with_trigrams=True):
+    """
+    Refresh the derived indexes for books that were inserted or changed
+
+    Args:
+        db: AsyncSession, books must already be flushed so they have ids
+        books: Book objects or rows with the Book columns as attributes
+        new: the books were just inserted, so there are no old entries to clear
+        with_trigrams: False leaves the trigrams to trigram_filler, for imports
+    """
+    books = list(books)
+    if not books:
+        return
+    book_ids = [book.id for book in books]
+
+    # Core inserts on the tables: plain executemany, without the ORM's per-row bookkeeping
+    if not new:
+        await db.execute(delete(BookTag).where(BookTag.book_id.in_(book_ids)))
+    rows = [row for book in books for row in tag_rows(book)]
+    if rows:
+        await db.execute(insert(BookTag.__table__), rows)
+
+    if with_trigrams and db.bind.dialect.name == "sqlite":
+        await _write_trigrams(db, books, new)
+
+
+async def _write_trigrams(db, books, new):
+    if not new:
+        await db.execute(delete(BookTrigram).where(BookTrigram.book_id.in_([book.id for book in books])))
+    # tens of rows per book, so they go straight to the driver's executemany as tuples
+    def build():
+        return [
+            (gram, book.id, field)
+            for book in books for field in TRIGRAM_FIELDS for gram in trigrams(getattr(book, field, None))
+        ]
+    # computing them for an import batch takes long enough to stall other requests
+    rows = await asyncio.to_thread(build) if len(books) >= THREADED_BATCH else build()
+    if rows:
+        conn = await db.connection()
+        await conn.exec_driver_sql(
+            f"INSERT INTO {BookTrigram.__tablename__} (trigram, book_id, field) VALUES (?, ?, ?)", rows
+        )
+
+
+class TrigramFiller:
+    """
+    Writes the trigrams of imported books after their batches committed (SQLite only)
+
+    add() queues book ids and one task per process indexes them in chunks, reading each
+    book again so a later edit or delete wins. It starts once imports pause for
+    TRIGRAM_FILL_DELAY: on a busy database it would only slow their next batches down.
+    Until then the books are only missing from fuzzy search. Books a stopped process
+    never got to are filled by backfill_trigrams on the next startup.
+    """
+
+    def __init__(self, chunk=TRIGRAM_FILL_CHUNK, delay=TRIGRAM_FILL_DELAY, max_delay=TRIGRAM_FILL_MAX_DELAY):
+        self.chunk = chunk
+        self.delay = delay
+        self.max_delay = max_delay
+        self._pending = set()
+        self._queued_at = self._added_at = 0.0
+        self._hurry = False
+        self._task = None
+
+    def add(self, book_ids):
+        now = time.monotonic()
+        if not self._pending:
+            self._queued_at = now
+        self._added_at = now
+        self._pending.update(book_ids)
+        if self._pending and (self._task is None or self._task.done()):
+            self._hurry = False
+            self._task = asyncio.create_task(self._run())
+
+    async def wait(self):
+        """Index every queued book now and return once done, e.g. on shutdown"""
+        self._hurry = True
+        if self._task is not None:
+            await self._task
+
+    async def _run(self):
+        while self._pending:
+            start = min(self._added_at + self.delay, self._queued_at + self.max_delay)
+            if not self._hurry and time.monotonic() < start:
+                await asyncio.sleep(min(start - time.monotonic(), 0.1))
+                continue
+            book_ids = [self._pending.pop() for _ in range(min(self.chunk, len(self._pending)))]
+            try:
+                async with AsyncSessionLocal() as db:
+                    if db.bind.dialect.name != "sqlite":
+                        self._pending.clear()
+                        return
+                    books = (await db.execute(
+                        select(Book.id, Book.title, Book.author).where(Book.id.in_(book_ids))
+                    )).all()
+                    await _write_trigrams(db, books, new=False)
+                    await db.commit()
+            except Exception as e:
+                print(f"Warning: trigram fill of {len(book_ids)} books failed, left to the next startup: {e}")
+
+
+trigram_filler = TrigramFiller()
+
+
+async def unindex_books(db, book_ids):
+    """Drop the derived index entries of books that are about to be deleted (or just were)"""
+    book_ids = list(book_ids)
+    # in chunks, the drivers cap the number of bound parameters
+    for start in range(0, len(book_ids), UNINDEX_CHUNK):
+        chunk = book_ids[start:start + UNINDEX_CHUNK]
+        await db.execute(delete(BookTag).where(BookTag.book_id.in_(chunk)))
+        if db.bind.dialect.name == "sqlite":
+            await db.execute(delete(BookTrigram).where(BookTrigram.book_id.in_(chunk)))
+
+
+def _backfill(sync_conn, model, columns, rows_of, batch_size, missing=None):
+    # fill an empty side table from the existing books, batch by batch; or with a
+    # missing clause, fill the books it selects whatever the table holds
+    if missing is None and sync_conn.execute(select(model).limit(1)).first():
+        return
+    query = select(Book.id, *columns)
+    if missing is not None:
+        query = query.where(missing)
+    result = sync_conn.execute(query)
+    while True:
+        books = result.fetchmany(batch_size)
+        if not books:
+            break
+        rows = [row for book in books for row in rows_of(book)]
+        if rows:
+            sync_conn.execute(insert(model), rows)
+
+
+def backfill_trigrams(sync_conn, batch_size=1000):
+    """
+    Fill the trigrams of every book that has none (SQLite only)
+
+    On an empty table that is every book; afterwards it catches up with imported books
+    trigram_filler did not get to before the process stopped.
+    """
+    if sync_conn.dialect.name == "sqlite":
+        missing = ~exists().where(BookTrigram.book_id == Book.id)
+        _backfill(sync_conn, BookTrigram, [Book.title, Book.author], trigram_rows, batch_size, missing)
+
+
+def backfill_tags(sync_conn, batch_size=1000):
+    """Fill an empty book_tags table from the existing Book.tags strings"""
+    _backfill(sync_conn, BookTag, [Book.tags], tag_rows, batch_size)
+
+
+def backfill_book_index(sync_conn):
+    """
+    Fill every empty side table from the existing books (used with conn.run_sync on startup)
+
+    Tables a migration has not created yet are left out: the trigram migration calls this
+    before book_tags exists.
+    """
+    tables = set(inspect(sync_conn).get_table_names())
+    if BookTag.__tablename__ in tables:
+        backfill_tags(sync_conn)
+    if BookTrigram.__tablename__ in tables:
+        backfill_trigrams(sync_conn)
@@ -0,0 +1,296 @@
+"""
+Book Search Service
+Full-text search over Book.search_text: FTS5 on SQLite, tsvector/GIN on PostgreSQL
+Fuzzy title/author search: trigram side table on SQLite, pg_trgm on PostgreSQL
+"""
+import os
+import re
+from sqlalchemy import (
+    Float, String, and_, case, cast, column, func, literal, literal_column, select, table, text, union_all
+)
+
+from models import Book, BookTag, BookTrigram, User
+from services.book_index import backfill_book_index, trigrams
+from services.cache import TTLCache
+
+FTS_TABLE = "books_fts"
+
+# SQLite: external-content FTS5 table kept in sync with books by triggers,
+# so every write path (ORM, bulk inserts, raw SQL) is indexed automatically
+SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        search_text, content='books', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON books BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF search_text ON books BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, search_text) VALUES ('delete', old.id, old.search_text);
+        INSERT INTO {FTS_TABLE}(rowid, search_text) VALUES (new.id, new.search_text);
+    END""",
+]
+SQLITE_FTS_DROP = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# PostgreSQL: GIN expression index, the same expression is used in queries so the planner picks it up
+PG_TSVECTOR_SQL = "to_tsvector('simple', coalesce(books.search_text, ''))"
+POSTGRES_FTS_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_books_search_tsv ON books USING gin ({PG_TSVECTOR_SQL})",
+]
+POSTGRES_FTS_DROP = [
+    "DROP INDEX IF EXISTS ix_books_search_tsv",
+]
+
+# PostgreSQL: trigram GIN indexes serve the word_similarity operator (<%) used by fuzzy search
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_author_trgm ON books USING gin (author gin_trgm_ops)",
+]
+POSTGRES_TRGM_DROP = [
+    "DROP INDEX IF EXISTS ix_books_author_trgm",
+    "DROP INDEX IF EXISTS ix_books_title_trgm",
+]
+
+DEFAULT_MIN_SIMILARITY = 0.5
+
+# facets available on GET /api/books?facets=...
+FACETS = ("tags", "price_bucket", "city", "for_rent")
+# (bucket name, lower bound inclusive, upper bound exclusive), prices in rupees
+PRICE_BUCKETS = [
+    ("under_200", None, 200),
+    ("200_500", 200, 500),
+    ("500_1000", 500, 1000),
+    ("1000_plus", 1000, None),
+]
+FACET_VALUE_LIMIT = 20  # most frequent values returned per facet
+
+# popular filter combinations are served from here instead of re-aggregating
+facet_cache = TTLCache(
+    maxsize=int(os.getenv("FACET_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("FACET_CACHE_TTL", "30")),
+)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_search_text(title, author=None, tags=None, description=None):
+    """Combine the searchable fields of a book into Book.search_text"""
+    return f"{title} {author or ''} {tags or ''} {description or ''}".strip()
+
+
+def dialect_name(db):
+    """Name of the SQL dialect ("sqlite", "postgresql") behind an AsyncSession"""
+    return db.bind.dialect.name
+
+
+def ensure_search_index(sync_conn):
+    """
+    Create the full-text and trigram indexes if they are missing (used with conn.run_sync on startup)
+
+    A freshly created FTS table and empty tag/trigram tables are filled from the existing books.
+    """
+    name = sync_conn.dialect.name
+    if name == "sqlite":
+        exists = sync_conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first()
+        for ddl in SQLITE_FTS_DDL:
+            sync_conn.exec_driver_sql(ddl)
+        if not exists:
+            sync_conn.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    elif name == "postgresql":
+        for ddl in POSTGRES_FTS_DDL + POSTGRES_TRGM_DDL:
+            sync_conn.exec_driver_sql(ddl)
+    backfill_book_index(sync_conn)
+
+
+def search_tokens(q):
+    """Lower-cased word tokens of a user query"""
+    return _TOKEN_RE.findall((q or "").lower())
+
+
+def apply_text_search(query, dialect, q):
+    """
+    Restrict a select(Book) query to books matching q and compute a relevance rank
+
+    Every token must match, each as a prefix of some word, so the search works while
+    the user is still typing.
+
+    Args:
+        query: select() over Book
+        dialect: dialect name, see dialect_name()
+        q: raw user query
+
+    Returns:
+        (query, rank) where rank is a SQL expression, lower is more relevant,
+        or (query, None) if q contains no searchable tokens
+    """
+    tokens = search_tokens(q)
+    if not tokens:
+        return query, None
+
+    if dialect == "sqlite":
+        match = " ".join(f'"{token}"*' for token in tokens)
+        fts = table(FTS_TABLE, column("rowid"))
+        query = query.join(fts, fts.c.rowid == Book.id).where(
+            text(f"{FTS_TABLE} MATCH :fts_query").bindparams(fts_query=match)
+        )
+        # bm25() is negative, more negative is more relevant
+        rank = literal_column(f"bm25({FTS_TABLE})")
+        return query, rank
+
+    if dialect == "postgresql":
+        tsquery = func.to_tsquery("simple", " & ".join(f"{token}:*" for token in tokens))
+        tsvector = literal_column(PG_TSVECTOR_SQL)
+        query = query.where(tsvector.op("@@")(tsquery))
+        rank = -func.ts_rank_cd(tsvector, tsquery)
+        return query, rank
+
+    # Other databases: plain substring match, unranked
+    for token in tokens:
+        query = query.where(Book.search_text.ilike(f"%{token}%"))
+    return query, None
+
+
+async def apply_fuzzy_search(db, query, q, min_similarity=DEFAULT_MIN_SIMILARITY):
+    """
+    Restrict a select(Book) query to books whose title or author is similar to q
+
+    The score follows pg_trgm's word_similarity, roughly the share of the query's trigrams
+    found in the title or author, so "Ruskin Bonde" still finds "Ruskin Bond". Candidates come
+    from the trigram index only, nothing is compared row by row in Python.
+
+    Args:
+        db: AsyncSession (on PostgreSQL the similarity threshold is set for the transaction)
+        query: select() over Book
+        q: raw user query
+        min_similarity: 0..1, books scoring below it are dropped
+
+    Returns:
+        (query, rank) where rank is a SQL expression, lower is more similar,
+        or (query, None) if q is too short to produce trigrams
+    """
+    query_grams = trigrams(q)
+    if not query_grams:
+        return query, None
+
+    dialect = dialect_name(db)
+    if dialect == "postgresql":
+        await db.execute(
+            text("SELECT set_config('pg_trgm.word_similarity_threshold', :threshold, true)"),
+            {"threshold": str(min_similarity)},
+        )
+        q_literal = literal(q)
+        query = query.where(
+            q_literal.op("<%")(Book.title) | q_literal.op("<%")(Book.author)
+        )
+        rank = -func.greatest(
+            func.word_similarity(q_literal, Book.title),
+            func.word_similarity(q_literal, Book.author),
+        )
+        return query, rank
+
+    # SQLite: count shared trigrams per book and field straight from the trigram index
+    shared = (
+        select(BookTrigram.book_id, func.count().label("shared"))
+        .where(BookTrigram.trigram.in_(sorted(query_grams)))
+        .group_by(BookTrigram.book_id, BookTrigram.field)
+        .subquery()
+    )
+    score = func.max(cast(shared.c.shared, Float) / len(query_grams))
+    scored = (
+        select(shared.c.book_id, score.label("score"))
+        .group_by(shared.c.book_id)
+        .having(score >= min_similarity)
+        .subquery()
+    )
+    query = query.join(scored, scored.c.book_id == Book.id)
+    return query, -scored.c.score
+
+
+def tag_filter(tags, match_all=True):
+    """
+    Condition selecting books carrying the given tags, served by the book_tags (tag, book_id) index
+
+    Args:
+        tags: normalized tags, see parse_tags()
+        match_all: require every tag (AND) instead of any of them (OR)
+    """
+    tagged = select(BookTag.book_id).where(BookTag.tag.in_(tags))
+    if match_all and len(tags) > 1:
+        tagged = tagged.group_by(BookTag.book_id).having(func.count() == len(tags))
+    return Book.id.in_(tagged)
+
+
+def _price_bucket(price):
+    whens = []
+    for name, low, high in PRICE_BUCKETS:
+        if low is None:
+            condition = price < high
+        elif high is None:
+            condition = price >= low
+        else:
+            condition = and_(price >= low, price < high)
+        whens.append((condition, name))
+    return case(*whens)
+
+
+async def facet_counts(db, query, facets):
+    """
+    Count the listings matched by a search per facet value, in a single statement
+
+    The filtered search is materialized once as a CTE and each facet is a GROUP BY
+    over it; the branches are combined with UNION ALL so the whole thing is one round trip.
+
+    Args:
+        db: AsyncSession
+        query: the filtered select(Book) of the search, before ordering and paging
+        facets: facet names from FACETS
+
+    Returns:
+        {facet: {value: count}}, values ordered by count, most frequent first
+    """
+    matched = query.cte("matched")
+    count = func.count().label("count")
+    branches = []
+    for facet in facets:
+        source = matched
+        if facet == "tags":
+            value = BookTag.tag
+            source = matched.join(BookTag, BookTag.book_id == matched.c.id)
+        elif facet == "price_bucket":
+            value = _price_bucket(matched.c.price)
+        elif facet == "city":
+            value = User.city
+            source = matched.join(User, User.id == matched.c.owner_id)
+        else:
+            value = matched.c.is_for_rent
+        ranked = (
+            select(value.label("value"), count)
+            .select_from(source)
+            .where(value.isnot(None))
+            .group_by(value)
+            .order_by(count.desc())
+            .limit(FACET_VALUE_LIMIT)
+            .subquery()
+        )
+        branches.append(select(
+            literal(facet).label("facet"), cast(ranked.c.value, String).label("value"), ranked.c.count
+        ))
+
+    result = await db.execute(union_all(*branches))
+    counts = {facet: {} for facet in facets}
+    for facet, value, n in result.all():
+        if facet == "for_rent":
+            value = "true" if value in ("1", "true", "t") else "false"
+        counts[facet][value] = n
+    return {facet: dict(sorted(values.items(), key=lambda item: -item[1])) for facet, values in counts.items()}
@@ -0,0 +1,127 @@
+"""
+Geo Service
+Geohash cells for "books near me" search: sellers are found through range scans
+on the indexed users.geohash column, then trimmed with a bounding box
+"""
+import math
+
+from sqlalchemy import and_, or_
+
+KM_PER_DEGREE = 111.32  # length of one degree of latitude
+GEOHASH_PRECISION = 8  # stored precision, cells of about 38 m x 19 m
+MAX_RADIUS_KM = 500.0
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point, or None if either coordinate is missing"""
+    if latitude is None or longitude is None:
+        return None
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves longitude and latitude bits, longitude first
+    while len(chars) < precision:
+        value, bounds = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(height, width) of a geohash cell in degrees"""
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(min_lat, max_lat, min_lng, max_lng) of the square around a circle"""
+    lat_delta = radius_km / KM_PER_DEGREE
+    lng_delta = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return latitude - lat_delta, latitude + lat_delta, longitude - lng_delta, longitude + lng_delta
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    Geohash prefixes whose cells together cover the circle's bounding box
+
+    The precision is the finest one whose cells are still at least as large as the
+    box, so the box overlaps at most 2 x 2 cells.
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(candidate)
+        if height >= max_lat - min_lat and width >= max_lng - min_lng:
+            precision = candidate
+            break
+    height, width = cell_size(precision)
+    cells = set()
+    lat = min_lat
+    while True:
+        lng = min_lng
+        while True:
+            cells.add(encode_geohash(max(min(lat, 90.0), -90.0), max(min(lng, 180.0), -180.0), precision))
+            if lng >= max_lng:
+                break
+            lng = min(lng + width, max_lng)
+        if lat >= max_lat:
+            break
+        lat = min(lat + height, max_lat)
+    return sorted(cells)
+
+
+def near_filter(geohash_column, latitude_column, longitude_column, latitude, longitude, radius_km):
+    """
+    Index-friendly prefilter for points within radius_km: geohash prefix ranges plus bounding box
+    """
+    min_lat, max_lat, min_lng, max_lng = bounding_box(latitude, longitude, radius_km)
+    # a prefix match is the range [prefix, prefix + "~"), "~" sorts after every geohash character
+    cells = or_(*[
+        and_(geohash_column >= cell, geohash_column < cell + "~")
+        for cell in covering_cells(latitude, longitude, radius_km)
+    ])
+    return and_(
+        cells,
+        latitude_column.between(min_lat, max_lat),
+        longitude_column.between(min_lng, max_lng),
+    )
+
+
+def squared_distance(latitude_column, longitude_column, latitude, longitude):
+    """
+    Squared equirectangular distance in degrees of latitude, as a SQL expression
+
+    Plain arithmetic (no trigonometry in SQL) and accurate to well under 1% at city scale.
+    Convert with distance_km().
+    """
+    lng_scale = math.cos(math.radians(latitude))
+    d_lat = latitude_column - latitude
+    d_lng = (longitude_column - longitude) * lng_scale
+    return d_lat * d_lat + d_lng * d_lng
+
+
+def distance_km(squared):
+    """Kilometres for a squared_distance() value"""
+    return round(math.sqrt(squared) * KM_PER_DEGREE, 3)
+
+
+def max_squared_distance(radius_km):
+    """squared_distance() bound for a radius in km"""
+    return (radius_km / KM_PER_DEGREE) ** 2
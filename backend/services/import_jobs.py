@@ -0,0 +1,321 @@
+"""
+Background Import Jobs
+Large /import and /import-excel uploads run outside the request: the upload is saved to
+IMPORT_JOB_DIR, an import_jobs row is queued and the request returns its id right away.
+
+Every process runs IMPORT_JOB_WORKERS workers that claim queued jobs from the table with
+a conditional UPDATE, so several processes can share the queue. A running job records
+its checkpoint and progress after every committed chunk, and its worker refreshes the
+heartbeat every HEARTBEAT_INTERVAL however long a chunk takes. A process shutting down
+puts its running jobs back in the queue at once; if it dies instead, the job stops
+heartbeating and after STALE_AFTER any worker requeues it. Either way the job resumes
+from the checkpoint.
+"""
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import func, select, update
+
+from database import AsyncSessionLocal
+from models import Book, ImportJob
+from services.book_import import (
+    MAX_REPORTED_ERRORS, BookImportError, import_book_rows, import_excel_rows, read_csv_rows, read_excel_sheet,
+    read_xlsx_rows
+)
+
+IMPORT_JOB_WORKERS = int(os.getenv("IMPORT_JOB_WORKERS", "2"))
+IMPORT_JOB_DIR = os.getenv("IMPORT_JOB_DIR") or os.path.join(tempfile.gettempdir(), "readar-imports")
+POLL_INTERVAL = 5.0  # seconds between looks at the queue when idle
+HEARTBEAT_INTERVAL = 15.0  # seconds between heartbeats of a running job
+STALE_AFTER = timedelta(seconds=4 * HEARTBEAT_INTERVAL)  # a running job without a heartbeat for this long has lost its worker
+
+FINISHED = ("completed", "failed", "cancelled")
+
+
+class ImportCancelled(Exception):
+    """The owner cancelled the job, raised between chunks"""
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def save_upload(upload, job_name):
+    """Copy an UploadFile to IMPORT_JOB_DIR and return the path, blocking"""
+    os.makedirs(IMPORT_JOB_DIR, exist_ok=True)
+    suffix = os.path.splitext(upload.filename or "")[1]
+    fd, path = tempfile.mkstemp(prefix=f"{job_name}-", suffix=suffix, dir=IMPORT_JOB_DIR)
+    with os.fdopen(fd, "wb") as out:
+        upload.file.seek(0)
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+    return path
+
+
+def _remove_file(path):
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def job_status(job):
+    """Response body for an ImportJob"""
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "filename": job.filename,
+        "status": job.status,
+        "cancel_requested": bool(job.cancel_requested),
+        "rows_processed": job.rows_processed or 0,
+        "inserted": job.inserted or 0,
+        "updated": job.updated or 0,
+        "skipped": job.skipped or 0,
+        "matched": job.matched or 0,
+        "error_count": job.error_count or 0,
+        "errors": json.loads(job.errors) if job.errors else [],
+        "checkpoint": job.checkpoint or 0,
+        "message": job.message,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+async def enqueue_import(db, upload, owner_id, kind, batch_size, on_conflict=None):
+    """
+    Save an upload and queue a job for it
+
+    Args:
+        db: AsyncSession
+        upload: the UploadFile
+        owner_id: seller the books will belong to
+        kind: "books" for /import rows, "excel" for /import-excel rows
+        batch_size: rows per chunk and per transaction
+        on_conflict: None or one of ON_CONFLICT_MODES, for rows whose ISBN is already listed
+
+    Returns:
+        the committed ImportJob
+    """
+    path = await asyncio.to_thread(save_upload, upload, f"{kind}-{owner_id}")
+    job = ImportJob(owner_id=owner_id, kind=kind, filename=upload.filename, file_path=path,
+                    batch_size=batch_size, on_conflict=on_conflict, status="queued")
+    db.add(job)
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        _remove_file(path)
+        raise
+    import_job_runner.notify()
+    return job
+
+
+async def cancel_import(db, job):
+    """Cancel a queued job at once, or ask a running one to stop after its current chunk"""
+    path = job.file_path
+    result = await db.execute(
+        update(ImportJob)
+        .where(ImportJob.id == job.id, ImportJob.status == "queued")
+        .values(status="cancelled", message="cancelled before it started", finished_at=_now(), file_path=None)
+    )
+    if result.rowcount:
+        await db.commit()
+        _remove_file(path)
+    elif job.status == "running":
+        await db.execute(update(ImportJob).where(ImportJob.id == job.id).values(cancel_requested=True))
+        await db.commit()
+    await db.refresh(job)
+    return job
+
+
+class ImportJobRunner:
+    """Bounded pool of workers running queued import jobs, see the module docstring"""
+
+    def __init__(self, workers=IMPORT_JOB_WORKERS):
+        self.workers = workers
+        self._tasks = []
+        self._wake = asyncio.Event()
+        self._running = set()  # ids of the jobs this process's workers are running
+
+    def start(self):
+        if not self._tasks:
+            self._wake = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # an interrupted job keeps its checkpoint, requeued here it resumes in the next process
+        running = list(self._running)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if running:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ImportJob)
+                        .where(ImportJob.id.in_(running), ImportJob.status == "running")
+                        .values(status="queued")
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"Could not requeue import jobs {running}: {e}")
+
+    def notify(self):
+        """Wake the idle workers, a job was queued"""
+        self._wake.set()
+
+    async def _worker(self):
+        while True:
+            try:
+                job_id = await self._claim()
+            except Exception as e:
+                print(f"Import job queue unavailable: {e}")
+                job_id = None
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                continue
+            self._running.add(job_id)
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            try:
+                await run_import_job(job_id)
+            except Exception as e:
+                print(f"Import job {job_id} crashed: {e}")
+            finally:
+                heartbeat.cancel()
+                self._running.discard(job_id)
+
+    async def _heartbeat(self, job_id):
+        # chunks commit their own heartbeat too, this one covers a slow chunk
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await db.execute(
+                        update(ImportJob)
+                        .where(ImportJob.id == job_id, ImportJob.status == "running")
+                        .values(heartbeat_at=_now())
+                    )
+                    await db.commit()
+            except Exception as e:
+                print(f"Import job {job_id} heartbeat failed: {e}")
+
+    async def _claim(self):
+        # the oldest queued job, taken with a conditional UPDATE so only one worker gets it
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(ImportJob)
+                .where(ImportJob.status == "running", ImportJob.heartbeat_at < _now() - STALE_AFTER)
+                .values(status="queued")
+            )
+            await db.commit()
+            while True:
+                job_id = await db.scalar(
+                    select(ImportJob.id).where(ImportJob.status == "queued").order_by(ImportJob.id).limit(1)
+                )
+                if job_id is None:
+                    return None
+                claimed = await db.execute(
+                    update(ImportJob)
+                    .where(ImportJob.id == job_id, ImportJob.status == "queued")
+                    .values(status="running", heartbeat_at=_now())
+                )
+                await db.commit()
+                if claimed.rowcount:
+                    return job_id
+
+
+async def run_import_job(job_id):
+    """Run (or resume) a claimed job to the end, recording its progress in the table"""
+    async with AsyncSessionLocal() as db:
+        job = await db.get(ImportJob, job_id)
+        path = job.file_path  # the updates below clear it on the job
+        # counts of the earlier runs of a resumed job
+        base = {
+            "rows_processed": job.rows_processed or 0,
+            "inserted": job.inserted or 0,
+            "updated": job.updated or 0,
+            "skipped": job.skipped or 0,
+            "errors": json.loads(job.errors) if job.errors else [],
+            "error_count": job.error_count or 0,
+            "matches": json.loads(job.matches) if job.matches else [],
+        }
+
+        async def record(progress, **values):
+            errors = base["errors"] + progress["errors"]
+            values.update(
+                rows_processed=base["rows_processed"] + progress["processed"],
+                inserted=base["inserted"] + progress.get("imported", progress.get("created", 0)),
+                updated=base["updated"] + progress.get("updated", 0),
+                skipped=base["skipped"] + progress.get("skipped", 0),
+                error_count=base["error_count"] + progress.get("error_count", len(progress["errors"])),
+                errors=json.dumps(errors[:MAX_REPORTED_ERRORS], default=str),
+                checkpoint=progress["checkpoint"],
+                heartbeat_at=_now(),
+            )
+            if "matches" in progress:
+                matches = base["matches"] + progress["matches"]
+                values.update(matched=len(matches), matches=json.dumps(matches, default=str))
+            await db.execute(update(ImportJob).where(ImportJob.id == job_id).values(**values))
+            await db.commit()
+
+        async def on_chunk(progress):
+            await record(progress)
+            if await db.scalar(select(ImportJob.cancel_requested).where(ImportJob.id == job_id)):
+                raise ImportCancelled()
+
+        progress = {"processed": 0, "checkpoint": job.checkpoint or 0, "errors": []}
+        if job.kind == "excel":
+            progress["matches"] = []
+        try:
+            if job.kind == "excel":
+                if job.listing_id_limit is None:
+                    job.listing_id_limit = await db.scalar(
+                        select(func.coalesce(func.max(Book.id), 0)).where(Book.owner_id == job.owner_id)
+                    )
+                    await db.commit()
+                progress = await import_excel_rows(
+                    db, read_excel_sheet(path), job.owner_id, job.batch_size, job.checkpoint or 0,
+                    job.listing_id_limit, on_chunk, job.on_conflict
+                )
+                message = f"created {progress['created']} books, {len(progress['matches'])} possible duplicates"
+            else:
+                with open(path, "rb") as f:
+                    rows = read_csv_rows(f) if path.endswith(".csv") else read_xlsx_rows(path)
+                    progress = await import_book_rows(
+                        db, rows, job.owner_id, job.batch_size, job.checkpoint or 0, on_chunk, job.on_conflict
+                    )
+                message = f"imported {progress['imported']} books"
+            await record(progress, status="completed", message=message, finished_at=_now(), file_path=None)
+        except ImportCancelled:
+            await db.execute(
+                update(ImportJob).where(ImportJob.id == job_id)
+                .values(status="cancelled", message="cancelled", finished_at=_now(), file_path=None)
+            )
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            if isinstance(e, HTTPException):
+                message = e.detail
+            elif isinstance(e, BookImportError):
+                message = f"import failed: {e}; {e.imported} books were imported in this run"
+            else:
+                message = f"import failed: {e}"
+            await db.execute(
+                update(ImportJob).where(ImportJob.id == job_id)
+                .values(status="failed", message=message, finished_at=_now(), file_path=None)
+            )
+            await db.commit()
+        _remove_file(path)
+
+
+import_job_runner = ImportJobRunner()
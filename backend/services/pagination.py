@@ -0,0 +1,100 @@
+"""
+Keyset Pagination
+Opaque cursors keyed on (sort key, id): each page seeks straight to its first row,
+so deep pages cost the same as the first one
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Generic, List, Optional, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, Generic[T]):
+    items: List[T]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= to get the next page, None on the last page
+
+
+def encode_cursor(values):
+    """Encode the sort key values of the last row of a page into an opaque cursor"""
+    payload = [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, key_count):
+    """Decode a cursor produced by encode_cursor, raising 400 if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, list) or len(payload) != key_count:
+            raise ValueError("wrong number of keys")
+        return [
+            datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v
+            for v in payload
+        ]
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def page_size(limit):
+    """Clamp a requested page size to 1..MAX_PAGE_SIZE"""
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _after(keys, values, descending):
+    # (k1, k2, ...) > (v1, v2, ...) expanded so both SQLite and PostgreSQL can use the index
+    clauses = []
+    for i, (key, value) in enumerate(zip(keys, values)):
+        step = key < value if descending else key > value
+        clauses.append(and_(*[k == v for k, v in zip(keys[:i], values[:i])], step))
+    return or_(*clauses)
+
+
+def apply_keyset(query, keys, cursor, limit, descending=False):
+    """
+    Order a query by keys and start it right after the cursor position
+
+    Args:
+        query: select() to paginate
+        keys: sort expressions, the last one must be unique (normally the primary key)
+        cursor: cursor from a previous page, or "" / None for the first page
+        limit: page size, one extra row is fetched to detect whether there is a next page
+        descending: sort every key descending instead of ascending
+
+    Returns:
+        the paginated query
+    """
+    if cursor:
+        query = query.where(_after(keys, decode_cursor(cursor, len(keys)), descending))
+    order = [key.desc() if descending else key.asc() for key in keys]
+    return query.order_by(*order).limit(limit + 1)
+
+
+def split_page(rows, limit, key_of):
+    """
+    Split the rows fetched by apply_keyset into the page and the cursor for the next one
+
+    Args:
+        rows: fetched rows (at most limit + 1)
+        limit: page size passed to apply_keyset
+        key_of: function returning the sort key values of a row
+
+    Returns:
+        (rows, next_cursor)
+    """
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key_of(rows[-1]))
@@ -0,0 +1,98 @@
+"""
+Password Hashing
+bcrypt runs on a bounded pool of worker threads instead of the event loop: a hash or a
+verification takes a few hundred milliseconds of CPU, which inline would stall every
+other request for as long. bcrypt releases the GIL while it works, so threads suffice.
+
+Admission control: at most PASSWORD_HASH_QUEUE jobs wait for a worker. Past that, logins
+and registrations are turned away with 503 and Retry-After at once, rather than queueing
+until they time out anyway.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "16"))  # jobs waiting for a worker
+RETRY_AFTER = 1  # seconds, suggested to clients turned away
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordHasher:
+    """bcrypt on a bounded thread pool with admission control, see the module docstring"""
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_queue=PASSWORD_HASH_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = None
+        self.pending = 0  # jobs running or waiting for a worker
+        self.completed = 0
+        self.rejected = 0
+        self.max_pending = 0
+        self.wait_total = 0.0  # seconds completed jobs waited for a worker
+        self.max_wait = 0.0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail="too many sign-ins in progress, try again shortly",
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+        submitted = time.perf_counter()
+
+        def job():
+            return time.perf_counter() - submitted, fn(*args)
+
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            waited, result = await asyncio.get_running_loop().run_in_executor(self._pool(), job)
+        finally:
+            self.pending -= 1
+        self.completed += 1
+        self.wait_total += waited
+        self.max_wait = max(self.max_wait, waited)
+        return result
+
+    async def hash(self, password):
+        """bcrypt hash of a password; raises HTTPException 503 when the queue is full"""
+        # bcrypt has a 72-byte limit, truncate if needed
+        return await self._run(pwd_context.hash, password[:72])
+
+    async def verify(self, password, hashed_password):
+        """Whether a password matches its hash; raises HTTPException 503 when the queue is full"""
+        return await self._run(pwd_context.verify, password[:72], hashed_password)
+
+    def stats(self):
+        running = min(self.pending, self.workers)
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "running": running,
+            "queued": self.pending - running,
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_total / self.completed * 1000, 1) if self.completed else None,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
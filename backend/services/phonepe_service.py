@@ -1,7 +1,31 @@
 """
 PhonePe Payment Gateway Service
 Handles payment creation, verification, and refunds using PhonePe SDK
+
+The SDK makes blocking HTTP calls, so they run on a bounded pool of worker threads and
+the event loop keeps serving other requests meanwhile. Every call is given at most
+PHONEPE_TIMEOUT seconds, queueing included; past that, or when PHONEPE_QUEUE calls are
+already waiting, it fails like any other gateway error ({"success": False, "error": ...}).
+A timed-out call may still complete at PhonePe: callers verify the order state later,
+and a refund retried with the same merchant_refund_id is not repeated.
+
+Status lookups go through a cache keyed on the merchant order id: concurrent lookups of
+an order share one upstream call, a pending state is reused for PHONEPE_STATUS_TTL
+seconds and a final one (COMPLETED or FAILED) until evicted. Payment pages poll the
+status from several tabs and retries; without it each poll is a gateway call, and
+PhonePe rate-limits them.
+
+PhonePe also reports order states to POST /api/payments/phonepe/webhook. Deliveries carry
+an Authorization header of SHA256(username:password), the credentials configured for
+the webhook on the PhonePe dashboard (PHONEPE_WEBHOOK_USERNAME / _PASSWORD); the final
+state they report is recorded in the status cache, so it costs no gateway call.
 """
+import asyncio
+import hashlib
+import hmac
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
 from phonepe.sdk.pg.payments.v2.standard_checkout_client import StandardCheckoutClient
 from phonepe.sdk.pg.payments.v2.models.request.standard_checkout_pay_request import StandardCheckoutPayRequest
@@ -10,6 +34,8 @@ from phonepe.sdk.pg.env import Env
 import os
 from dotenv import load_dotenv
 
+from services.cache import TTLCache
+
 load_dotenv()
 
 # PhonePe credentials
@@ -17,11 +43,21 @@ PHONEPE_CLIENT_ID = os.getenv("PHONEPE_CLIENT_ID", "M23P7LTLASNZZ_2511241620")
 PHONEPE_CLIENT_SECRET = os.getenv("PHONEPE_CLIENT_SECRET", "MDVmZjgwNTgtZDYwZS00ZTY5LWE2NjItZjZlYWMzNzQ3Nzdl")
 PHONEPE_CLIENT_VERSION = int(os.getenv("PHONEPE_CLIENT_VERSION", "1"))
 PHONEPE_ENV = os.getenv("PHONEPE_ENV", "SANDBOX")  # SANDBOX or PRODUCTION
+PHONEPE_WORKERS = int(os.getenv("PHONEPE_WORKERS", "8"))  # concurrent gateway calls
+PHONEPE_QUEUE = int(os.getenv("PHONEPE_QUEUE", "32"))  # calls waiting for a worker
+PHONEPE_TIMEOUT = float(os.getenv("PHONEPE_TIMEOUT", "10"))  # seconds per call, queueing included
+PHONEPE_STATUS_TTL = float(os.getenv("PHONEPE_STATUS_TTL", "5"))  # seconds a pending status is reused
+PHONEPE_STATUS_CACHE_SIZE = int(os.getenv("PHONEPE_STATUS_CACHE_SIZE", "4096"))
+FINAL_STATES = ("COMPLETED", "FAILED")  # order states that no longer change
+PHONEPE_WEBHOOK_USERNAME = os.getenv("PHONEPE_WEBHOOK_USERNAME")
+PHONEPE_WEBHOOK_PASSWORD = os.getenv("PHONEPE_WEBHOOK_PASSWORD")
 
 print(f"PhonePe Configuration Loaded:")
 print(f"  Client ID: {PHONEPE_CLIENT_ID}")
 print(f"  Client Version: {PHONEPE_CLIENT_VERSION}")
 print(f"  Environment: {PHONEPE_ENV}")
+if not (PHONEPE_WEBHOOK_USERNAME and PHONEPE_WEBHOOK_PASSWORD):
+    print("Warning: PHONEPE_WEBHOOK_USERNAME/PASSWORD not set; the PhonePe webhook rejects every delivery.")
 
 # Initialize PhonePe client
 def get_phonepe_client():
@@ -39,7 +75,7 @@ def get_phonepe_client():
     return client
 
 
-def create_payment_order(amount: float, redirect_url: str, merchant_order_id: str = None, metadata: dict = None):
+def _create_payment_order(amount: float, redirect_url: str, merchant_order_id: str = None, metadata: dict = None):
     """
     Create a PhonePe payment order
     
@@ -102,7 +138,7 @@ def create_payment_order(amount: float, redirect_url: str, merchant_order_id: st
         }
 
 
-def check_payment_status(merchant_order_id: str):
+def _check_payment_status(merchant_order_id: str):
     """
     Check payment status for an order
     
@@ -159,7 +195,7 @@ def check_payment_status(merchant_order_id: str):
         }
 
 
-def initiate_refund(merchant_order_id: str, refund_amount: float, merchant_refund_id: str = None):
+def _initiate_refund(merchant_order_id: str, refund_amount: float, merchant_refund_id: str = None):
     """
     Initiate a refund for a payment
     
@@ -201,3 +237,217 @@ def initiate_refund(merchant_order_id: str, refund_amount: float, merchant_refun
             "success": False,
             "error": str(e)
         }
+
+
+class PhonePeGateway:
+    """SDK calls on a bounded thread pool with per-call timeouts, see the module docstring"""
+
+    def __init__(self, workers=PHONEPE_WORKERS, max_queue=PHONEPE_QUEUE, timeout=PHONEPE_TIMEOUT):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        # calls holding or waiting for a worker; a timed-out call keeps its worker until
+        # the SDK returns, so this is counted from the threads, not from the callers
+        self.in_flight = 0
+        self.completed = 0
+        self.timed_out = 0
+        self.rejected = 0
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="phonepe")
+        return self._executor
+
+    def _finished(self, future):
+        with self._lock:
+            self.in_flight -= 1
+
+    async def call(self, fn, *args, **kwargs):
+        """Run a blocking gateway function; returns its result or a failure dict"""
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                return {"success": False, "error": "payment gateway busy, try again shortly"}
+            self.in_flight += 1
+        future = self._pool().submit(fn, *args, **kwargs)
+        future.add_done_callback(self._finished)
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            print(f"PhonePe {fn.__name__.lstrip('_')} timed out after {self.timeout}s")
+            return {"success": False, "error": f"PhonePe did not respond within {self.timeout:g} seconds"}
+        self.completed += 1
+        return result
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "timeout": self.timeout,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "timed_out": self.timed_out,
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+phonepe_gateway = PhonePeGateway()
+
+
+async def create_payment_order(amount: float, redirect_url: str, merchant_order_id: str = None, metadata: dict = None):
+    """Create a PhonePe payment order without blocking the event loop, see _create_payment_order"""
+    return await phonepe_gateway.call(_create_payment_order, amount, redirect_url, merchant_order_id, metadata)
+
+
+class PaymentStatusCache:
+    """Single-flight, TTL-cached status lookups by merchant order id, see the module docstring"""
+
+    def __init__(self, maxsize=PHONEPE_STATUS_CACHE_SIZE, ttl=PHONEPE_STATUS_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._in_flight = {}  # merchant order id -> task of the upstream lookup
+        self.lookups = 0
+        self.hits = 0
+        self.joined = 0  # lookups that waited for another one's upstream call
+        self.upstream_calls = 0
+
+    def _store(self, merchant_order_id, result):
+        # a final state is kept: neither a slower, older lookup nor a later event replaces it
+        cached = self._cache.get(merchant_order_id)
+        if cached is None or cached.get("state") not in FINAL_STATES:
+            final = result.get("state") in FINAL_STATES
+            self._cache.set(merchant_order_id, result, float("inf") if final else None)
+
+    async def _fetch(self, merchant_order_id):
+        self.upstream_calls += 1
+        result = await phonepe_gateway.call(_check_payment_status, merchant_order_id)
+        if result.get("success"):
+            self._store(merchant_order_id, result)
+        return result
+
+    def record(self, merchant_order_id, result):
+        """Store a final status learnt without a lookup, e.g. from the webhook"""
+        if result.get("state") in FINAL_STATES:
+            self._store(merchant_order_id, result)
+
+    def _forget(self, merchant_order_id, task):
+        if self._in_flight.get(merchant_order_id) is task:
+            del self._in_flight[merchant_order_id]
+
+    async def get(self, merchant_order_id, fresh=False):
+        """
+        Status of an order, as check_payment_status returns it
+
+        Args:
+            merchant_order_id: the order
+            fresh: ask PhonePe unless the order already reached a final state, for
+                decisions that must not act on a state up to PHONEPE_STATUS_TTL old
+        """
+        self.lookups += 1
+        cached = self._cache.get(merchant_order_id)
+        if cached is not None and (not fresh or cached.get("state") in FINAL_STATES):
+            self.hits += 1
+            return cached
+        task = None if fresh else self._in_flight.get(merchant_order_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(merchant_order_id))
+            self._in_flight[merchant_order_id] = task
+            task.add_done_callback(lambda done: self._forget(merchant_order_id, done))
+        else:
+            self.joined += 1
+        # shielded: a caller that goes away does not cancel the lookup for the others
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "ttl": self._cache.ttl,
+            "in_flight": len(self._in_flight),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "joined": self.joined,
+            "upstream_calls": self.upstream_calls,
+            "upstream_calls_saved": self.hits + self.joined,
+        }
+
+
+payment_status_cache = PaymentStatusCache()
+
+
+async def check_payment_status(merchant_order_id: str, fresh: bool = False):
+    """
+    Check the payment status of an order without blocking the event loop, see
+    _check_payment_status and PaymentStatusCache.get
+    """
+    return await payment_status_cache.get(merchant_order_id, fresh)
+
+
+async def initiate_refund(merchant_order_id: str, refund_amount: float, merchant_refund_id: str = None):
+    """
+    Refund a payment without blocking the event loop, see _initiate_refund
+
+    The refund id is fixed before the call, so a timed-out refund can be retried with
+    the same merchant_refund_id.
+    """
+    if not merchant_refund_id:
+        merchant_refund_id = f"REFUND_{uuid4().hex[:16].upper()}"
+    result = await phonepe_gateway.call(_initiate_refund, merchant_order_id, refund_amount, merchant_refund_id)
+    result.setdefault("refund_id", merchant_refund_id)
+    return result
+
+
+def webhook_configured():
+    return bool(PHONEPE_WEBHOOK_USERNAME and PHONEPE_WEBHOOK_PASSWORD)
+
+
+def verify_webhook_authorization(authorization: str):
+    """Whether a webhook delivery's Authorization header is SHA256(username:password)"""
+    if not webhook_configured() or not authorization:
+        return False
+    expected = hashlib.sha256(f"{PHONEPE_WEBHOOK_USERNAME}:{PHONEPE_WEBHOOK_PASSWORD}".encode()).hexdigest()
+    return hmac.compare_digest(authorization.strip().lower(), expected)
+
+
+def parse_webhook(body: bytes):
+    """
+    The order state a webhook delivery reports
+
+    Returns:
+        dict with event_id, event, merchant_order_id, state, transaction_id, payment_method
+        and amount (rupees); raises ValueError for a body that is not an order event.
+        The event id is the delivery's own id if it has one, else event, order and state
+        together: PhonePe retries a delivery until it is acknowledged, and an order reaches
+        each state once.
+    """
+    try:
+        data = json.loads(body)
+        payload = data.get("payload") or {}
+        merchant_order_id = payload.get("merchantOrderId")
+        state = payload.get("state")
+    except (ValueError, AttributeError):
+        raise ValueError("malformed webhook body")
+    if not merchant_order_id or not state:
+        raise ValueError("webhook body without merchantOrderId and state")
+    event = data.get("event") or data.get("type")
+    details = payload.get("paymentDetails") or []
+    latest = details[-1] if isinstance(details, list) and details else {}
+    if not isinstance(latest, dict):
+        raise ValueError("malformed paymentDetails in webhook body")
+    amount = payload.get("amount")
+    return {
+        "event_id": data.get("id") or f"{event}:{payload.get('orderId') or merchant_order_id}:{state}",
+        "event": event,
+        "merchant_order_id": merchant_order_id,
+        "state": state,
+        "transaction_id": latest.get("transactionId"),
+        "payment_method": latest.get("paymentMode"),
+        "amount": amount / 100 if isinstance(amount, (int, float)) else None,
+    }
@@ -0,0 +1,73 @@
+"""
+Principal Cache
+The users behind access tokens, keyed on the token's user id and issued-at, so
+authenticated requests skip the users lookup. Entries hold the user's column values;
+each request gets its own instance, attached to its session without a query, so
+endpoints can change and commit the user as before.
+
+Write paths that change a user (update_profile, deactivating them) call invalidate()
+after their commit. Entries are per process: another worker may keep serving a changed
+user for up to PRINCIPAL_CACHE_TTL seconds.
+"""
+import os
+
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import make_transient_to_detached
+
+from models import User
+from services.cache import TTLCache
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+
+
+class PrincipalCache:
+    """Column values of token users by (user id, issued-at), see the module docstring"""
+
+    def __init__(self, maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # bumped by every invalidation; a lookup that raced one does not store what it read
+        self.generation = 0
+
+    async def load(self, db, user_id=None, email=None, issued_at=None):
+        """
+        The user a token belongs to, attached to db; None if there is none
+
+        Args:
+            db: AsyncSession
+            user_id: the token's uid claim
+            email: the token's subject, looked up for tokens issued without a uid
+            issued_at: the token's iat claim
+        """
+        key = (user_id if user_id is not None else email, issued_at)
+        values = self._cache.get(key)
+        if values is not None:
+            user = User(**values)
+            make_transient_to_detached(user)
+            # reuses the instance if the session already has this user
+            return await db.merge(user, load=False)
+        generation = self.generation
+        if user_id is not None:
+            user = await db.get(User, user_id)
+        else:
+            user = (await db.execute(select(User).where(User.email == email))).scalar_one_or_none()
+        if user is not None and generation == self.generation:
+            self._cache.set(key, {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
+        return user
+
+    def invalidate(self, user_id):
+        """Drop every cached token of this user, call after committing a change to them"""
+        self.generation += 1
+        for key, values in self._cache.items():
+            if values["id"] == user_id:
+                self._cache.pop(key)
+
+    def clear(self):
+        self.generation += 1
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
+
+
+principal_cache = PrincipalCache()
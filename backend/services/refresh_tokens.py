@@ -0,0 +1,115 @@
+"""
+Refresh Tokens
+Long-lived opaque tokens exchanged at /api/auth/refresh for a new access token, so
+clients stay signed in without sending the password (and paying for bcrypt) again.
+
+Every exchange rotates the token: the presented one is revoked and a new one of the same
+family is returned. A login starts a family. Presenting a revoked token again means it
+leaked, or a client raced itself, so the whole family is revoked and that login has to
+sign in again. Tokens of inactive users are refused without rotating them, and
+/logout-all revokes every family of a user. Only a sha256 of each token is stored.
+"""
+import hashlib
+import os
+import secrets
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, select, update
+
+from models import RefreshToken, User
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _invalid():
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="invalid or expired refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _new_token(db, user_id, family):
+    token = secrets.token_urlsafe(32)
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=_digest(token),
+        family=family,
+        expires_at=_now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+
+async def issue_refresh_token(db, user_id):
+    """Start a new family for a login and return its first token; commits"""
+    # expired tokens of the user are no longer needed to detect reuse
+    await db.execute(delete(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.expires_at < _now()))
+    token = _new_token(db, user_id, secrets.token_urlsafe(16))
+    await db.commit()
+    return token
+
+
+async def rotate_refresh_token(db, token):
+    """
+    Exchange a refresh token for the next one of its family; commits
+
+    Returns:
+        (user_id, new refresh token)
+
+    Raises:
+        HTTPException 401 for an unknown, expired or revoked token, or one of an inactive
+        user; a revoked one also revokes its family
+    """
+    row = (await db.execute(
+        select(RefreshToken.id, RefreshToken.user_id, RefreshToken.family, User.is_active)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == _digest(token))
+    )).one_or_none()
+    if row is None or not row.is_active:
+        raise _invalid()
+    now = _now()
+    # claimed by one statement, so of two concurrent exchanges only one succeeds
+    claimed = await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.id == row.id, RefreshToken.revoked_at.is_(None), RefreshToken.expires_at > now)
+        .values(revoked_at=now)
+    )
+    if claimed.rowcount != 1:
+        if await db.scalar(select(RefreshToken.revoked_at).where(RefreshToken.id == row.id)) is not None:
+            print(f"Warning: refresh token reused, revoking family of user {row.user_id}")
+            await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.family == row.family, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=now)
+            )
+            await db.commit()
+        raise _invalid()
+    new_token = _new_token(db, row.user_id, row.family)
+    await db.commit()
+    return row.user_id, new_token
+
+
+async def revoke_refresh_token(db, token):
+    """Revoke the family of a refresh token, as on logout; unknown tokens are ignored; commits"""
+    family = await db.scalar(select(RefreshToken.family).where(RefreshToken.token_hash == _digest(token)))
+    if family is not None:
+        await db.execute(
+            update(RefreshToken).where(RefreshToken.family == family, RefreshToken.revoked_at.is_(None)).values(revoked_at=_now())
+        )
+        await db.commit()
+
+
+async def revoke_user_tokens(db, user_id):
+    """Revoke every refresh token of a user, as on /logout-all or when deactivating them; the caller commits"""
+    await db.execute(
+        update(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)).values(revoked_at=_now())
+    )
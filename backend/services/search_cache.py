@@ -0,0 +1,374 @@
+"""
+Search Result Cache
+Responses of GET /api/books keyed on the normalized search parameters.
+
+Every entry remembers its filters and the books and sellers it returned, so a catalog
+change only drops the entries it can affect: those containing the changed book and
+those whose filters the book matches before or after the change. Write paths call
+invalidate_books / invalidate_book_ids / invalidate_seller after their commit.
+
+Entries live in an in-process LRU+TTL cache. With SEARCH_CACHE_REDIS_URL set (and the
+redis package installed) they are kept in Redis instead, shared by every worker; Redis
+then handles eviction through its maxmemory policy. There entries are indexed by the
+books, sellers, tags and query prefixes a change can reach them through, so an
+invalidation reads a few sets rather than every cached search.
+
+A search reads the invalidation counter (generation) before querying, and its response
+is only cached if no invalidation ran in between. In Redis the counter is shared too, so
+an invalidation in one worker also stops the others caching what they computed before it.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+
+from services.book_index import parse_tags
+from services.cache import TTLCache, make_key
+
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import WatchError
+except ImportError:  # optional, only needed for the shared backend
+    aioredis = None
+
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+SEARCH_CACHE_REDIS_URL = os.getenv("SEARCH_CACHE_REDIS_URL")
+
+# searchable columns of a book, see book_snapshot()
+SNAPSHOT_FIELDS = ("id", "owner_id", "price", "is_for_sale", "is_for_rent", "title", "author", "tags", "search_text")
+
+_WORD_RE = re.compile(r"[^\W_]+", re.UNICODE)
+
+
+def book_snapshot(book):
+    """The searchable state of a book, take one before and after changing it"""
+    return {field: getattr(book, field, None) for field in SNAPSHOT_FIELDS}
+
+
+def _words(value):
+    # same folding as the FTS5 unicode61 tokenizer with remove_diacritics
+    value = unicodedata.normalize("NFKD", (value or "").lower())
+    value = "".join(ch for ch in value if not unicodedata.combining(ch))
+    return _WORD_RE.findall(value)
+
+
+def may_match(params, book):
+    """
+    Whether a book (snapshot) can be part of the results of a search
+
+    Filters that cannot be decided from the book alone (city, nearby, fuzzy matching)
+    count as matching, so the answer errs towards invalidating.
+    """
+    if params["exclude_owner"] is not None and book["owner_id"] == params["exclude_owner"]:
+        return False
+    price = book["price"]
+    if params["min_price"] is not None and price is not None and price < params["min_price"]:
+        return False
+    if params["max_price"] is not None and price is not None and price > params["max_price"]:
+        return False
+    if params["for_sale"] is not None and bool(book["is_for_sale"]) != params["for_sale"]:
+        return False
+    if params["for_rent"] is not None and bool(book["is_for_rent"]) != params["for_rent"]:
+        return False
+    if params["tags"]:
+        wanted = set(params["tags"])
+        tags = set(parse_tags(book["tags"]))
+        if params["tag_mode"] == "any" and not wanted & tags:
+            return False
+        if params["tag_mode"] != "any" and not wanted <= tags:
+            return False
+    if params["author"] and params["author"].lower() not in (book["author"] or "").lower():
+        return False
+    if params["q"] and not params["fuzzy"]:
+        # full-text search matches every query token as a prefix of some word
+        words = _words(book["search_text"])
+        for token in _words(params["q"]):
+            if not any(word.startswith(token) for word in words):
+                return False
+    return True
+
+
+def _is_stale(entry, book_ids, books, seller_id):
+    if book_ids & entry["book_ids"]:
+        return True
+    if seller_id is not None:
+        located = entry["params"]["city"] is not None or entry["params"]["near"] is not None
+        return located or seller_id in entry["owner_ids"]
+    return any(may_match(entry["params"], book) for book in books)
+
+
+class _MemoryBackend:
+    name = "memory"
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+
+    async def get(self, key):
+        entry = self.entries.get(key)
+        return entry["value"] if entry else None
+
+    async def generation(self):
+        return self._generation
+
+    async def set(self, key, entry, generation):
+        if generation == self._generation:
+            self.entries.set(key, entry)
+
+    async def invalidate(self, is_stale, book_ids, books, seller_id):
+        self._generation += 1
+        stale = [key for key, entry in self.entries.items() if is_stale(entry)]
+        for key in stale:
+            self.entries.pop(key)
+        return len(stale)
+
+    async def size(self):
+        return len(self.entries)
+
+
+class _RedisBackend:
+    """
+    Entries in Redis, found for invalidation through index sets instead of a scan
+
+    Every entry is listed under the books and sellers it returned, under "located" if
+    it filters on city or distance, and under one key a book must hit to match it: a
+    wanted tag, the first letters of the first query token, or "broad" for the rest.
+    A change reads only the sets of the keys its books produce, then checks those
+    entries precisely. Index sets expire with the last entry added to them.
+
+    The generation is a counter in Redis: invalidations INCR it, and an entry is written
+    in a MULTI/EXEC that WATCHes it, so the write is dropped if the counter moved.
+    """
+    name = "redis"
+    prefix = "readar:search:"
+
+    def __init__(self, url, ttl):
+        self.redis = aioredis.from_url(url)
+        self.ttl = max(1, int(ttl))
+        self.expiries = self.prefix + "expiries"  # entry key -> expiry time, for size()
+        self.generation_key = self.prefix + "generation"
+
+    def _entry_key(self, key):
+        return self.prefix + "e:" + hashlib.sha1(key.encode()).hexdigest()
+
+    def _index_keys(self, entry):
+        params = entry["params"]
+        keys = [f"b:{book_id}" for book_id in entry["book_ids"]]
+        keys += [f"o:{owner_id}" for owner_id in entry["owner_ids"]]
+        if params["city"] is not None or params["near"] is not None:
+            keys.append("located")
+        tokens = _words(params["q"]) if params["q"] and not params["fuzzy"] else []
+        if params["tags"]:
+            # both tag modes need at least one of the wanted tags on the book
+            keys += [f"t:{tag}" for tag in params["tags"]]
+        elif tokens:
+            # a matching book has a word starting with the first token
+            keys.append(f"q:{tokens[0][:2]}")
+        else:
+            keys.append("broad")
+        return [self.prefix + "i:" + key for key in keys]
+
+    def _candidate_keys(self, book_ids, books, seller_id):
+        keys = {f"b:{book_id}" for book_id in book_ids}
+        if seller_id is not None:
+            keys |= {f"o:{seller_id}", "located"}
+        if books:
+            keys.add("broad")
+            for book in books:
+                keys |= {f"t:{tag}" for tag in parse_tags(book["tags"])}
+                keys |= {f"q:{word[:n]}" for word in _words(book["search_text"]) for n in (1, 2)}
+        return sorted(self.prefix + "i:" + key for key in keys)
+
+    async def get(self, key):
+        raw = await self.redis.get(self._entry_key(key))
+        return json.loads(raw)["value"] if raw else None
+
+    async def generation(self):
+        return int(await self.redis.get(self.generation_key) or 0)
+
+    async def set(self, key, entry, generation):
+        entry = {**entry, "book_ids": sorted(entry["book_ids"]), "owner_ids": sorted(entry["owner_ids"])}
+        entry_key = self._entry_key(key)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await pipe.watch(self.generation_key)
+            if int(await pipe.get(self.generation_key) or 0) != generation:
+                return
+            pipe.multi()
+            pipe.set(entry_key, json.dumps(entry), ex=self.ttl)
+            for index_key in self._index_keys(entry):
+                pipe.sadd(index_key, entry_key)
+                pipe.expire(index_key, self.ttl)
+            pipe.zadd(self.expiries, {entry_key: time.time() + self.ttl})
+            try:
+                await pipe.execute()
+            except WatchError:
+                pass  # an invalidation ran in between
+
+    async def invalidate(self, is_stale, book_ids, books, seller_id):
+        await self.redis.incr(self.generation_key)
+        index_keys = self._candidate_keys(book_ids, books, seller_id)
+        entry_keys = set()
+        for start in range(0, len(index_keys), 500):
+            entry_keys.update(key.decode() for key in await self.redis.sunion(index_keys[start:start + 500]))
+        entry_keys = sorted(entry_keys)
+        stale, dead = {}, []
+        for start in range(0, len(entry_keys), 500):
+            chunk = entry_keys[start:start + 500]
+            for entry_key, raw in zip(chunk, await self.redis.mget(chunk)):
+                if raw is None:
+                    dead.append(entry_key)
+                    continue
+                entry = json.loads(raw)
+                entry["book_ids"] = set(entry["book_ids"])
+                entry["owner_ids"] = set(entry["owner_ids"])
+                if is_stale(entry):
+                    stale[entry_key] = entry
+        if not stale and not dead:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for entry_key, entry in stale.items():
+                pipe.delete(entry_key)
+                for index_key in self._index_keys(entry):
+                    pipe.srem(index_key, entry_key)
+            if dead:
+                # expired entries are only known to be in the sets that were read
+                for index_key in index_keys:
+                    pipe.srem(index_key, *dead)
+            pipe.zrem(self.expiries, *stale, *dead)
+            await pipe.execute()
+        return len(stale)
+
+    async def size(self):
+        await self.redis.zremrangebyscore(self.expiries, "-inf", time.time())
+        return await self.redis.zcard(self.expiries)
+
+
+class SearchCache:
+    """Search responses with precise invalidation, see the module docstring"""
+
+    def __init__(self, maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, redis_url=SEARCH_CACHE_REDIS_URL):
+        if redis_url and aioredis is None:
+            print("SEARCH_CACHE_REDIS_URL is set but the redis package is not installed, using the in-process cache")
+        if redis_url and aioredis is not None:
+            self.backend = _RedisBackend(redis_url, ttl)
+        else:
+            self.backend = _MemoryBackend(maxsize, ttl)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def get(self, key):
+        """Cached response for a key from search_key(), or None"""
+        try:
+            value = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Search cache read failed: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def generation(self):
+        """
+        The invalidation counter, read before computing a response to cache
+
+        Every invalidation bumps it, and set() drops a response computed across one.
+        None if it cannot be read, then the response is not cached.
+        """
+        try:
+            return await self.backend.generation()
+        except Exception as e:
+            self.errors += 1
+            print(f"Search cache read failed: {e}")
+            return None
+
+    async def set(self, key, params, value, books, generation):
+        """
+        Cache a JSON-serializable response
+
+        Args:
+            key: search_key() of the search
+            params: the normalized filters of the search, see search_books
+            value: the response
+            books: the Book objects in the response
+            generation: self.generation() read before the response was computed
+        """
+        if generation is None:
+            return
+        entry = {
+            "params": params,
+            "book_ids": {book.id for book in books},
+            "owner_ids": {book.owner_id for book in books},
+            "value": value,
+        }
+        try:
+            await self.backend.set(key, entry, generation)
+        except Exception as e:
+            self.errors += 1
+            print(f"Search cache write failed: {e}")
+
+    async def _invalidate(self, book_ids=(), books=(), seller_id=None):
+        book_ids = set(book_ids) | {book["id"] for book in books}
+        try:
+            self.invalidations += await self.backend.invalidate(
+                lambda entry: _is_stale(entry, book_ids, books, seller_id), book_ids, books, seller_id
+            )
+        except Exception as e:
+            self.errors += 1
+            print(f"Search cache invalidation failed: {e}")
+
+    async def invalidate_books(self, books):
+        """
+        Drop the entries affected by inserted, changed or deleted books
+
+        Args:
+            books: book_snapshot() dicts, for a change pass the snapshots from before and after it
+        """
+        books = list(books)
+        if books:
+            await self._invalidate(books=books)
+
+    async def invalidate_book_ids(self, book_ids):
+        """Drop the entries containing these books, for changes no search filters on (e.g. status)"""
+        book_ids = list(book_ids)
+        if book_ids:
+            await self._invalidate(book_ids=book_ids)
+
+    async def invalidate_seller(self, user_id):
+        """Drop the entries a seller's city or location can affect"""
+        await self._invalidate(seller_id=user_id)
+
+    async def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            size = await self.backend.size()
+        except Exception:
+            size = None
+        return {
+            "backend": self.backend.name,
+            "size": size,
+            "maxsize": getattr(self.backend, "maxsize", None),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+search_cache = SearchCache()
+
+
+def search_key(params, **paging):
+    """Cache key for a search: its normalized filters plus paging/response options"""
+    return make_key({**params, **paging})
@@ -0,0 +1,320 @@
+"""
+XLSX Reader
+Parses workbooks in a pool of worker processes, so a large upload neither holds the GIL
+of the serving process nor sits in its memory.
+
+A worker streams the sheet XML itself (see read_rows) and hands rows back in batches
+through a bounded queue: it parses at most XLSX_QUEUE_BATCHES batches ahead of the
+consumer, so memory stays flat whatever the size of the workbook.
+
+This module is imported by the workers, keep its imports light.
+"""
+import asyncio
+import multiprocessing
+import os
+import posixpath
+import queue as queue_module
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from xml.etree.ElementTree import iterparse, parse as parse_xml
+
+from openpyxl.styles.numbers import BUILTIN_FORMATS, is_date_format, is_timedelta_format
+from openpyxl.utils.cell import range_boundaries
+from openpyxl.utils.datetime import CALENDAR_MAC_1904, CALENDAR_WINDOWS_1900, from_excel, from_ISO8601
+
+XLSX_PARSE_WORKERS = int(os.getenv("XLSX_PARSE_WORKERS", "2"))
+XLSX_BATCH_ROWS = 500
+XLSX_QUEUE_BATCHES = 4
+PUT_TIMEOUT = 0.5  # seconds between checks of the stop flag while the queue is full
+
+_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_RELATIONSHIP = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+_pool = None
+_manager = None
+# stream_rows runs in to_thread workers: two uploads at a cold start must not both start a pool
+_pool_lock = threading.Lock()
+
+
+class XlsxReadError(Exception):
+    """The workbook could not be read"""
+
+
+def _executor():
+    global _pool, _manager
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process running an event loop and database connections is unsafe
+            context = multiprocessing.get_context("spawn")
+            _manager = context.Manager()
+            _pool = ProcessPoolExecutor(max_workers=XLSX_PARSE_WORKERS, mp_context=context)
+        return _pool, _manager
+
+
+def shutdown():
+    """Stop the worker processes, if they were started"""
+    global _pool, _manager
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _manager.shutdown()
+            _pool = _manager = None
+
+
+def _read_xml(archive, name):
+    with archive.open(name) as source:
+        return parse_xml(source).getroot()
+
+
+def _relationships(archive, part):
+    # {id: (type, part path)} of the parts a part refers to; "" is the package itself
+    rels = posixpath.join(posixpath.dirname(part), "_rels", posixpath.basename(part) + ".rels")
+    if rels not in archive.namelist():
+        return {}
+    found = {}
+    for rel in _read_xml(archive, rels):
+        target = rel.get("Target", "")
+        if target.startswith("/"):
+            target = target[1:]
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(part), target))
+        found[rel.get("Id")] = (rel.get("Type", ""), target)
+    return found
+
+
+def _text(element):
+    # the plain text or the runs of a rich text string, without phonetic hints (rPh)
+    runs = [element.findtext(_MAIN + "t") or ""]
+    runs += [run.findtext(_MAIN + "t") or "" for run in element.iterfind(_MAIN + "r")]
+    return "".join(runs)
+
+
+def _shared_strings(archive, name):
+    strings = []
+    with archive.open(name) as source:
+        for _, element in iterparse(source):
+            if element.tag == _MAIN + "si":
+                strings.append(_text(element).replace("x005F_", ""))
+                element.clear()
+    return strings
+
+
+def _date_styles(archive, name):
+    # indexes of the cell styles whose number format shows a date, and of those showing a duration
+    styles = _read_xml(archive, name)
+    custom = {int(fmt.get("numFmtId")): fmt.get("formatCode")
+              for fmt in styles.iterfind(f"{_MAIN}numFmts/{_MAIN}numFmt")}
+    dates, durations = set(), set()
+    for index, xf in enumerate(styles.iterfind(f"{_MAIN}cellXfs/{_MAIN}xf")):
+        fmt_id = int(xf.get("numFmtId", 0))
+        fmt = custom[fmt_id] if fmt_id in custom else BUILTIN_FORMATS.get(fmt_id)
+        if is_date_format(fmt):
+            dates.add(index)
+        if is_timedelta_format(fmt):
+            durations.add(index)
+    return dates, durations
+
+
+def _column(ref):
+    # 1-based column of a cell reference such as "AB12"
+    column = 0
+    for char in ref:
+        if char.isdigit():
+            break
+        column = column * 26 + ord(char.upper()) - 64
+    return column
+
+
+def _cell_value(cell, strings, dates, durations, epoch):
+    kind = cell.get("t", "n")
+    if kind == "inlineStr":
+        string = cell.find(_MAIN + "is")
+        return _text(string) if string is not None else None
+    value = cell.findtext(_MAIN + "v") or None
+    if value is None:
+        return None
+    if kind == "n":
+        value = float(value) if "." in value or "E" in value or "e" in value else int(value)
+        style = int(cell.get("s") or 0)
+        if style in dates:
+            try:
+                return from_excel(value, epoch, timedelta=style in durations)
+            except (OverflowError, ValueError):
+                return "#VALUE!"
+        return value
+    if kind == "s":
+        return strings[int(value)]
+    if kind == "b":
+        return bool(int(value))
+    if kind == "d":
+        return from_ISO8601(value)
+    return value  # "str" (the cached result of a formula) or "e" (an error such as #N/A)
+
+
+def _sheet_rows(source, strings, dates, durations, epoch):
+    # rows padded and bounded by the sheet's <dimension> as openpyxl does, missing rows as empty ones
+    max_col = max_row = None
+    empty = ()
+    expected = 1  # number of the next row to yield
+    number = 0  # number of the last <row> read
+    for _, element in iterparse(source):
+        tag = element.tag
+        if tag == _MAIN + "row":
+            ref = element.get("r")
+            number = int(float(ref)) if ref else number + 1
+            if max_row is not None and number > max_row:
+                break
+            while expected < number:
+                expected += 1
+                yield empty
+            if expected == number:
+                cells = []
+                column = 0
+                for cell in element.iterfind(_MAIN + "c"):
+                    ref = cell.get("r")
+                    column = _column(ref) if ref else column + 1
+                    cells.append((column, _cell_value(cell, strings, dates, durations, epoch)))
+                width = max_col or (cells[-1][0] if cells else 0)
+                row = [None] * width
+                for column, value in cells:
+                    if 1 <= column <= width:
+                        row[column - 1] = value
+                expected += 1
+                yield tuple(row)
+            element.clear()
+        elif tag == _MAIN + "dimension":
+            _, _, max_col, max_row = range_boundaries(element.get("ref"))
+            empty = (None,) * max_col if max_col else ()
+        elif tag == _MAIN + "sheetData":
+            break
+    if max_row is not None and number > max_row:
+        # the sheet goes past its dimension: openpyxl stops there, filling the rows up to it
+        while expected <= max_row:
+            expected += 1
+            yield empty
+
+
+def read_rows(path):
+    """
+    Yield the rows of the active sheet of a workbook as tuples of cell values
+
+    Gives what openpyxl's read-only mode does with data_only and values_only (cached
+    formula results, dates as datetimes, rows padded to the sheet's dimension), reading
+    the XML straight into values instead of building a cell object for each: several
+    times faster on large sheets.
+    """
+    with zipfile.ZipFile(path) as archive:
+        package = _relationships(archive, "")
+        workbook_part = next(
+            (target for kind, target in package.values() if kind.endswith("/officeDocument")), "xl/workbook.xml"
+        )
+        workbook = _read_xml(archive, workbook_part)
+        rels = _relationships(archive, workbook_part)
+        parts = {kind.rsplit("/", 1)[-1]: target for kind, target in rels.values()}
+
+        properties = workbook.find(_MAIN + "workbookPr")
+        date1904 = properties is not None and properties.get("date1904") in ("1", "true")
+        epoch = CALENDAR_MAC_1904 if date1904 else CALENDAR_WINDOWS_1900
+        active = 0
+        for view in workbook.iterfind(f"{_MAIN}bookViews/{_MAIN}workbookView"):
+            if view.get("activeTab") is not None:
+                active = int(view.get("activeTab"))
+                break
+        sheets = workbook.findall(f"{_MAIN}sheets/{_MAIN}sheet")
+        if not 0 <= active < len(sheets):
+            raise XlsxReadError("the workbook has no sheets")
+        kind, sheet_part = rels.get(sheets[active].get(_RELATIONSHIP), ("", None))
+        if not kind.endswith("/worksheet"):
+            raise XlsxReadError("the active sheet is not a worksheet")
+
+        strings = _shared_strings(archive, parts["sharedStrings"]) if "sharedStrings" in parts else []
+        dates, durations = _date_styles(archive, parts["styles"]) if "styles" in parts else (set(), set())
+        with archive.open(sheet_part) as source:
+            yield from _sheet_rows(source, strings, dates, durations, epoch)
+
+
+def _put(queue, stop, item):
+    # False once the consumer has gone away
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=PUT_TIMEOUT)
+            return True
+        except queue_module.Full:
+            continue
+    return False
+
+
+def _parse(path, batch_size, queue, stop):
+    # runs in a worker process; the last item is None or an XlsxReadError
+    try:
+        rows = read_rows(path)
+        try:
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    if not _put(queue, stop, batch):
+                        return
+                    batch = []
+            if batch and not _put(queue, stop, batch):
+                return
+        finally:
+            rows.close()
+    except Exception as e:
+        _put(queue, stop, XlsxReadError(str(e)))
+        return
+    _put(queue, stop, None)
+
+
+def stream_rows(path, batch_size=XLSX_BATCH_ROWS):
+    """
+    Yield the rows of the active sheet of a workbook as tuples of cell values
+
+    Parsing happens in a worker process. Iterating blocks while waiting for it, so consume
+    this from a thread (see import_book_rows); closing the generator stops the worker.
+
+    Raises:
+        XlsxReadError: if the file is not a readable workbook
+    """
+    pool, manager = _executor()
+    queue = manager.Queue(maxsize=XLSX_QUEUE_BATCHES)
+    stop = manager.Event()
+    future = pool.submit(_parse, path, batch_size, queue, stop)
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=PUT_TIMEOUT)
+            except queue_module.Empty:
+                if future.done():
+                    future.result()  # raises if the worker process died
+                continue
+            if item is None:
+                break
+            if isinstance(item, XlsxReadError):
+                raise item
+            yield from item
+        future.result()
+    finally:
+        stop.set()
+
+
+def _copy_upload(upload, suffix):
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as out:
+        upload.file.seek(0)
+        shutil.copyfileobj(upload.file, out, 1024 * 1024)
+    return path
+
+
+@asynccontextmanager
+async def upload_on_disk(upload):
+    """The path of a temporary copy of an UploadFile, which worker processes can open"""
+    path = await asyncio.to_thread(_copy_upload, upload, os.path.splitext(upload.filename or "")[1])
+    try:
+        yield path
+    finally:
+        os.remove(path)
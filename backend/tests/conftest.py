@@ -0,0 +1,57 @@
+"""
+Shared fixtures: the routers served in process against a throwaway SQLite database
+
+The schema is created once per run; tests keep apart by signing up their own users.
+"""
+import itertools
+import os
+import sys
+import tempfile
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "tests.db")
+os.environ.setdefault("SECRET_KEY", "tests-only-secret")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest_asyncio
+from fastapi import FastAPI
+
+from database import Base, engine
+from routers.auth import router as auth_router
+from routers.books import router as books_router
+from services.book_index import trigram_filler
+from services.book_search import ensure_search_index
+
+app = FastAPI()
+app.include_router(auth_router, prefix="/api/auth")
+app.include_router(books_router, prefix="/api/books")
+
+_names = itertools.count(1)
+
+
+@pytest_asyncio.fixture
+async def client():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(ensure_search_index)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        yield client
+    # background work and pooled connections belong to this test's event loop
+    await trigram_filler.wait()
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+def sign_up(client):
+    async def sign_up(prefix="user"):
+        """Register a fresh user, return (user id, auth headers)"""
+        name = f"{prefix}{next(_names)}"
+        user = {"email": f"{name}@example.com", "username": name, "password": "secret-pw",
+                "first_name": name, "last_name": "Test", "city": "Delhi"}
+        registered = await client.post("/api/auth/register", json=user)
+        registered.raise_for_status()
+        response = await client.post("/api/auth/token", data={"username": user["email"], "password": user["password"]})
+        response.raise_for_status()
+        return registered.json()["id"], {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return sign_up
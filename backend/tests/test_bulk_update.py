@@ -0,0 +1,40 @@
+"""PATCH /api/books/bulk and the search cache stats need a signed-in user"""
+import pytest
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Book
+
+
+async def add_book(client, headers):
+    response = await client.post("/api/books/", json={"title": "Bulk", "author": "Someone", "price": 10}, headers=headers)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_sets_updated_at(client, sign_up):
+    _, seller = await sign_up("seller")
+    book_id = await add_book(client, seller)
+    response = await client.patch("/api/books/bulk", json={"filter": {"ids": [book_id]}, "changes": {"price": 12}},
+                                  headers=seller)
+    assert response.json() == {"updated": 1}
+    async with AsyncSessionLocal() as db:
+        price, updated_at = (await db.execute(select(Book.price, Book.updated_at).where(Book.id == book_id))).one()
+    assert price == 12 and updated_at is not None
+
+
+@pytest.mark.asyncio
+async def test_bulk_update_requires_a_user(client, sign_up):
+    _, seller = await sign_up("seller")
+    book_id = await add_book(client, seller)
+    response = await client.patch("/api/books/bulk", json={"filter": {"ids": [book_id]}, "changes": {"price": 1}})
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_search_cache_stats_require_a_user(client, sign_up):
+    assert (await client.get("/api/books/search-cache/stats")).status_code == 401
+    _, user = await sign_up("ops")
+    response = await client.get("/api/books/search-cache/stats", headers=user)
+    assert response.status_code == 200 and "hit_rate" in response.json()
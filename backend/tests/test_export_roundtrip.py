@@ -0,0 +1,73 @@
+"""An inventory export imports back as it is, through every import endpoint"""
+import json
+
+import pytest
+
+BOOKS = [
+    {"title": "Rental only", "author": "Some Author", "price": 300, "stock": 2, "is_for_sale": False,
+     "is_for_rent": True, "weekly_fee": 25.5, "rental_duration": 3, "tags": "fiction, classic", "condition": "good"},
+    {"title": "No author", "price": 120.75, "status": "expected",
+     "description": "an anthology, \"quoted\"\nover two lines"},
+    {"title": "Ordinary", "author": "Writer", "price": 99, "isbn": "978-0-306-40615-7", "status": "lent"},
+]
+
+
+async def list_books(client, headers, books):
+    for book in books:
+        (await client.post("/api/books/", json=book, headers=headers)).raise_for_status()
+
+
+async def export(client, headers, format="ndjson"):
+    response = await client.get("/api/books/my/books/export", params={"format": format}, headers=headers)
+    response.raise_for_status()
+    return response.content
+
+
+def parse_ndjson(content):
+    return [json.loads(line) for line in content.splitlines()]
+
+
+async def import_export(client, headers, data, endpoint, **params):
+    if endpoint == "/bulk":
+        response = await client.post("/api/books/bulk", content=data, params=params,
+                                     headers={**headers, "Content-Type": "application/x-ndjson"})
+    else:
+        response = await client.post(f"/api/books{endpoint}", files={"file": ("inventory.xlsx" if data[:2] == b"PK"
+                                     else "inventory.csv", data)}, params=params, headers=headers)
+    response.raise_for_status()
+    return response
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("format, endpoint", [
+    ("csv", "/import"), ("xlsx", "/import"), ("xlsx", "/import-excel"), ("ndjson", "/bulk"),
+])
+async def test_export_imports_back_unchanged(client, sign_up, format, endpoint):
+    _, seller = await sign_up("seller")
+    await list_books(client, seller, BOOKS)
+    original = parse_ndjson(await export(client, seller))
+    assert {book["title"]: book["rental_duration"] for book in original}["Rental only"] == 3
+    assert {book["title"]: book["status"] for book in original}["Ordinary"] == "lent"
+
+    _, buyer = await sign_up("importer")
+    response = await import_export(client, buyer, await export(client, seller, format), endpoint)
+    if endpoint == "/import":
+        # /import requires an author on every row
+        assert [error["message"] for error in response.json()["errors"]] == ["missing author"]
+        original = [book for book in original if book["author"]]
+    assert parse_ndjson(await export(client, buyer)) == original
+
+
+@pytest.mark.asyncio
+async def test_replace_reimport_updates_isbn_listings_in_place(client, sign_up):
+    _, seller = await sign_up("seller")
+    await list_books(client, seller, BOOKS)
+    data = await export(client, seller, "csv")
+    edited = data.replace(b"Writer", b"Other Writer")
+
+    await import_export(client, seller, edited, "/import", on_conflict="replace")
+    books = parse_ndjson(await export(client, seller))
+    ordinary = [book for book in books if book["title"] == "Ordinary"]
+    assert [book["author"] for book in ordinary] == ["Other Writer"]
+    # matched on ISBN only: the row without one is listed again (the one without an author fails)
+    assert len(books) == len(BOOKS) + 1
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from database import AsyncSessionLocal
+from models import ImportJob
+from services import import_jobs
+
+
+async def job_row(job_id):
+    async with AsyncSessionLocal() as db:
+        return await db.get(ImportJob, job_id)
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.02)
+
+
+@pytest.mark.asyncio
+async def test_running_job_heartbeats_and_is_requeued_on_stop(client, sign_up, monkeypatch):
+    _, headers = await sign_up("jobs")
+    csv = b"title,author,price\nQueued,Someone,10\n"
+    response = await client.post("/api/books/import", params={"background": "true"},
+                                 files={"file": ("books.csv", csv, "text/csv")}, headers=headers)
+    assert response.status_code == 200
+    job_id = response.json()["id"]
+    assert response.json()["status"] == "queued"
+
+    async def stuck(job_id):
+        # a chunk that takes longer than the heartbeat interval
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(import_jobs, "run_import_job", stuck)
+    monkeypatch.setattr(import_jobs, "HEARTBEAT_INTERVAL", 0.05)
+    runner = import_jobs.ImportJobRunner(workers=1)
+    runner.start()
+    try:
+        async def claimed():
+            return (await job_row(job_id)).status == "running"
+        await wait_for(claimed)
+        first = (await job_row(job_id)).heartbeat_at
+
+        async def beating():
+            return (await job_row(job_id)).heartbeat_at > first
+        await wait_for(beating)
+    finally:
+        await runner.stop()
+
+    assert (await job_row(job_id)).status == "queued"
@@ -0,0 +1,45 @@
+"""/import stops at a part of the file it cannot read and can be resumed from the checkpoint it reports"""
+import re
+
+import pytest
+
+HEADER = b"title,author,price\n"
+
+
+def rows(start, count):
+    return b"".join(f"Book {i},Author {i},{100 + i}\n".encode() for i in range(start, start + count))
+
+
+async def count_listings(client, headers):
+    response = await client.get("/api/books/my/books/export", params={"format": "ndjson"}, headers=headers)
+    response.raise_for_status()
+    return len(response.content.splitlines())
+
+
+async def upload(client, headers, data, **params):
+    return await client.post("/api/books/import", files={"file": ("books.csv", data)},
+                             params={"batch_size": 100, **params}, headers=headers)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("broken", [
+    b"Bad \xff\xfe bytes,Author,1\n",  # not UTF-8
+    b"Huge," + b"x" * 200000 + b",1\n",  # beyond csv's field size limit
+])
+async def test_unreadable_csv_reports_resume_checkpoint(client, sign_up, broken):
+    _, seller = await sign_up("seller")
+    # the file is decoded in blocks, so the bad row sits well after the first chunks
+    data = HEADER + rows(0, 1000) + broken + rows(1000, 50)
+
+    response = await upload(client, seller, data)
+    assert response.status_code == 400
+    match = re.search(r"(\d+) books were imported, retry with resume_from=(\d+)", response.json()["detail"])
+    assert match, response.json()["detail"]
+    imported, checkpoint = int(match.group(1)), int(match.group(2))
+    assert imported == checkpoint - 1 and imported % 100 == 0 and imported > 0
+    assert await count_listings(client, seller) == imported
+
+    fixed = HEADER + rows(0, 1000) + b"Fixed,Author,1\n" + rows(1000, 50)
+    response = await upload(client, seller, fixed, resume_from=checkpoint)
+    response.raise_for_status()
+    assert await count_listings(client, seller) == 1051
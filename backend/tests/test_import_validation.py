@@ -0,0 +1,24 @@
+"""/import requires title, author and price: as columns of the file and on every row"""
+import pytest
+
+
+async def upload(client, headers, data):
+    return await client.post("/api/books/import", files={"file": ("books.csv", data)}, headers=headers)
+
+
+@pytest.mark.asyncio
+async def test_file_without_author_column_is_rejected(client, sign_up):
+    _, seller = await sign_up("seller")
+    response = await upload(client, seller, b"title,price\nNo author column,10\n")
+    assert response.status_code == 400
+    assert "missing required columns" in response.json()["detail"]
+
+
+@pytest.mark.asyncio
+async def test_row_without_author_is_an_error(client, sign_up):
+    _, seller = await sign_up("seller")
+    response = await upload(client, seller, b"title,author,price\nHas author,Someone,10\nNo author,,12\n")
+    response.raise_for_status()
+    result = response.json()
+    assert result["imported"] == 1
+    assert result["errors"] == [{"row": 3, "title": "No author", "message": "missing author"}]
@@ -0,0 +1,11 @@
+"""The ops stats endpoints of the auth router need a signed-in user"""
+import pytest
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("path", ["/api/auth/password-hashing/stats", "/api/auth/principal-cache/stats"])
+async def test_stats_require_a_user(client, sign_up, path):
+    assert (await client.get(path)).status_code == 401
+    _, user = await sign_up("ops")
+    response = await client.get(path, headers=user)
+    assert response.status_code == 200
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import update
+
+from database import AsyncSessionLocal
+from models import User
+
+
+async def log_in(client, headers):
+    """A second login of a signed-up user, returns its token response"""
+    email = (await client.get("/api/auth/me", headers=headers)).json()["email"]
+    response = await client.post("/api/auth/token", data={"username": email, "password": "secret-pw"})
+    response.raise_for_status()
+    return response.json()
+
+
+async def refresh(client, refresh_token):
+    return await client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+
+
+@pytest.mark.asyncio
+async def test_logout_all_revokes_every_login(client, sign_up):
+    _, headers = await sign_up("logoutall")
+    first = await log_in(client, headers)
+    second = await log_in(client, headers)
+    rotated = await refresh(client, second["refresh_token"])
+    assert rotated.status_code == 200
+
+    assert (await client.post("/api/auth/logout-all")).status_code == 401
+    response = await client.post("/api/auth/logout-all", headers=headers)
+    assert response.status_code == 200
+
+    assert (await refresh(client, first["refresh_token"])).status_code == 401
+    assert (await refresh(client, rotated.json()["refresh_token"])).status_code == 401
+    # a new login still works
+    assert (await refresh(client, (await log_in(client, headers))["refresh_token"])).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_refresh_refuses_inactive_user_without_rotating(client, sign_up):
+    user_id, headers = await sign_up("inactive")
+    tokens = await log_in(client, headers)
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).where(User.id == user_id).values(is_active=False))
+        await db.commit()
+    assert (await refresh(client, tokens["refresh_token"])).status_code == 401
+
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).where(User.id == user_id).values(is_active=True))
+        await db.commit()
+    # the refused token was not rotated, so it was not revoked either
+    assert (await refresh(client, tokens["refresh_token"])).status_code == 200
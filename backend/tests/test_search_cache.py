@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services.search_cache import SearchCache, search_key
+
+PARAMS = {
+    "q": None, "fuzzy": False, "tags": [], "tag_mode": "all", "author": None, "min_price": None,
+    "max_price": None, "city": None, "for_sale": None, "for_rent": None, "near": None, "exclude_owner": None,
+}
+BOOK = SimpleNamespace(id=1, owner_id=7)
+
+
+async def compute_across_invalidation(reader, writer):
+    """A search on reader that an invalidation on writer overtakes, returns whether it got cached"""
+    key = search_key(PARAMS, skip=0)
+    generation = await reader.generation()
+    await writer.invalidate_book_ids([99])
+    await reader.set(key, PARAMS, {"books": []}, [BOOK], generation)
+    return await reader.get(key) is not None
+
+
+@pytest.mark.asyncio
+async def test_memory_cache_skips_responses_computed_across_an_invalidation():
+    cache = SearchCache(redis_url=None)
+    assert not await compute_across_invalidation(cache, cache)
+
+    key = search_key(PARAMS, skip=0)
+    await cache.set(key, PARAMS, {"books": []}, [BOOK], await cache.generation())
+    assert await cache.get(key) == {"books": []}
+
+
+@pytest.mark.asyncio
+async def test_redis_generation_is_shared_by_workers():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    workers = [SearchCache(redis_url="redis://cache") for _ in range(2)]
+    for worker in workers:
+        worker.backend.redis = fakeredis.FakeAsyncRedis(server=server)
+    reader, writer = workers
+
+    # the invalidation ran in another worker, it still stops this one caching a stale response
+    assert not await compute_across_invalidation(reader, writer)
+
+    key = search_key(PARAMS, skip=0)
+    await reader.set(key, PARAMS, {"books": []}, [BOOK], await reader.generation())
+    assert await writer.get(key) == {"books": []}
+    assert reader.errors == writer.errors == 0
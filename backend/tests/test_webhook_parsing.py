@@ -0,0 +1,27 @@
+import json
+
+import pytest
+
+pytest.importorskip("phonepe")
+
+from services.phonepe_service import parse_webhook
+
+
+def body(**payload):
+    return json.dumps({"event": "checkout.order.completed", "payload": {
+        "merchantOrderId": "order-1", "state": "COMPLETED", "amount": 25000, **payload
+    }}).encode()
+
+
+def test_latest_payment_details():
+    details = [{"transactionId": "t1", "paymentMode": "UPI"}, {"transactionId": "t2", "paymentMode": "CARD"}]
+    event = parse_webhook(body(paymentDetails=details))
+    assert event["transaction_id"] == "t2"
+    assert event["payment_method"] == "CARD"
+    assert event["amount"] == 250
+
+
+@pytest.mark.parametrize("details", [["t1"], [None], [{"transactionId": "t1"}, 7]])
+def test_malformed_payment_details_is_a_value_error(details):
+    with pytest.raises(ValueError):
+        parse_webhook(body(paymentDetails=details))
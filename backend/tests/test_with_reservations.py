@@ -0,0 +1,99 @@
+"""GET /api/books/my/books/with-reservations: one query for the whole page, whatever its size"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+from database import AsyncSessionLocal, engine
+from models import Book, Reservation, ReservationStatus
+from services.book_search import build_search_text
+
+URL = "/api/books/my/books/with-reservations"
+
+
+async def add_listings(owner_id, buyers, count):
+    """count listings of owner_id, each reserved by every buyer; returns {book id: expected latest buyer id}"""
+    now = datetime.now(timezone.utc)
+    latest = {}
+    async with AsyncSessionLocal() as db:
+        for i in range(count):
+            title = f"Listing {i}"
+            book = Book(title=title, author="Author", price=100 + i, owner_id=owner_id,
+                        search_text=build_search_text(title, "Author"))
+            db.add(book)
+            await db.flush()
+            # the newest reservation is added first, so it has the lowest id
+            for age, buyer_id in enumerate(reversed(buyers)):
+                db.add(Reservation(book_id=book.id, user_id=buyer_id, reservation_fee=10,
+                                   status=ReservationStatus.PENDING, expires_at=now + timedelta(days=1),
+                                   created_at=now - timedelta(hours=age)))
+            latest[book.id] = buyers[-1]
+        await db.commit()
+    return latest
+
+
+async def count_statements(client, headers):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    try:
+        response = await client.get(URL, headers=headers)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", record)
+    response.raise_for_status()
+    return len(statements), response.json()
+
+
+@pytest.mark.asyncio
+async def test_query_count_does_not_grow_with_listings(client, sign_up):
+    seller_id, seller = await sign_up("seller")
+    buyers = [(await sign_up("buyer"))[0] for _ in range(2)]
+    await add_listings(seller_id, buyers, 2)
+    # warm the principal cache, so both counts see the same authentication queries
+    await count_statements(client, seller)
+
+    few, books = await count_statements(client, seller)
+    assert len(books) == 2
+    await add_listings(seller_id, buyers, 8)
+    many, books = await count_statements(client, seller)
+    assert len(books) == 10
+    assert many == few
+
+
+@pytest.mark.asyncio
+async def test_returns_latest_reservation_and_buyer(client, sign_up):
+    seller_id, seller = await sign_up("seller")
+    buyer_ids = [(await sign_up("buyer"))[0] for _ in range(3)]
+    latest = await add_listings(seller_id, buyer_ids, 3)
+    async with AsyncSessionLocal() as db:
+        unreserved = Book(title="Not reserved", author="Author", price=50, owner_id=seller_id,
+                          search_text=build_search_text("Not reserved", "Author"))
+        db.add(unreserved)
+        await db.commit()
+
+    response = await client.get(URL, headers=seller)
+    response.raise_for_status()
+    books = {book["id"]: book for book in response.json()}
+    assert set(books) == set(latest) | {unreserved.id}
+    assert books[unreserved.id]["reservation"] is None
+    for book_id, buyer_id in latest.items():
+        reservation = books[book_id]["reservation"]
+        assert reservation["buyer_id"] == buyer_id
+        assert reservation["buyer_email"] == f"{reservation['buyer_name'].split()[0]}@example.com"
+        assert reservation["status"] == "pending"
+
+
+@pytest.mark.asyncio
+async def test_only_the_sellers_own_listings(client, sign_up):
+    seller_id, seller = await sign_up("seller")
+    other_id, _ = await sign_up("other")
+    buyer_id, _ = await sign_up("buyer")
+    mine = await add_listings(seller_id, [buyer_id], 1)
+    await add_listings(other_id, [buyer_id], 2)
+
+    response = await client.get(URL, headers=seller)
+    response.raise_for_status()
+    assert [book["id"] for book in response.json()] == list(mine)
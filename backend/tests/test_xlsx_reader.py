@@ -0,0 +1,105 @@
+import zipfile
+from datetime import date, datetime, time, timedelta
+
+import openpyxl
+import pytest
+from openpyxl.cell.rich_text import CellRichText, TextBlock
+from openpyxl.cell.text import InlineFont
+
+from services.xlsx_reader import read_rows
+
+
+def openpyxl_rows(path):
+    wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return list(wb.active.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def regular(ws):
+    ws.append(["title", "price", "in stock", "listed", "ratio", "note"])
+    ws.append(["Gitanjali", 150, True, datetime(2024, 3, 1, 10, 30), 0.25, None])
+    ws.append(["Godaan", 99.5, False, date(1999, 12, 31), 1e21, "=A2"])
+    ws["A6"] = "after a gap"
+    ws["H6"] = "wide"
+    ws["B7"] = time(8, 15)
+    ws["C7"] = timedelta(hours=30)
+    ws["C7"].number_format = "[h]:mm:ss"
+    ws["D7"] = CellRichText(["plain ", TextBlock(InlineFont(b=True), "bold")])
+    ws["E7"] = 45000
+    ws["E7"].number_format = "yyyy-mm-dd"
+
+
+def write_only(wb):
+    ws = wb.create_sheet()
+    ws.append(["title", "author", "price"])
+    ws.append(["Gitanjali", None, 150])
+    ws.append([])
+    ws.append(["Godaan", "Premchand", 120.75, True])
+
+
+def second_sheet_active(wb):
+    wb.active.append(["not", "this", "one"])
+    ws = wb.create_sheet("books")
+    ws.append(["title", "price"])
+    ws.append(["Gitanjali", 150])
+    wb.active = 1
+
+
+def date1904(wb):
+    wb.epoch = openpyxl.utils.datetime.CALENDAR_MAC_1904
+    wb.active.append(["listed", datetime(2020, 2, 29)])
+
+
+@pytest.mark.parametrize("build", [regular, write_only, second_sheet_active, date1904])
+def test_rows_match_openpyxl(tmp_path, build):
+    path = tmp_path / "book.xlsx"
+    if build is write_only:
+        wb = openpyxl.Workbook(write_only=True)
+        build(wb)
+    else:
+        wb = openpyxl.Workbook()
+        build(wb.active if build is regular else wb)
+    wb.save(path)
+    assert list(read_rows(path)) == openpyxl_rows(path)
+
+
+SHEET = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<dimension ref="{dimension}"/>
+<sheetData>
+<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="s"><v>1</v></c><c r="C1" t="inlineStr"><is><t>isbn</t></is></c></row>
+<row><c t="str"><f>UPPER("x")</f><v>X</v></c><c t="e"><v>#N/A</v></c><c t="b"><v>1</v></c></row>
+<row r="5"><c r="B5" t="d"><v>2024-03-01T10:30:00</v></c><c r="C5"><v>1.5E3</v></c><c r="D5"><v></v></c></row>
+<row r="7"><c r="A7" t="inlineStr"><is><t>past the dimension</t></is></c></row>
+</sheetData>
+</worksheet>"""
+
+SHARED_STRINGS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="2" uniqueCount="2">
+<si><t>title</t></si>
+<si><r><t>pri</t></r><r><rPr><b/></rPr><t>ce_x005F_x000D_</t></r><rPh sb="0" eb="1"><t>hint</t></rPh></si>
+</sst>"""
+
+
+@pytest.mark.parametrize("dimension", ["A1:C6", "A1:E9", "A1:B2"])
+def test_hand_written_sheet_matches_openpyxl(tmp_path, dimension):
+    path = tmp_path / "book.xlsx"
+    openpyxl.Workbook().save(path)
+    with zipfile.ZipFile(path) as source:
+        parts = {name: source.read(name) for name in source.namelist()}
+    parts["xl/worksheets/sheet1.xml"] = SHEET.format(dimension=dimension).encode()
+    parts["xl/sharedStrings.xml"] = SHARED_STRINGS.encode()
+    parts["[Content_Types].xml"] = parts["[Content_Types].xml"].replace(b"</Types>", (
+        b'<Override PartName="/xl/sharedStrings.xml" '
+        b'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>'
+    ))
+    parts["xl/_rels/workbook.xml.rels"] = parts["xl/_rels/workbook.xml.rels"].replace(b"</Relationships>", (
+        b'<Relationship Id="rIdStrings" Target="sharedStrings.xml" '
+        b'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"/></Relationships>'
+    ))
+    with zipfile.ZipFile(path, "w") as target:
+        for name, data in parts.items():
+            target.writestr(name, data)
+    assert list(read_rows(path)) == openpyxl_rows(path)
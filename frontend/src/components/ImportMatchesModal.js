@@ -1,8 +1,35 @@
-import React from 'react';
+import React, { useState, useEffect } from 'react';
+
+const ACTIONS = [
+  { action: 'create', label: 'Create new', active: 'bg-blue-600 text-white' },
+  { action: 'merge', label: 'Merge stock', active: 'bg-green-600 text-white' },
+  { action: 'skip', label: 'Skip', active: 'bg-gray-600 text-white' },
+];
+
+const ImportMatchesModal = ({ isOpen, onClose, matches = [], onApply, applying = false }) => {
+  // decision per row number, sent together by Apply
+  const [decisions, setDecisions] = useState({});
+
+  useEffect(() => {
+    setDecisions({});
+  }, [matches]);
 
-const ImportMatchesModal = ({ isOpen, onClose, matches = [], onMerge, onCreate }) => {
   if (!isOpen) return null;
 
+  const decisionFor = (m) => decisions[m.row] || 'merge';
+  const setAll = (action) => setDecisions(Object.fromEntries((matches || []).map(m => [m.row, action])));
+
+  const apply = () => {
+    const resolutions = (matches || []).map(m => ({
+      row: m.row,
+      action: decisionFor(m),
+      book_id: m.suggested?.id ?? null,
+      title: m.title,
+      row_data: m.row_data || {}
+    }));
+    onApply(resolutions);
+  };
+
   return (
     <div className="fixed inset-0 z-50 flex items-center justify-center">
       <div className="absolute inset-0 bg-black opacity-40" onClick={onClose} />
@@ -12,6 +39,17 @@ const ImportMatchesModal = ({ isOpen, onClose, matches = [], onMerge, onCreate }
           <button onClick={onClose} className="text-gray-500 hover:text-gray-800">Close</button>
         </div>
 
+        {matches && matches.length > 0 && (
+          <div className="mt-3 flex gap-2 text-xs">
+            <span className="text-gray-600 self-center">Set all to:</span>
+            {ACTIONS.map(a => (
+              <button key={a.action} onClick={() => setAll(a.action)} className="px-2 py-1 bg-gray-100 rounded hover:bg-gray-200">
+                {a.label}
+              </button>
+            ))}
+          </div>
+        )}
+
         <div className="mt-4 max-h-72 overflow-y-auto text-sm text-gray-800">
           {(!matches || matches.length === 0) ? (
             <div className="text-gray-600">No suggested matches. All rows were imported.</div>
@@ -30,8 +68,15 @@ const ImportMatchesModal = ({ isOpen, onClose, matches = [], onMerge, onCreate }
                         <div className="text-xs text-gray-600 mt-1">Row data: price: {rd.price}, stock: {rd.stock}, for_sale: {String(rd.is_for_sale)}</div>
                       </div>
                       <div className="flex flex-col gap-2">
-                        <button onClick={() => onCreate(m)} className="px-3 py-1 bg-blue-600 text-white rounded">Create new</button>
-                        <button onClick={() => onMerge(m)} className="px-3 py-1 bg-green-600 text-white rounded">Merge stock</button>
+                        {ACTIONS.map(a => (
+                          <button
+                            key={a.action}
+                            onClick={() => setDecisions(prev => ({ ...prev, [r]: a.action }))}
+                            className={`px-3 py-1 rounded ${decisionFor(m) === a.action ? a.active : 'bg-gray-200 text-gray-800'}`}
+                          >
+                            {a.label}
+                          </button>
+                        ))}
                       </div>
                     </div>
                   </li>
@@ -43,6 +88,11 @@ const ImportMatchesModal = ({ isOpen, onClose, matches = [], onMerge, onCreate }
 
         <div className="mt-4 flex justify-end gap-2">
           <button onClick={onClose} className="px-3 py-1 bg-gray-100 rounded hover:bg-gray-200">Close</button>
+          {matches && matches.length > 0 && (
+            <button onClick={apply} disabled={applying} className="px-3 py-1 bg-blue-600 text-white rounded hover:bg-blue-700">
+              {applying ? 'applying...' : `Apply ${matches.length} decisions`}
+            </button>
+          )}
         </div>
       </div>
     </div>
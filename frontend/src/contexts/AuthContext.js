@@ -33,6 +33,7 @@ export const AuthProvider = ({ children }) => {
       }
     } catch (error) {
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
     } finally {
       setLoading(false);
     }
@@ -50,8 +51,9 @@ export const AuthProvider = ({ children }) => {
       }
     });
     
-    const { access_token } = response.data;
+    const { access_token, refresh_token } = response.data;
     localStorage.setItem('token', access_token);
+    localStorage.setItem('refreshToken', refresh_token);
     
     const userResponse = await api.get('/auth/me');
     setUser(userResponse.data);
@@ -65,7 +67,13 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const refresh_token = localStorage.getItem('refreshToken');
+    if (refresh_token) {
+      // revoke the login server-side; signing out locally does not wait for it
+      api.post('/auth/logout', { refresh_token }, { _noRefresh: true }).catch(() => {});
+    }
     localStorage.removeItem('token');
+    localStorage.removeItem('refreshToken');
     setUser(null);
   };
 
@@ -20,6 +20,7 @@ const BookSearch = () => {
   });
   const [sortOrder, setSortOrder] = useState('latest'); // 'latest', 'availability', 'availability-reverse'
   const [loading, setLoading] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
 
   const searchBooks = useCallback(async () => {
     setLoading(true);
@@ -57,6 +58,20 @@ const BookSearch = () => {
     searchBooks();
   }, [searchBooks]);
 
+  // typeahead: popular titles, authors and tags starting with what was typed
+  useEffect(() => {
+    const prefix = filters.q.trim();
+    if (prefix.length < 2) {
+      setSuggestions([]);
+      return;
+    }
+    let cancelled = false;
+    api.get('/books/suggest', { params: { prefix, limit: 8 } })
+      .then(response => { if (!cancelled) setSuggestions(response.data); })
+      .catch(() => { if (!cancelled) setSuggestions([]); });
+    return () => { cancelled = true; };
+  }, [filters.q]);
+
   // derive the actually displayed books after client-side filters
   let displayedBooks = books
     .filter(book => book.status !== 'reserved')
@@ -122,8 +137,15 @@ const BookSearch = () => {
               placeholder="Search title, author, tags..."
               value={filters.q}
               onChange={handleFilterChange}
+              list="book-suggestions"
+              autoComplete="off"
               className="px-2 py-1.5 text-sm border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-blue-500"
             />
+            <datalist id="book-suggestions">
+              {suggestions.map(s => (
+                <option key={`${s.kind}:${s.text}`} value={s.text}>{s.kind}</option>
+              ))}
+            </datalist>
             <input
               type="text"
               name="city"
@@ -15,6 +15,7 @@ const MyStock = () => {
     const [importErrors, setImportErrors] = useState([]);
     const [showImportMatches, setShowImportMatches] = useState(false);
     const [importMatches, setImportMatches] = useState([]);
+    const [applyingMatches, setApplyingMatches] = useState(false);
     const fileInputRef = React.useRef(null);
 
     useEffect(() => {
@@ -131,41 +132,27 @@ const MyStock = () => {
                 isOpen={showImportMatches}
                 onClose={() => { setShowImportMatches(false); setImportMatches([]); fetchMyBooks(); }}
                 matches={importMatches}
-                onMerge={async (m) => {
-                    // merge stock: call PUT /books/{id} with new stock
+                applying={applyingMatches}
+                onApply={async (resolutions) => {
+                    // all decisions in one request and one transaction
+                    setApplyingMatches(true);
                     try {
-                        const existing = m.suggested;
-                        const add = parseInt(m.row_data?.stock || 1) || 1;
-                        const newStock = (existing.stock || 0) + add;
-                        await api.put(`/books/${existing.id}`, { stock: newStock });
-                        // remove this match from list
-                        setImportMatches(prev => prev.filter(x => x.row !== m.row));
+                        const res = await api.post('/books/import-matches/apply', { resolutions });
+                        const failed = (res.data?.results ?? []).filter(r => r.status === 'error');
+                        setShowImportMatches(false);
+                        setImportMatches([]);
+                        if (failed.length > 0) {
+                            setImportErrors(failed);
+                            setShowImportErrors(true);
+                        } else {
+                            alert(`Merged ${res.data.merged}, created ${res.data.created}, skipped ${res.data.skipped}.`);
+                        }
+                        fetchMyBooks();
                     } catch (err) {
-                        console.error('merge failed', err);
-                        alert('Failed to merge stock: ' + (err?.response?.data?.detail || err.message));
-                    }
-                }}
-                onCreate={async (m) => {
-                    try {
-                        const rd = m.row_data || {};
-                        const payload = {
-                            title: m.title,
-                            author: rd.author || null,
-                            price: rd.price,
-                            stock: rd.stock || 1,
-                            is_for_sale: rd.is_for_sale ?? true,
-                            is_for_rent: rd.is_for_rent ?? false,
-                            weekly_fee: rd.weekly_fee ?? null,
-                            condition: rd.condition ?? null,
-                            tags: rd.tags ?? null,
-                            description: rd.description ?? null,
-                            isbn: rd.isbn ?? null
-                        };
-                        await api.post('/books/', payload);
-                        setImportMatches(prev => prev.filter(x => x.row !== m.row));
-                    } catch (err) {
-                        console.error('create failed', err);
-                        alert('Failed to create book: ' + (err?.response?.data?.detail || err.message));
+                        console.error('apply failed', err);
+                        alert('Failed to apply decisions: ' + (err?.response?.data?.detail || err.message));
+                    } finally {
+                        setApplyingMatches(false);
                     }
                 }}
             />
@@ -25,12 +25,46 @@ api.interceptors.request.use(
   }
 );
 
+// one refresh at a time: a refresh token is rotated on use, so concurrent requests
+// failing with 401 wait for the same refresh instead of each presenting the old token
+let refreshing = null;
+
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refresh_token = localStorage.getItem('refreshToken');
+    refreshing = (refresh_token
+      ? api.post('/auth/refresh', { refresh_token }, { _noRefresh: true }).then((response) => {
+          localStorage.setItem('token', response.data.access_token);
+          localStorage.setItem('refreshToken', response.data.refresh_token);
+          return response.data.access_token;
+        })
+      : Promise.reject(new Error('no refresh token'))
+    ).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+};
+
 // response interceptor to handle auth errors
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
+  async (error) => {
+    const config = error.config || {};
     if (error.response?.status === 401) {
+      // an expired access token is renewed once and the request retried
+      if (!config._noRefresh && !config._retried && localStorage.getItem('refreshToken')) {
+        try {
+          const token = await refreshAccessToken();
+          config._retried = true;
+          config.headers.Authorization = `Bearer ${token}`;
+          return api(config);
+        } catch (refreshError) {
+          // fall through to signing out
+        }
+      }
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       window.location.href = '/login';
     }
     return Promise.reject(error);